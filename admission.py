@@ -0,0 +1,163 @@
+"""Admission control for the API.
+
+Each request is admitted by the limiter for its route's budget before it reaches a
+handler (and so before it takes a threadpool thread or a database connection). A limiter
+runs at most max_concurrent requests at once, and up to max_queue more wait (for at most
+queue_timeout_s) for a free slot. Requests beyond that are rejected straight away, so
+the API returns fast 503 responses under overload instead of letting every request's
+latency grow until they all time out.
+
+The database (or CPU) heavy analytics routes have their own, smaller budget, so they can't take
+all of the database connections from the other routes.
+"""
+
+import asyncio
+from collections import deque
+import os
+import re
+
+DEFAULT_BUDGET = "default"
+ANALYTICS_BUDGET = "analytics"
+# paths of the analytics routes, which use the analytics budget
+ANALYTICS_PATHS = re.compile(
+    r"^/users/[^/]+/(activities/export|training-load|records|trendlines|calendar"
+    r"|activity-frequency|summary)$"
+    r"|^/activities/[^/]+/splits$"
+)
+# paths which are never limited (e.g. so the metrics can be read during overload)
+UNLIMITED_PATHS = re.compile(r"^/metrics/")
+
+
+class AdmissionLimiter:
+    """Limits the number of requests running at once, with a bounded wait queue.
+
+    This is only used from the event loop (in the API middleware), so its counters
+    don't need a lock. Slots are handed to waiting requests in arrival order.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int,
+        max_queue: int,
+        queue_timeout_s: float,
+        retry_after_s: int = 1,
+    ):
+        """
+        :param name: name of the limiter's budget
+        :param max_concurrent: most requests running at once
+        :param max_queue: most requests waiting for a slot
+        :param queue_timeout_s: longest time a request waits for a slot
+        :param retry_after_s: seconds a rejected client is told to wait before retrying
+        """
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self.retry_after_s = retry_after_s
+        self.in_flight = 0
+        self.waiters = deque()
+        self.admitted = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        """waits for a slot for a request, returning True if it was admitted or False
+        if it was rejected (the queue was full, or no slot was free in time)"""
+        if self.in_flight < self.max_concurrent and not self.waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        if len(self.waiters) >= self.max_queue:
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            self.remove_waiter(waiter)
+            self.rejected += 1
+            return False
+        except asyncio.CancelledError:
+            # the client went away, so give back the slot if it was handed over
+            self.remove_waiter(waiter)
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        self.admitted += 1
+        return True
+
+    def remove_waiter(self, waiter: asyncio.Future):
+        """removes a waiter that has stopped waiting from the queue"""
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self):
+        """frees a request's slot, handing it to the next waiting request if there is
+        one"""
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def metrics(self):
+        """returns a dictionary of the limiter's settings and current counts"""
+        return {
+            "budget": self.name,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self.waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+def create_admission_limiters():
+    """creates the limiters for each budget, with settings from environment variables:
+
+        ADMISSION_MAX_CONCURRENT (default 12) and ADMISSION_MAX_QUEUE (default 50) for
+        most routes
+        ADMISSION_ANALYTICS_MAX_CONCURRENT (default 3) and ADMISSION_ANALYTICS_MAX_QUEUE
+        (default 10) for the analytics routes
+        ADMISSION_QUEUE_TIMEOUT_S (default 2) for the longest wait for a slot
+        ADMISSION_RETRY_AFTER_S (default 1) for the Retry-After header of rejections
+
+    The default concurrency of both budgets adds up to the default size of the
+    database connection pool (5 connections plus 10 overflow).
+
+    :returns: a dictionary of budget name to AdmissionLimiter
+    """
+    queue_timeout_s = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "2"))
+    retry_after_s = int(os.getenv("ADMISSION_RETRY_AFTER_S", "1"))
+    return {
+        DEFAULT_BUDGET: AdmissionLimiter(
+            DEFAULT_BUDGET,
+            max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "12")),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "50")),
+            queue_timeout_s=queue_timeout_s,
+            retry_after_s=retry_after_s,
+        ),
+        ANALYTICS_BUDGET: AdmissionLimiter(
+            ANALYTICS_BUDGET,
+            max_concurrent=int(os.getenv("ADMISSION_ANALYTICS_MAX_CONCURRENT", "3")),
+            max_queue=int(os.getenv("ADMISSION_ANALYTICS_MAX_QUEUE", "10")),
+            queue_timeout_s=queue_timeout_s,
+            retry_after_s=retry_after_s,
+        ),
+    }
+
+
+def route_budget(path: str):
+    """returns the name of the budget for a request path, or None if the path isn't
+    limited"""
+    if UNLIMITED_PATHS.match(path):
+        return None
+    if ANALYTICS_PATHS.match(path):
+        return ANALYTICS_BUDGET
+    return DEFAULT_BUDGET
@@ -0,0 +1,110 @@
+from datetime import date
+
+import numpy as np
+from sqlalchemy import func, select
+
+from database.models import Activity
+from database.sql import DatePart
+
+CALENDAR_METRICS = ["count", "distance_km"]
+DAYS_OF_WEEK = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def calendar_days_query(user_id: int, year: int, activity: str | None = None):
+    """returns a query for the number of activities and total distance on each day of
+    a year that a user has activities, aggregated by the database (so at most 366
+    rows, however many activities there are).
+
+    :param activity: only count activities of this kind (e.g. "run"), or all if None
+    :returns: a select statement for rows with columns date ("YYYY/MM/DD"), count and
+    distance_km, ordered by date
+    """
+    day = DatePart(Activity.date, "date")
+    # dates without zero padding (e.g. "2025/2/4") also sort inside the year
+    statement = select(
+        day.label("date"),
+        func.count().label("count"),
+        func.sum(Activity.distance_km).label("distance_km"),
+    ).where(
+        Activity.user_id == user_id,
+        Activity.date >= f"{year:04}/01/01",
+        Activity.date < f"{year + 1:04}/01/01",
+    )
+    if activity is not None:
+        statement = statement.where(Activity.activity == activity)
+    return statement.group_by(day).order_by(day)
+
+
+def activity_frequency_query(
+    user_id: int,
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+    activity: str | None = None,
+):
+    """returns a query for the number of activities and total distance started in each
+    hour of each day of the week, between two dates (in the format "YYYY/MM/DD"),
+    aggregated by the database (so at most 7 x 24 = 168 rows).
+
+    :param activity: only count activities of this kind (e.g. "run"), or all if None
+    :returns: a select statement for rows with columns day_of_week (0 for Monday to 6
+    for Sunday), hour (0 to 23), count and distance_km, for the hours with activities
+    """
+    day_of_week = DatePart(Activity.date, "day_of_week")
+    hour = DatePart(Activity.time, "hour")
+    statement = select(
+        day_of_week.label("day_of_week"),
+        hour.label("hour"),
+        func.count().label("count"),
+        func.sum(Activity.distance_km).label("distance_km"),
+    ).where(
+        Activity.user_id == user_id,
+        Activity.date > start_date,
+        Activity.date < end_date,
+    )
+    if activity is not None:
+        statement = statement.where(Activity.activity == activity)
+    return statement.group_by(day_of_week, hour).order_by(day_of_week, hour)
+
+
+def calendar_position(day: date):
+    """returns the (row, column) of a day in a calendar grid of its year, with a row
+    for each day of the week (from Monday) and a column for each week (from the week
+    of January 1st)"""
+    offset = date(day.year, 1, 1).weekday()
+    day_index = day.timetuple().tm_yday - 1 + offset
+    return day_index % 7, day_index // 7
+
+
+def calendar_grid(days: list, year: int, metric: str = "count"):
+    """creates the calendar heatmap grid of a year from its days with activities.
+
+    :param days: a list of dictionaries with keys date ("YYYY/MM/DD") and metric (the
+    rows of calendar_days_query)
+    :param metric: one of CALENDAR_METRICS
+    :returns: a 7 x 54 numpy array (see calendar_position) of the metric on each day,
+    0 on days without activities and NaN for cells outside the year
+    """
+    grid = np.full((7, 54), np.nan)
+    first_day = date(year, 1, 1)
+    n_days = (date(year + 1, 1, 1) - first_day).days
+    day_indexes = np.arange(n_days) + first_day.weekday()
+    grid[day_indexes % 7, day_indexes // 7] = 0
+    for day in days:
+        row, column = calendar_position(date(*map(int, day["date"].split("/"))))
+        grid[row, column] = day[metric]
+    return grid
+
+
+def frequency_grid(cells: list, metric: str = "count"):
+    """creates the day of week by hour of day grid from its cells with activities.
+
+    :param cells: a list of dictionaries with keys day_of_week, hour and metric (the
+    rows of activity_frequency_query)
+    :param metric: one of CALENDAR_METRICS
+    :returns: a 7 x 24 numpy array of the metric, with a row for each day of the week
+    (from Monday) and a column for each hour, 0 where there are no activities
+    """
+    grid = np.zeros((7, 24))
+    for cell in cells:
+        grid[cell["day_of_week"], cell["hour"]] = cell[metric]
+    return grid
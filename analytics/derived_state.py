@@ -0,0 +1,333 @@
+"""Keeps the per-user derived analytics tables in step with activity writes.
+
+The activity endpoints in routes.py call these functions before committing, so the
+derived state is written in the same transaction as the activity itself. Each write
+also bumps the data_version of the users whose activities changed, which clients use
+(through the summary's ETag, or an ActivityListener) to tell whether anything has
+changed since they last read, and notifies listeners on Postgres."""
+
+import pandas as pd
+from sqlalchemy import delete, update
+from sqlmodel import Session, select
+
+from analytics.records import (
+    DISTANCE_BUCKETS_KM,
+    find_best_records,
+    is_better_record,
+)
+from analytics.training_load import (
+    append_to_training_load_state,
+    build_training_load_state,
+)
+from analytics.trendlines import add_trendline_point, trendline_points
+from database.models import (
+    Activity,
+    PersonalRecord,
+    TrainingLoad,
+    TrendlineStats,
+    User,
+)
+from database.notifications import notify_activities_changed
+from database.sql import in_ids
+
+
+def training_load_to_state(training_load: TrainingLoad):
+    """converts a stored TrainingLoad row into a training load state dictionary"""
+    return {
+        "last_date": training_load.last_date,
+        "fitness": training_load.fitness,
+        "fatigue": training_load.fatigue,
+        "recent_distances": [
+            float(km) for km in training_load.recent_distances.split(",")
+        ],
+    }
+
+
+def save_training_load_state(session: Session, user_id: int, state: dict | None):
+    """writes a training load state dictionary to the training_load_table, deleting
+    the user's row if the state is None (i.e. the user has no activities)"""
+    training_load = session.get(TrainingLoad, user_id, with_for_update=True)
+    if state is None:
+        if training_load:
+            session.delete(training_load)
+        return
+    values = {
+        "last_date": state["last_date"],
+        "fitness": state["fitness"],
+        "fatigue": state["fatigue"],
+        "recent_distances": ",".join(
+            str(round(km, 3)) for km in state["recent_distances"]
+        ),
+    }
+    if training_load:
+        training_load.sqlmodel_update(values)
+    else:
+        training_load = TrainingLoad(user_id=user_id, **values)
+    session.add(training_load)
+
+
+def rebuild_training_load(session: Session, user_id: int):
+    """rebuilds a user's training load state from all of their activities"""
+    rows = session.exec(
+        select(Activity.date, Activity.distance_km).where(Activity.user_id == user_id)
+    ).all()
+    df = pd.DataFrame(rows, columns=["date", "distance_km"])
+    df["date"] = pd.to_datetime(df["date"], format="%Y/%m/%d", errors="coerce")
+    try:
+        state = build_training_load_state(df)
+    except KeyError:
+        state = None
+    save_training_load_state(session, user_id, state)
+
+
+def update_training_load(session: Session, activity: Activity):
+    """adds a new activity to its user's training load state. Activities dated on or
+    after the latest stored day are applied incrementally, older (backfilled) activities
+    trigger a rebuild. The user's row is locked until the transaction commits, so
+    concurrent writes for the user apply in turn rather than overwriting each other."""
+    training_load = session.get(TrainingLoad, activity.user_id, with_for_update=True)
+    state = training_load_to_state(training_load) if training_load else None
+    new_state = append_to_training_load_state(
+        state, activity.date, activity.distance_km
+    )
+    if new_state is None:
+        rebuild_training_load(session, activity.user_id)
+    else:
+        save_training_load_state(session, activity.user_id, new_state)
+
+
+def set_personal_record(
+    session: Session,
+    personal_record: PersonalRecord | None,
+    record: str,
+    value: float,
+    activity: Activity,
+):
+    """points a personal record at a new best activity, creating the record row if the
+    user doesn't have one yet"""
+    values = {"value": value, "activity_id": activity.id, "date": activity.date}
+    if personal_record:
+        personal_record.sqlmodel_update(values)
+    else:
+        personal_record = PersonalRecord(
+            user_id=activity.user_id,
+            activity=activity.activity,
+            record=record,
+            **values,
+        )
+    session.add(personal_record)
+
+
+def update_personal_records(session: Session, activity: Activity):
+    """checks a new or modified activity against its user's current records, replacing
+    any records that it beats"""
+    current_records = session.exec(
+        select(PersonalRecord).where(
+            PersonalRecord.user_id == activity.user_id,
+            PersonalRecord.activity == activity.activity,
+        )
+    ).all()
+    current = {
+        personal_record.record: personal_record for personal_record in current_records
+    }
+    for record, (value, _) in find_best_records([activity]).items():
+        personal_record = current.get(record)
+        if personal_record and not is_better_record(
+            record, value, personal_record.value
+        ):
+            continue
+        set_personal_record(session, personal_record, record, value, activity)
+
+
+def recompute_personal_record(session: Session, personal_record: PersonalRecord):
+    """recomputes a single personal record from the activities eligible for it,
+    deleting the record if no activities are eligible any more"""
+    stmt = select(Activity).where(
+        Activity.user_id == personal_record.user_id,
+        Activity.activity == personal_record.activity,
+    )
+    if personal_record.record in DISTANCE_BUCKETS_KM:
+        stmt = stmt.where(
+            Activity.distance_km >= DISTANCE_BUCKETS_KM[personal_record.record]
+        )
+    elif personal_record.record == "most_elevation":
+        stmt = stmt.where(Activity.elevation_m.is_not(None))
+    best = find_best_records(session.exec(stmt).all(), [personal_record.record])
+    if personal_record.record not in best:
+        session.delete(personal_record)
+        return
+    value, activity = best[personal_record.record]
+    set_personal_record(
+        session, personal_record, personal_record.record, value, activity
+    )
+
+
+def recompute_records_held_by(session: Session, activity_id: int):
+    """recomputes the records currently held by an activity that has been modified or
+    deleted. Records held by other activities are unaffected."""
+    held_records = session.exec(
+        select(PersonalRecord).where(PersonalRecord.activity_id == activity_id)
+    ).all()
+    for personal_record in held_records:
+        recompute_personal_record(session, personal_record)
+
+
+def rebuild_personal_records(session: Session, user_id: int):
+    """rebuilds all of a user's personal records from their activities"""
+    for personal_record in session.exec(
+        select(PersonalRecord).where(PersonalRecord.user_id == user_id)
+    ).all():
+        session.delete(personal_record)
+    # deletes must reach the database before the replacement rows are inserted
+    session.flush()
+    activities = session.exec(select(Activity).where(Activity.user_id == user_id)).all()
+    for activity_name in {activity.activity for activity in activities}:
+        matching = [
+            activity for activity in activities if activity.activity == activity_name
+        ]
+        for record, (value, activity) in find_best_records(matching).items():
+            set_personal_record(session, None, record, value, activity)
+
+
+def update_trendline_stats(session: Session, activity: dict, weight: int = 1):
+    """adds an activity's points to its user's trendline statistics, or removes them
+    when weight is -1. Each statistics row is locked until the transaction commits, so
+    concurrent writes for the user apply in turn rather than overwriting each other.
+
+    :param activity: dictionary of activity values (e.g. from Activity.model_dump())
+    """
+    for metric, (x, y) in trendline_points(activity).items():
+        trendline_stats = session.get(
+            TrendlineStats, (activity["user_id"], metric), with_for_update=True
+        )
+        if not trendline_stats:
+            trendline_stats = TrendlineStats(user_id=activity["user_id"], metric=metric)
+        stats = trendline_stats.model_dump(exclude={"user_id", "metric"})
+        add_trendline_point(stats, x, y, weight)
+        if stats["n"] == 0:
+            # the last point was removed, so the row goes rather than staying empty
+            if trendline_stats in session:
+                session.delete(trendline_stats)
+            continue
+        trendline_stats.sqlmodel_update(stats)
+        session.add(trendline_stats)
+
+
+def rebuild_trendline_stats(session: Session, user_id: int):
+    """rebuilds a user's trendline statistics from all of their activities"""
+    for trendline_stats in session.exec(
+        select(TrendlineStats).where(TrendlineStats.user_id == user_id)
+    ).all():
+        session.delete(trendline_stats)
+    session.flush()
+    for activity in session.exec(select(Activity).where(Activity.user_id == user_id)):
+        update_trendline_stats(session, activity.model_dump())
+
+
+def delete_user_state(session: Session, user_id: int):
+    """deletes all derived state for a user, so the user can be deleted (the derived
+    tables have foreign keys to the user_table)"""
+    for table in (TrainingLoad, PersonalRecord, TrendlineStats):
+        session.execute(delete(table).where(table.user_id == user_id))
+
+
+def bump_data_versions(session: Session, user_ids: set):
+    """increments the data_version of the given users, in one UPDATE statement, and
+    notifies listeners that their activities have changed"""
+    dialect_name = session.get_bind().dialect.name
+    users = User.__table__.c
+    session.execute(
+        update(User.__table__)
+        .where(in_ids(users.user_id, sorted(user_ids), dialect_name))
+        .values(data_version=users.data_version + 1)
+    )
+    notify_activities_changed(session, user_ids)
+
+
+def rebuild_user_state(session: Session, user_id: int):
+    """rebuilds all derived state for a user from their activities"""
+    rebuild_training_load(session, user_id)
+    rebuild_personal_records(session, user_id)
+    rebuild_trendline_stats(session, user_id)
+
+
+def on_activity_created(session: Session, activity: Activity):
+    """updates derived state after a new activity has been added to the session"""
+    update_training_load(session, activity)
+    update_personal_records(session, activity)
+    update_trendline_stats(session, activity.model_dump())
+    bump_data_versions(session, {activity.user_id})
+
+
+def on_activities_created(session: Session, activities: list):
+    """updates derived state after a batch of activities has been inserted, rebuilding
+    it once per affected user rather than updating it once per activity.
+
+    :param activities: the inserted activities' values (dictionaries with a user_id)
+    """
+    rebuild_users_state(session, {values["user_id"] for values in activities})
+
+
+def rebuild_users_state(session: Session, user_ids: set):
+    """rebuilds all derived state for the given users and bumps their data_version"""
+    for user_id in user_ids:
+        rebuild_user_state(session, user_id)
+    bump_data_versions(session, user_ids)
+
+
+def on_activity_updated(session: Session, previous: dict, activity: Activity):
+    """updates derived state after an activity has been modified.
+
+    :param previous: the activity's values before the update (from model_dump)
+    :param activity: the updated activity
+    """
+    rebuild_training_load(session, activity.user_id)
+    if previous["user_id"] != activity.user_id:
+        rebuild_training_load(session, previous["user_id"])
+    recompute_records_held_by(session, activity.id)
+    update_personal_records(session, activity)
+    update_trendline_stats(session, previous, weight=-1)
+    update_trendline_stats(session, activity.model_dump())
+    bump_data_versions(session, {previous["user_id"], activity.user_id})
+
+
+def on_activity_deleted(session: Session, activity: Activity):
+    """updates derived state after an activity has been deleted in the session"""
+    rebuild_training_load(session, activity.user_id)
+    recompute_records_held_by(session, activity.id)
+    update_trendline_stats(session, activity.model_dump(), weight=-1)
+    bump_data_versions(session, {activity.user_id})
+
+
+def on_activities_updated(session: Session, previous: list, activities: list):
+    """updates derived state after a batch of activities has been modified, rebuilding
+    the training load once per affected user.
+
+    :param previous: the activities' values before the update (from model_dump)
+    :param activities: the updated activities, in the same order as previous
+    """
+    user_ids = {values["user_id"] for values in previous}
+    user_ids |= {activity.user_id for activity in activities}
+    for user_id in user_ids:
+        rebuild_training_load(session, user_id)
+    for values, activity in zip(previous, activities):
+        recompute_records_held_by(session, activity.id)
+        update_personal_records(session, activity)
+        update_trendline_stats(session, values, weight=-1)
+        update_trendline_stats(session, activity.model_dump())
+    bump_data_versions(session, user_ids)
+
+
+def on_activities_deleted(session: Session, activities: list):
+    """updates derived state after a batch of activities has been deleted, rebuilding
+    the training load once per affected user.
+
+    :param activities: the deleted activities' values (from model_dump)
+    """
+    user_ids = {values["user_id"] for values in activities}
+    for user_id in user_ids:
+        rebuild_training_load(session, user_id)
+    for values in activities:
+        recompute_records_held_by(session, values["id"])
+        update_trendline_stats(session, values, weight=-1)
+    bump_data_versions(session, user_ids)
@@ -0,0 +1,71 @@
+from visualisation.plots_utils import calculate_time_secs
+
+# standard race distances, with the record being the fastest time over the distance
+DISTANCE_BUCKETS_KM = {
+    "fastest_1k": 1.0,
+    "fastest_5k": 5.0,
+    "fastest_10k": 10.0,
+    "fastest_half_marathon": 21.0975,
+    "fastest_marathon": 42.195,
+}
+OTHER_RECORDS = ["longest_distance", "most_elevation", "best_pace"]
+RECORD_NAMES = list(DISTANCE_BUCKETS_KM) + OTHER_RECORDS
+
+# records where a smaller value is better (times and paces)
+LOWER_IS_BETTER = set(DISTANCE_BUCKETS_KM) | {"best_pace"}
+
+
+def calculate_record_value(
+    record: str, distance_km: float, moving_time: str, elevation_m: int | None
+):
+    """calculates the value an activity would have for the given record, returning
+    None if the activity is not eligible for the record.
+
+    Distance bucket records (e.g. "fastest_5k") are eligible for activities at least as
+    long as the bucket distance, with the value being the time in seconds to cover the
+    bucket distance at the activity's average pace. best_pace is in seconds per km,
+    longest_distance in km and most_elevation in m.
+    """
+    if record == "longest_distance":
+        return distance_km
+    if record == "most_elevation":
+        return elevation_m
+    if distance_km <= 0:
+        return None
+    pace_secs_per_km = calculate_time_secs(moving_time) / distance_km
+    if record == "best_pace":
+        return round(pace_secs_per_km, 2)
+    bucket_km = DISTANCE_BUCKETS_KM[record]
+    if distance_km < bucket_km:
+        return None
+    return round(pace_secs_per_km * bucket_km, 2)
+
+
+def is_better_record(record: str, value: float, current: float | None):
+    """checks whether a value beats the current value of a record. Ties keep the
+    current record."""
+    if current is None:
+        return True
+    return value < current if record in LOWER_IS_BETTER else value > current
+
+
+def find_best_records(activities: list, records: list = RECORD_NAMES):
+    """finds the best activity for each record from a list of activities.
+
+    :param activities: list of Activity objects (or objects with the same attributes)
+    :param records: names of the records to find
+    :returns: a dictionary of record name to a tuple (value, activity) for each record
+    that at least one activity is eligible for
+    """
+    best = {}
+    for activity in activities:
+        for record in records:
+            value = calculate_record_value(
+                record, activity.distance_km, activity.moving_time, activity.elevation_m
+            )
+            if value is None:
+                continue
+            current = best.get(record, (None, None))[0]
+            if is_better_record(record, value, current):
+                best[record] = (value, activity)
+    return best
@@ -0,0 +1,168 @@
+import numpy as np
+
+from analytics.records import DISTANCE_BUCKETS_KM
+from analytics.track_metrics import haversine_distances, moving_segments
+
+SPLIT_DISTANCE_M = 1000
+
+
+def cumulative_distance_and_time(stream: dict):
+    """calculates the cumulative moving distance and moving time at each point of an
+    activity stream (the output of load_activity_stream), counting only the moving
+    segments (see moving_segments).
+
+    :returns: a tuple of numpy arrays (distance in metres, moving time in seconds),
+    both starting at 0 and never decreasing
+    """
+    distances = haversine_distances(stream["lat"], stream["lon"])
+    moving = moving_segments(distances, stream["time"])
+    durations = np.diff(stream["time"].astype(float))
+    distance_m = np.concatenate(([0.0], np.cumsum(np.where(moving, distances, 0))))
+    time_s = np.concatenate(([0.0], np.cumsum(np.where(moving, durations, 0))))
+    return distance_m, time_s
+
+
+def calculate_laps(
+    distance_m,
+    time_s,
+    lap_distance_m: float | None = None,
+    lap_time_s: float | None = None,
+    elevation_m=None,
+):
+    """splits an activity into laps of a fixed distance or a fixed moving time (e.g.
+    per km splits, or auto-laps every 5 minutes). The last lap is the remainder, if
+    any. The time (or distance) at each lap boundary is interpolated between points.
+
+    :param distance_m: cumulative distance at each point (from
+    cumulative_distance_and_time)
+    :param time_s: cumulative moving time at each point
+    :param lap_distance_m: distance of each lap, or None to split by lap_time_s
+    :param lap_time_s: moving time of each lap
+    :param elevation_m: elevation at each point, or None
+    :returns: a list of dictionaries, one per lap, with keys lap (from 1),
+    distance_km, moving_time_s, pace_s_per_km (None for laps with no distance) and
+    elevation_change_m (None without elevations)
+    """
+    if (lap_distance_m is None) == (lap_time_s is None):
+        raise ValueError("Give one of lap_distance_m or lap_time_s")
+    if len(distance_m) < 2:
+        return []
+    if lap_distance_m is not None:
+        bounds = np.arange(0, distance_m[-1], lap_distance_m)
+        bound_distances = np.append(bounds, distance_m[-1])
+        bound_times = np.interp(bound_distances, distance_m, time_s)
+        axis = distance_m
+        bound_axis = bound_distances
+    else:
+        bounds = np.arange(0, time_s[-1], lap_time_s)
+        bound_times = np.append(bounds, time_s[-1])
+        bound_distances = np.interp(bound_times, time_s, distance_m)
+        axis = time_s
+        bound_axis = bound_times
+
+    lap_distances = np.diff(bound_distances)
+    lap_times = np.diff(bound_times)
+    paces = np.divide(
+        lap_times * 1000,
+        lap_distances,
+        out=np.full_like(lap_times, np.nan),
+        where=lap_distances > 0,
+    )
+    elevation_changes = None
+    if elevation_m is not None:
+        elevation_changes = np.diff(np.interp(bound_axis, axis, elevation_m))
+
+    laps = []
+    for i in range(len(lap_distances)):
+        laps.append(
+            {
+                "lap": i + 1,
+                "distance_km": round(float(lap_distances[i]) / 1000, 3),
+                "moving_time_s": round(float(lap_times[i]), 1),
+                "pace_s_per_km": (
+                    None if np.isnan(paces[i]) else round(float(paces[i]), 1)
+                ),
+                "elevation_change_m": (
+                    None
+                    if elevation_changes is None
+                    else round(float(elevation_changes[i]), 1)
+                ),
+            }
+        )
+    return laps
+
+
+def best_effort(distance_m, time_s, target_m: float):
+    """finds the fastest moving time over any window of target_m within an activity
+    (e.g. the best 5k inside a 10 mile run).
+
+    Each point is the end of a sliding window, and the start of its window (the point
+    target_m earlier) is found with a binary search over the cumulative distance. As
+    the window ends move forward, so do the starts, like a two-pointer sweep, but with
+    all windows computed at once in NumPy. The window start time is interpolated
+    between points, so the effort covers exactly target_m.
+
+    :returns: a dictionary with keys moving_time_s, pace_s_per_km, start_distance_km
+    and start_time_s (moving time into the activity), or None if the activity is
+    shorter than target_m
+    """
+    distance_m = np.asarray(distance_m, dtype=float)
+    time_s = np.asarray(time_s, dtype=float)
+    if not len(distance_m) or distance_m[-1] < target_m:
+        return None
+    ends = np.flatnonzero(distance_m >= target_m)
+    start_distances = distance_m[ends] - target_m
+    start_times = np.interp(start_distances, distance_m, time_s)
+    window_times = time_s[ends] - start_times
+    best = int(np.argmin(window_times))
+    return {
+        "moving_time_s": round(float(window_times[best]), 1),
+        "pace_s_per_km": round(float(window_times[best]) * 1000 / target_m, 1),
+        "start_distance_km": round(float(start_distances[best]) / 1000, 3),
+        "start_time_s": round(float(start_times[best]), 1),
+    }
+
+
+def calculate_best_efforts(distance_m, time_s, efforts: dict | None = None):
+    """finds the best efforts over each distance that an activity is long enough for.
+
+    :param efforts: a dictionary of effort name to distance in km (default the record
+    distances, e.g. "fastest_5k": 5.0)
+    :returns: a list of dictionaries with keys effort, distance_km and the keys of
+    best_effort
+    """
+    efforts = DISTANCE_BUCKETS_KM if efforts is None else efforts
+    best_efforts = []
+    for effort, effort_km in efforts.items():
+        result = best_effort(distance_m, time_s, effort_km * 1000)
+        if result is not None:
+            best_efforts.append({"effort": effort, "distance_km": effort_km, **result})
+    return best_efforts
+
+
+def analyse_stream(
+    stream: dict,
+    lap_distance_m: float | None = None,
+    lap_time_s: float | None = None,
+):
+    """calculates the per km splits, auto-laps (if a lap distance or time is given)
+    and best efforts of an activity stream.
+
+    :returns: a dictionary with keys splits, laps and best_efforts
+    """
+    distance_m, time_s = cumulative_distance_and_time(stream)
+    elevation_m = stream.get("elevation")
+    if elevation_m is not None and np.isnan(elevation_m).any():
+        elevation_m = None
+    laps = []
+    if lap_distance_m is not None or lap_time_s is not None:
+        laps = calculate_laps(
+            distance_m, time_s, lap_distance_m, lap_time_s, elevation_m=elevation_m
+        )
+    return {
+        "splits": calculate_laps(
+            distance_m, time_s, SPLIT_DISTANCE_M, elevation_m=elevation_m
+        ),
+        "laps": laps,
+        "best_efforts": calculate_best_efforts(distance_m, time_s),
+    }
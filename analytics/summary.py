@@ -0,0 +1,115 @@
+from datetime import date, timedelta
+
+from sqlalchemy import Float, and_, case, cast, func, select, true
+
+from database.models import Activity, SummaryActivity
+from database.sql import DatePart
+
+LAST_ACTIVITY_FIELDS = list(SummaryActivity.model_fields)
+
+
+def user_summary_query(user_id: int, today: date):
+    """returns a single query for a user's activity summary: totals and averages over
+    all of their activities, their last activity, and totals for the last 7 days
+    (including today) and the 7 days before. The totals are aggregated by the database
+    and joined to the last activity, so the summary is one round trip.
+
+    :returns: a select statement for one row, with the columns read by
+    format_user_summary
+    """
+    columns = Activity.__table__.c
+    day = DatePart(columns.date, "date")
+    week_start = (today - timedelta(days=6)).strftime("%Y/%m/%d")
+    previous_week_start = (today - timedelta(days=13)).strftime("%Y/%m/%d")
+    this_week = and_(day >= week_start, day <= today.strftime("%Y/%m/%d"))
+    previous_week = and_(day >= previous_week_start, day < week_start)
+    # paces are only averaged over activities with a distance
+    has_distance = columns.distance_km > 0
+
+    totals = (
+        select(
+            func.count().label("activity_count"),
+            func.sum(columns.distance_km).label("total_distance_km"),
+            func.sum(columns.moving_time_s).label("total_moving_time_s"),
+            func.sum(columns.elevation_m).label("total_elevation_m"),
+            func.avg(columns.distance_km).label("average_distance_km"),
+            func.sum(case((has_distance, columns.moving_time_s))).label(
+                "paced_moving_time_s"
+            ),
+            func.sum(case((has_distance, columns.distance_km))).label(
+                "paced_distance_km"
+            ),
+            # cast so Postgres averages as a float, not a numeric
+            func.avg(cast(columns.perceived_effort, Float)).label(
+                "average_perceived_effort"
+            ),
+            func.count(case((this_week, 1))).label("week_activity_count"),
+            func.sum(case((this_week, columns.distance_km))).label("week_distance_km"),
+            func.count(case((previous_week, 1))).label("previous_week_activity_count"),
+            func.sum(case((previous_week, columns.distance_km))).label(
+                "previous_week_distance_km"
+            ),
+        )
+        .where(columns.user_id == user_id)
+        .subquery("totals")
+    )
+    last_activity = (
+        select(*(columns[field] for field in LAST_ACTIVITY_FIELDS))
+        .where(columns.user_id == user_id)
+        # a backfilled activity can have a higher id than a later one on the same day
+        .order_by(day.desc(), columns.time.desc(), columns.id.desc())
+        .limit(1)
+        .subquery("last_activity")
+    )
+    return select(totals, last_activity).select_from(
+        totals.outerjoin(last_activity, true())
+    )
+
+
+def round_or_none(value: float | None, digits: int = 2):
+    """rounds a value, returning None if there is no value"""
+    return None if value is None else round(value, digits)
+
+
+def format_user_summary(user_id: int, row):
+    """formats the row of user_summary_query as the summary returned by
+    GET /users/{user_id}/summary.
+
+    :returns: a dictionary with the fields of UserSummary. Totals are 0 and averages
+    None if the user has no activities.
+    """
+    values = row._mapping
+    average_pace = None
+    if values["paced_distance_km"]:
+        average_pace = values["paced_moving_time_s"] / values["paced_distance_km"]
+    week_distance = values["week_distance_km"] or 0.0
+    previous_week_distance = values["previous_week_distance_km"] or 0.0
+    week_change = None
+    if previous_week_distance:
+        week_change = (week_distance / previous_week_distance - 1) * 100
+    last_activity = None
+    if values["id"] is not None:
+        last_activity = {field: values[field] for field in LAST_ACTIVITY_FIELDS}
+    return {
+        "user_id": user_id,
+        "activity_count": values["activity_count"],
+        "total_distance_km": round(values["total_distance_km"] or 0.0, 2),
+        "total_moving_time_s": values["total_moving_time_s"] or 0,
+        "total_elevation_m": values["total_elevation_m"] or 0,
+        "average_distance_km": round_or_none(values["average_distance_km"]),
+        "average_pace_s_per_km": round_or_none(average_pace),
+        "average_perceived_effort": round_or_none(values["average_perceived_effort"]),
+        "last_activity": last_activity,
+        "week_activity_count": values["week_activity_count"],
+        "week_distance_km": round(week_distance, 2),
+        "previous_week_activity_count": values["previous_week_activity_count"],
+        "previous_week_distance_km": round(previous_week_distance, 2),
+        "week_distance_change_pct": round_or_none(week_change, 1),
+    }
+
+
+def summary_etag(user_id: int, data_version: int, today: date):
+    """returns the ETag of a user's summary. It changes whenever the user's activities
+    are written (bumping their data_version), and each day, as the weeks in the summary
+    move with today's date."""
+    return f'"{user_id}-{data_version}-{today.strftime("%Y%m%d")}"'
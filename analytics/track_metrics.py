@@ -0,0 +1,82 @@
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+# slower than this (m/s) between two points counts as paused (e.g. GPS drift while
+# stopped at a road crossing)
+MIN_MOVING_SPEED_MS = 0.5
+# a gap of more than this many seconds between two points counts as paused (e.g. the
+# watch's auto pause)
+MAX_MOVING_GAP_S = 60
+# number of points in the moving average used to smooth out elevation noise
+ELEVATION_SMOOTHING_POINTS = 5
+
+
+def haversine_distances(latitudes, longitudes):
+    """calculates the great circle distance between each pair of consecutive track
+    points, in a single vectorized pass.
+
+    :param latitudes: point latitudes in degrees
+    :param longitudes: point longitudes in degrees
+    :returns: a numpy array of the n - 1 segment distances in metres
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    delta_lat = np.diff(lat)
+    delta_lon = np.diff(lon)
+    a = (
+        np.sin(delta_lat / 2) ** 2
+        + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(delta_lon / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def moving_segments(distances, times):
+    """finds the segments between consecutive track points that were spent moving,
+    rather than paused.
+
+    :param distances: segment distances in metres (from haversine_distances)
+    :param times: point times in seconds (e.g. since the epoch)
+    :returns: a numpy boolean array with one value per segment
+    """
+    durations = np.diff(np.asarray(times, dtype=float))
+    speeds = np.divide(
+        distances, durations, out=np.zeros_like(distances), where=durations > 0
+    )
+    return (
+        (durations > 0)
+        & (durations <= MAX_MOVING_GAP_S)
+        & (speeds >= MIN_MOVING_SPEED_MS)
+    )
+
+
+def elevation_gain(elevations):
+    """calculates the total ascent of a track in metres, from the elevations smoothed
+    with a moving average so that GPS noise isn't counted as climbing"""
+    elevations = np.asarray(elevations, dtype=float)
+    if len(elevations) < 2:
+        return 0.0
+    # short tracks are smoothed less, so their climbs aren't averaged away
+    window = max(1, min(ELEVATION_SMOOTHING_POINTS, len(elevations) // 2))
+    smoothed = np.convolve(elevations, np.ones(window) / window, mode="valid")
+    return float(np.clip(np.diff(smoothed), 0, None).sum())
+
+
+def calculate_track_metrics(latitudes, longitudes, times, elevations=None):
+    """calculates an activity's distance, moving time and elevation gain from its
+    track points. Distance and time are only counted for the moving segments.
+
+    :param latitudes: point latitudes in degrees
+    :param longitudes: point longitudes in degrees
+    :param times: point times in seconds (e.g. since the epoch)
+    :param elevations: point elevations in metres, or None if the track has none
+    :returns: a dictionary with keys distance_km, moving_time_s and elevation_m (None
+    if there are no elevations)
+    """
+    distances = haversine_distances(latitudes, longitudes)
+    moving = moving_segments(distances, times)
+    durations = np.diff(np.asarray(times, dtype=float))
+    return {
+        "distance_km": float(distances[moving].sum()) / 1000,
+        "moving_time_s": int(round(durations[moving].sum())),
+        "elevation_m": None if elevations is None else elevation_gain(elevations),
+    }
@@ -0,0 +1,172 @@
+from datetime import datetime, timedelta
+import math
+
+import numpy as np
+import pandas as pd
+
+ACUTE_WINDOW_DAYS = 7
+CHRONIC_WINDOW_DAYS = 28
+FITNESS_TIME_CONSTANT_DAYS = 42
+FATIGUE_TIME_CONSTANT_DAYS = 7
+
+# smoothing factors for the exponentially weighted fitness and fatigue averages
+FITNESS_ALPHA = 1 - math.exp(-1 / FITNESS_TIME_CONSTANT_DAYS)
+FATIGUE_ALPHA = 1 - math.exp(-1 / FATIGUE_TIME_CONSTANT_DAYS)
+
+
+def resample_daily_distance(df: pd.DataFrame):
+    """resamples activity data into a daily distance series, with days that have no
+    activities filled with 0.
+
+    :param df: dataframe containing a datetime "date" column and a "distance_km" column.
+    Rows with no date (NaT) are ignored.
+    :returns: a pandas series of total distance per day, indexed by date
+    :raises: raises a KeyError if there is no dated data to resample
+    """
+    dated = df.dropna(subset=["date"])
+    if dated.empty:
+        raise KeyError("date")
+    days = dated["date"].to_numpy().astype("datetime64[D]")
+    first_day = days.min()
+    day_offsets = (days - first_day).astype(np.int64)
+    # bincount sums the distances falling on each day in a single vectorized pass
+    daily_km = np.bincount(
+        day_offsets, weights=dated["distance_km"].to_numpy(dtype=float)
+    )
+    index = pd.date_range(first_day, periods=len(daily_km), freq="D", name="date")
+    return pd.Series(daily_km, index=index, name="distance_km")
+
+
+def rolling_sum(values: np.ndarray, window: int):
+    """calculates the trailing sum over the given window using cumulative sums, so
+    the cost does not depend on the window size. The first window - 1 values sum
+    over the days available so far."""
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return cumulative[ends] - cumulative[starts]
+
+
+def ewma(values: np.ndarray, alpha: float):
+    """calculates an exponentially weighted moving average that starts from 0, i.e.
+    y[t] = y[t - 1] + alpha * (x[t] - y[t - 1]) with y[-1] = 0."""
+    # prepending the 0 starting value gives the recursion above with adjust=False
+    padded = pd.Series(np.concatenate(([0.0], values)))
+    return padded.ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+
+
+def calculate_acwr(acute_km, chronic_km):
+    """calculates the acute:chronic workload ratio from the 7 day and 28 day distance
+    totals, comparing the average daily load of each window. Returns NaN where there is
+    no chronic load."""
+    acute_daily = np.asarray(acute_km, dtype=float) / ACUTE_WINDOW_DAYS
+    chronic_daily = np.asarray(chronic_km, dtype=float) / CHRONIC_WINDOW_DAYS
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(chronic_daily > 0, acute_daily / chronic_daily, np.nan)
+
+
+def calculate_training_load(df: pd.DataFrame):
+    """calculates daily training load metrics for activity data.
+
+    :param df: dataframe containing a datetime "date" column and a "distance_km" column
+    (e.g. the output of create_dataframe).
+    :returns: a pandas dataframe indexed by day, with columns distance_km (total that day),
+    acute_load_km (rolling 7 day distance), chronic_load_km (rolling 28 day distance),
+    acwr (acute:chronic workload ratio), fitness and fatigue (exponentially weighted
+    daily distance with 42 and 7 day time constants) and form (fitness - fatigue).
+    :raises: raises a KeyError if there is no data available to calculate the load
+    """
+    daily_km = resample_daily_distance(df)
+    values = daily_km.to_numpy()
+    acute_km = rolling_sum(values, ACUTE_WINDOW_DAYS)
+    chronic_km = rolling_sum(values, CHRONIC_WINDOW_DAYS)
+    fitness = ewma(values, FITNESS_ALPHA)
+    fatigue = ewma(values, FATIGUE_ALPHA)
+    return pd.DataFrame(
+        {
+            "distance_km": values,
+            "acute_load_km": acute_km,
+            "chronic_load_km": chronic_km,
+            "acwr": calculate_acwr(acute_km, chronic_km),
+            "fitness": fitness,
+            "fatigue": fatigue,
+            "form": fitness - fatigue,
+        },
+        index=daily_km.index,
+    )
+
+
+def build_training_load_state(df: pd.DataFrame):
+    """builds the stored training load state for a user from all of their activity data.
+
+    :param df: dataframe containing a datetime "date" column and a "distance_km" column.
+    :returns: a dictionary with keys last_date (string "YYYY/MM/DD"), fitness, fatigue and
+    recent_distances (list of the daily distances for the last 28 days, oldest first).
+    :raises: raises a KeyError if there is no data available
+    """
+    load = calculate_training_load(df)
+    recent = load["distance_km"].to_numpy()[-CHRONIC_WINDOW_DAYS:]
+    padding = [0.0] * (CHRONIC_WINDOW_DAYS - len(recent))
+    return {
+        "last_date": load.index[-1].strftime("%Y/%m/%d"),
+        "fitness": float(load["fitness"].iloc[-1]),
+        "fatigue": float(load["fatigue"].iloc[-1]),
+        "recent_distances": padding + [float(km) for km in recent],
+    }
+
+
+def append_to_training_load_state(state: dict | None, date: str, distance_km: float):
+    """updates a training load state (see build_training_load_state) with one new
+    activity. This only touches the last 28 days of distances, so the cost does not
+    grow with the length of the activity history.
+
+    :param state: the current state, or None if the user has no state yet.
+    :param date: date of the new activity, in the format "YYYY/MM/DD".
+    :param distance_km: distance of the new activity.
+    :returns: the updated state dictionary, or None if the activity is dated before the
+    last day in the state (the state then needs rebuilding from all activities).
+    """
+    if state is None:
+        state = {
+            "last_date": date,
+            "fitness": 0.0,
+            "fatigue": 0.0,
+            "recent_distances": [0.0] * CHRONIC_WINDOW_DAYS,
+        }
+    last_date = datetime.strptime(state["last_date"], "%Y/%m/%d")
+    gap_days = (datetime.strptime(date, "%Y/%m/%d") - last_date).days
+    if gap_days < 0:
+        return None
+
+    # days without activities decay the averages and roll out of the windows
+    recent = list(state["recent_distances"])
+    shift = min(gap_days, CHRONIC_WINDOW_DAYS)
+    recent = recent[shift:] + [0.0] * shift
+    recent[-1] += distance_km
+    fitness = state["fitness"] * (1 - FITNESS_ALPHA) ** gap_days
+    fatigue = state["fatigue"] * (1 - FATIGUE_ALPHA) ** gap_days
+    return {
+        "last_date": (last_date + timedelta(days=gap_days)).strftime("%Y/%m/%d"),
+        "fitness": fitness + FITNESS_ALPHA * distance_km,
+        "fatigue": fatigue + FATIGUE_ALPHA * distance_km,
+        "recent_distances": recent,
+    }
+
+
+def summarise_training_load_state(state: dict):
+    """returns the training load metrics for the last day of a training load state, as
+    a dictionary with keys date, acute_load_km, chronic_load_km, acwr, fitness, fatigue
+    and form. acwr is None if there is no chronic load."""
+    recent = state["recent_distances"]
+    acute_km = sum(recent[-ACUTE_WINDOW_DAYS:])
+    chronic_km = sum(recent)
+    acwr = float(calculate_acwr(acute_km, chronic_km))
+    return {
+        "date": state["last_date"],
+        "acute_load_km": round(acute_km, 2),
+        "chronic_load_km": round(chronic_km, 2),
+        "acwr": None if math.isnan(acwr) else round(acwr, 2),
+        "fitness": round(state["fitness"], 2),
+        "fatigue": round(state["fatigue"], 2),
+        "form": round(state["fitness"] - state["fatigue"], 2),
+    }
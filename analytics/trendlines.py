@@ -0,0 +1,114 @@
+import numpy as np
+
+from visualisation.plots_utils import calculate_pace_mins_per_km, convert_pace_to_float
+
+# metrics plotted against pace (min/km) with a trendline
+TRENDLINE_METRICS = ["distance_km", "elevation_m", "perceived_effort"]
+TRENDLINE_FITS = ["linear", "robust", "windowed"]
+# most pairs of points the robust (Theil-Sen) slope is taken over
+MAX_ROBUST_PAIRS = 200_000
+
+
+def trendline_points(activity: dict):
+    """returns the (x, y) point an activity adds to each trendline, where y is the pace
+    in min/km as plotted. Metrics without a value (e.g. no elevation) are left out, as
+    are activities with no distance.
+
+    :param activity: dictionary of activity values (e.g. from Activity.model_dump())
+    :returns: a dictionary of metric name to (x, y) tuple
+    """
+    if not activity["distance_km"] or activity["distance_km"] <= 0:
+        return {}
+    pace = convert_pace_to_float(
+        calculate_pace_mins_per_km(activity["distance_km"], activity["moving_time"])
+    )
+    return {
+        metric: (float(activity[metric]), pace)
+        for metric in TRENDLINE_METRICS
+        if activity[metric] is not None
+    }
+
+
+def add_trendline_point(stats: dict, x: float, y: float, weight: int = 1):
+    """adds a point to running sufficient statistics for a linear regression, or removes
+    it when weight is -1. stats is a dictionary with keys n, sum_x, sum_y, sum_xy and
+    sum_xx, which is updated in place."""
+    stats["n"] += weight
+    stats["sum_x"] += weight * x
+    stats["sum_y"] += weight * y
+    stats["sum_xy"] += weight * x * y
+    stats["sum_xx"] += weight * x * x
+    if stats["n"] == 0:
+        # clear any floating point error left over from removing points
+        stats.update(sum_x=0.0, sum_y=0.0, sum_xy=0.0, sum_xx=0.0)
+
+
+def calculate_linear_coefficients(stats: dict):
+    """calculates the least squares trendline from running sufficient statistics.
+
+    :param stats: dictionary with keys n, sum_x, sum_y, sum_xy and sum_xx
+    :returns: a tuple (slope, intercept), or None if there are fewer than two points or
+    all points have the same x value
+    """
+    n = stats["n"]
+    denominator = n * stats["sum_xx"] - stats["sum_x"] ** 2
+    if n < 2 or np.isclose(denominator, 0):
+        return None
+    slope = (n * stats["sum_xy"] - stats["sum_x"] * stats["sum_y"]) / denominator
+    intercept = (stats["sum_y"] - slope * stats["sum_x"]) / n
+    return (float(slope), float(intercept))
+
+
+def fit_robust_trendline(x, y, max_pairs: int = MAX_ROBUST_PAIRS):
+    """calculates a Theil-Sen trendline (median of the slopes between pairs of points),
+    which is less affected by outliers than least squares. Every pair is used for up
+    to max_pairs pairs; beyond that, the slope is the median over max_pairs randomly
+    sampled pairs (seeded, so the same points give the same trendline), which bounds
+    the memory and time used for users with many activities.
+
+    :returns: a tuple (slope, intercept), or None if all points have the same x value
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n * (n - 1) // 2 <= max_pairs:
+        i, j = np.triu_indices(n, k=1)
+    else:
+        # pairs of a point with itself have dx = 0, so are left out below
+        i, j = np.random.default_rng(0).integers(0, n, size=(2, max_pairs))
+    dx = x[j] - x[i]
+    valid = dx != 0
+    if not valid.any():
+        return None
+    slope = np.median((y[j] - y[i])[valid] / dx[valid])
+    intercept = np.median(y - slope * x)
+    return (float(slope), float(intercept))
+
+
+def fit_windowed_trendline(x, y, window: int):
+    """calculates a least squares trendline over the last window points only, e.g. to
+    show the trend of recent activities. x and y should be in date order.
+
+    :returns: a tuple (slope, intercept), or None if there are fewer than two points or
+    all points in the window have the same x value
+    """
+    x = np.asarray(x, dtype=float)[-window:]
+    y = np.asarray(y, dtype=float)[-window:]
+    if len(x) < 2 or np.all(x == x[0]):
+        return None
+    slope, intercept = np.polyfit(x, y, 1)
+    return (float(slope), float(intercept))
+
+
+def fit_trendline(x, y, fit: str = "linear", window: int = 20):
+    """calculates a trendline directly from data points (rather than from running
+    statistics), using the given fit: "linear" (least squares over all points),
+    "robust" (Theil-Sen) or "windowed" (least squares over the last window points).
+
+    :returns: a tuple (slope, intercept), or None if a trendline can't be fitted
+    """
+    if fit == "robust":
+        return fit_robust_trendline(x, y)
+    if fit == "windowed":
+        return fit_windowed_trendline(x, y, window)
+    return fit_windowed_trendline(x, y, len(x))
@@ -0,0 +1,101 @@
+"""Compares the memory used by the default and compact activity dataframes (see
+create_dataframe), and projects it to a 10 million activity, multi-user dataframe.
+
+Run from the root of the directory with:
+
+    python -m benchmarks.bench_dataframe_memory
+"""
+
+import time
+
+from visualisation.plots_utils import (
+    DATAFRAME_CHUNK_ROWS,
+    concat_compact_dataframes,
+    create_dataframe,
+)
+
+ROW_COUNTS = [10000, 100000, 500000]
+PROJECTED_ROWS = 10_000_000
+USERS = 500
+ACTIVITY_TYPES = ["road", "trail", "track", "treadmill", "gravel"]
+
+
+def create_rows(start: int, count: int):
+    """creates activity data as dictionaries, as returned by select_activity_data (with
+    the generated columns, and user_name as for a group of users)"""
+    rows = []
+    for i in range(start, start + count):
+        moving_time_s = 1200 + i % 5400
+        distance_km = round(4 + i % 300 / 10, 2)
+        rows.append(
+            {
+                "id": i + 1,
+                "user_id": i % USERS + 1,
+                "date": f"{2015 + i % 10}/{i % 12 + 1:02d}/{i % 28 + 1:02d}",
+                "time": f"{i % 24:02d}:{i % 60:02d}",
+                "activity": "run" if i % 3 else "ride",
+                "activity_type": ACTIVITY_TYPES[i % len(ACTIVITY_TYPES)],
+                "moving_time": (
+                    f"{moving_time_s // 3600:02d}:{moving_time_s // 60 % 60:02d}:"
+                    f"{moving_time_s % 60:02d}"
+                ),
+                "distance_km": distance_km,
+                "perceived_effort": i % 10 + 1,
+                "elevation_m": i % 400 if i % 4 else None,
+                "moving_time_s": moving_time_s,
+                "pace_s_per_km": moving_time_s / distance_km,
+                "speed_kmh": distance_km * 3600 / moving_time_s,
+                "user_name": f"user {i % USERS + 1}",
+            }
+        )
+    return rows
+
+
+def create_compact_dataframe(row_count: int):
+    """creates a compact dataframe DATAFRAME_CHUNK_ROWS at a time, as
+    create_users_dataframe does from the query's rows"""
+    frames = []
+    for start in range(0, row_count, DATAFRAME_CHUNK_ROWS):
+        rows = create_rows(start, min(DATAFRAME_CHUNK_ROWS, row_count - start))
+        frames.append(create_dataframe(rows, compact=True))
+    return concat_compact_dataframes(frames)
+
+
+def memory_mb(df):
+    """returns the memory used by a dataframe in MB, including the strings in object
+    columns"""
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def main():
+    print(
+        f"{'rows':>7} {'default (MB)':>13} {'compact (MB)':>13} "
+        f"{'default (s)':>12} {'compact (s)':>12} {'saving':>7}"
+    )
+    for row_count in ROW_COUNTS:
+        start = time.perf_counter()
+        default_df = create_dataframe(create_rows(0, row_count))
+        default_s = time.perf_counter() - start
+        default_mb = memory_mb(default_df)
+        del default_df
+
+        start = time.perf_counter()
+        compact_df = create_compact_dataframe(row_count)
+        compact_s = time.perf_counter() - start
+        compact_mb = memory_mb(compact_df)
+        print(
+            f"{row_count:>7} {default_mb:>13.1f} {compact_mb:>13.1f} "
+            f"{default_s:>12.2f} {compact_s:>12.2f} {default_mb / compact_mb:>6.1f}x"
+        )
+
+    print()
+    print(f"Projected for {PROJECTED_ROWS:,} activities:")
+    print(f"  default: {default_mb / row_count * PROJECTED_ROWS / 1000:.1f} GB")
+    print(f"  compact: {compact_mb / row_count * PROJECTED_ROWS / 1000:.1f} GB")
+    print("  compact dtypes:")
+    for column, dtype in compact_df.dtypes.items():
+        print(f"    {column}: {dtype}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Compares the fast JSON path of GET /activities/ against the previous path, which
+returned Activity models for FastAPI to validate against the response_model and encode.
+
+Run from the root of the directory with:
+
+    python -m benchmarks.bench_list_responses
+"""
+
+import statistics
+import time
+from datetime import date, timedelta
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.pool import StaticPool
+
+from database.database import SessionDep, get_read_session, get_session
+from database.models import Activity
+from routes import app
+
+PAGE_SIZES = [1000, 10000]
+REPEATS = 20
+
+baseline_app = FastAPI()
+
+
+@baseline_app.get("/activities/")
+def get_activities_baseline(
+    session: SessionDep, offset: int = 0, limit: int = 10
+) -> list[Activity]:
+    """the list endpoint before the fast JSON path was added"""
+    return session.exec(select(Activity).offset(offset).limit(limit)).all()
+
+
+def create_session(rows: int):
+    """creates an in-memory database containing the given number of activities,
+    one an hour, as the activity table allows a user one activity per date and time"""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    session = Session(engine)
+    session.add_all(
+        Activity(
+            user_id=1,
+            date=(date(2025, 1, 1) + timedelta(days=i // 24)).strftime("%Y/%m/%d"),
+            time=f"{i % 24:02d}:30",
+            activity="run",
+            activity_type="road",
+            moving_time="00:30:00",
+            distance_km=5 + i % 10,
+            perceived_effort=i % 10 + 1,
+            elevation_m=i % 200,
+        )
+        for i in range(rows)
+    )
+    session.commit()
+    return session
+
+
+def time_requests(client: TestClient, limit: int):
+    """returns the median time in milliseconds to get a page of activities"""
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        response = client.get("/activities/", params={"limit": limit})
+        timings.append((time.perf_counter() - start) * 1000)
+        assert len(response.json()) == limit
+    return statistics.median(timings)
+
+
+def main():
+    session = create_session(max(PAGE_SIZES))
+    for benchmark_app in (app, baseline_app):
+        for dependency in (get_session, get_read_session):
+            benchmark_app.dependency_overrides[dependency] = lambda: session
+    fast_client = TestClient(app)
+    baseline_client = TestClient(baseline_app)
+
+    print(f"{'rows':>6} {'baseline (ms)':>14} {'fast (ms)':>10} {'speedup':>8}")
+    for limit in PAGE_SIZES:
+        baseline_ms = time_requests(baseline_client, limit)
+        fast_ms = time_requests(fast_client, limit)
+        print(
+            f"{limit:>6} {baseline_ms:>14.1f} {fast_ms:>10.1f} {baseline_ms / fast_ms:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
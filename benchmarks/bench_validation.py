@@ -0,0 +1,81 @@
+"""Compares validating a batch of activities a whole column at a time (see
+database/validation.py) against validating each row with the Activity model.
+
+Run from the root of the directory with:
+
+    python -m benchmarks.bench_validation
+"""
+
+import statistics
+import time
+
+from database.models import Activity
+from database.validation import validate_activity_batch
+
+BATCH_SIZES = [1000, 10000, 100000]
+REPEATS = 5
+# every INVALID_EVERY rows has an invalid date, to include the cost of reporting errors
+INVALID_EVERY = 1000
+
+
+def create_rows(count: int):
+    """creates a batch of activities as dictionaries, as in a bulk request body"""
+    return [
+        {
+            "user_id": i % 50 + 1,
+            "date": (
+                "2025/02/30"
+                if i % INVALID_EVERY == INVALID_EVERY - 1
+                else f"2025/{i % 12 + 1:02d}/{i % 28 + 1:02d}"
+            ),
+            "time": f"{i % 24:02d}:{i % 60:02d}",
+            "activity": "run" if i % 2 else "ride",
+            "activity_type": "road",
+            "moving_time": f"00:{i % 60:02d}:{i % 60:02d}",
+            "distance_km": 5 + i % 100 / 10,
+            "perceived_effort": i % 10 + 1,
+            "elevation_m": i % 200 if i % 3 else None,
+        }
+        for i in range(count)
+    ]
+
+
+def validate_per_row(rows: list):
+    """validates each row with the Activity model, collecting the errors"""
+    activities = []
+    errors = {}
+    for row, activity in enumerate(rows):
+        try:
+            activities.append(Activity.model_validate(activity))
+        except ValueError as e:
+            errors[row] = e.errors()
+    return activities, errors
+
+
+def time_validation(validate, rows: list):
+    """returns the median time in milliseconds to validate the rows"""
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        validate(rows)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    print(
+        f"{'rows':>7} {'per row (ms)':>13} {'batch (ms)':>11} "
+        f"{'batch rows/s':>13} {'speedup':>8}"
+    )
+    for batch_size in BATCH_SIZES:
+        rows = create_rows(batch_size)
+        per_row_ms = time_validation(validate_per_row, rows)
+        batch_ms = time_validation(validate_activity_batch, rows)
+        print(
+            f"{batch_size:>7} {per_row_ms:>13.1f} {batch_ms:>11.1f} "
+            f"{batch_size / batch_ms * 1000:>13,.0f} {per_row_ms / batch_ms:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,39 @@
+import time
 from typing import Annotated
-from fastapi import Depends
+from fastapi import Depends, Request
 from sqlmodel import Session, SQLModel, create_engine
 import os
 from dotenv import load_dotenv
 
+from database.partitioning import setup_activity_partitioning
+from database.upgrade import upgrade_tables
+
 load_dotenv()
 
 postgres_url = os.getenv("DB_URL")
 
 engine = create_engine(postgres_url)
 
+# GET endpoints and plots read from a replica, with its own connection pool, if
+# DB_READ_URL is set. Otherwise reads use the primary engine.
+read_url = os.getenv("DB_READ_URL")
+read_engine = create_engine(read_url) if read_url else engine
+
+# clients that wrote within this many seconds read from the primary, so they see
+# their own writes even if the replica is behind
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+LAST_WRITE_COOKIE = "last_write"
+
 
-def create_db_and_tables():
-    """Creates tables for all table models"""
+def create_db_and_tables(after_delete=None):
+    """Creates tables for all table models. The activity_table is partitioned by date
+    first if partitioning is enabled (see database/partitioning.py). Tables created by
+    earlier versions are then upgraded with any new columns, indexes and constraints
+    (see database/upgrade.py). Duplicate activities are only deleted if after_delete
+    is given (as by upgrade_db.py), else DuplicateActivitiesError is raised"""
+    setup_activity_partitioning(engine)
     SQLModel.metadata.create_all(engine)
+    upgrade_tables(engine, after_delete)
 
 
 def get_session():
@@ -27,3 +47,25 @@ def get_session():
 
 
 SessionDep = Annotated[Session, Depends(get_session)]
+
+
+def wrote_recently(request: Request):
+    """checks whether the client's last_write cookie (set after a successful write)
+    is within READ_YOUR_WRITES_SECONDS"""
+    try:
+        last_write = float(request.cookies.get(LAST_WRITE_COOKIE, 0))
+    except ValueError:
+        return False
+    return time.time() - last_write < READ_YOUR_WRITES_SECONDS
+
+
+def get_read_session(request: Request):
+    """Creates a read-only session for a request, using the read replica (if
+    DB_READ_URL is set). Clients that have just written are given a primary session
+    instead, so they read their own writes."""
+    read_bind = engine if wrote_recently(request) else read_engine
+    with Session(read_bind) as session:
+        yield session
+
+
+ReadSessionDep = Annotated[Session, Depends(get_read_session)]
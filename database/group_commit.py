@@ -0,0 +1,129 @@
+from concurrent.futures import Future
+import os
+import queue
+import threading
+import time
+from typing import Callable
+
+from sqlmodel import Session
+
+from database.models import Activity
+
+
+class GroupCommitBuffer:
+    """Writes activities from concurrent requests together, in one transaction.
+
+    Each submitted activity waits at most max_delay_ms for others to join its batch
+    (or until max_batch activities are waiting), then the whole batch is written with
+    a single commit. Each activity is written in its own savepoint, so an activity that
+    fails only fails its own request. Callers get a Future that resolves to their
+    stored activity (with its id) or raises their error.
+
+    The latency added to a request is bounded by max_delay_ms plus the time to write
+    and commit one batch.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        max_delay_ms: float = 5,
+        max_batch: int = 100,
+        write: Callable[[Session, Activity], Activity] | None = None,
+    ):
+        """
+        :param session_factory: returns a new session for each batch. Sessions should
+        be created with expire_on_commit=False, so activities can be read after commit.
+        :param max_delay_ms: longest time an activity waits for its batch to fill up
+        :param max_batch: largest number of activities committed together
+        :param write: writes an activity in the session (in its savepoint) and returns
+        the stored activity, e.g. upserting it and updating derived state. By default
+        the activity is inserted.
+        """
+        self.session_factory = session_factory
+        self.max_delay_s = max_delay_ms / 1000
+        self.max_batch = max_batch
+        self.write = write or insert_activity
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, activity: Activity):
+        """queues an activity to be written with the next batch, returning a Future
+        for the stored activity"""
+        future = Future()
+        self.queue.put((activity, future))
+        return future
+
+    def run(self):
+        """collects and writes batches until a None item is queued"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.insert_batch(batch)
+                    return
+                batch.append(item)
+            self.insert_batch(batch)
+
+    def insert_batch(self, batch: list):
+        """writes a batch of (activity, future) pairs in one transaction and resolves
+        the futures"""
+        written = []
+        try:
+            with self.session_factory() as session:
+                for activity, future in batch:
+                    try:
+                        with session.begin_nested():
+                            stored = self.write(session, activity)
+                        written.append((stored, future))
+                    except Exception as e:
+                        future.set_exception(e)
+                session.commit()
+        except Exception as e:
+            # the commit failed, so none of the batch was saved
+            for _, future in written:
+                future.set_exception(e)
+            return
+        for activity, future in written:
+            future.set_result(activity)
+
+    def close(self):
+        """writes any queued activities and stops the buffer's thread"""
+        self.queue.put(None)
+        self.thread.join()
+
+
+def insert_activity(session: Session, activity: Activity):
+    """adds an activity to the session and flushes it, so it has an id"""
+    session.add(activity)
+    session.flush()
+    return activity
+
+
+def create_group_commit_buffer(
+    engine, write: Callable[[Session, Activity], Activity] | None = None
+):
+    """creates a GroupCommitBuffer if group commit is enabled, by setting the
+    GROUP_COMMIT_MS environment variable to the longest time (in milliseconds) an
+    activity should wait for its batch. GROUP_COMMIT_MAX_ROWS sets the largest batch
+    (default 100). Returns None if group commit is not enabled."""
+    max_delay_ms = os.getenv("GROUP_COMMIT_MS")
+    if not max_delay_ms:
+        return None
+    return GroupCommitBuffer(
+        lambda: Session(engine, expire_on_commit=False),
+        max_delay_ms=float(max_delay_ms),
+        max_batch=int(os.getenv("GROUP_COMMIT_MAX_ROWS", "100")),
+        write=write,
+    )
@@ -0,0 +1,226 @@
+"""Inserts batches of activities with multi-row upserts.
+
+Activities are identified by their natural key (ACTIVITY_NATURAL_KEY: user, date, time
+and activity), which has a unique index. upsert_activity_rows inserts rows with one
+INSERT ... ON CONFLICT DO UPDATE, so a row with the natural key of an existing activity
+(e.g. a device retrying a submission) updates that activity instead of duplicating it,
+in the same round trip. upsert_activity also returns an updated activity's previous
+values, so derived state can be updated incrementally rather than rebuilt.
+
+upsert_activity_rows upserts rows that have already been validated (e.g. by
+validate_activity_batch). insert_activities_trusted is for trusted internal pipelines,
+and upserts rows without validating them in Python: the activity_table's constraints
+(see Activity.__table_args__) enforce the same rules as the Activity validators. If the
+database rejects a batch, the batch is bisected in savepoints to find every rejected
+row and the constraint it violated, so rejects are reported as precisely as validation
+errors. The cost of finding k rejected rows in a batch of n is O(k log n) INSERTs.
+
+SQLite doesn't enforce column types, so trusted rows must have the right types (e.g.
+a float distance_km). Postgres rejects values of the wrong type, but rounds a number
+with a fraction into an integer column, so those are rejected before the INSERT (see
+fractional_integers).
+"""
+
+import re
+
+from sqlalchemy import Integer, func, literal_column, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import StatementError
+from sqlmodel import Session
+
+from database.models import ACTIVITY_CONSTRAINT_ERRORS, ACTIVITY_NATURAL_KEY, Activity
+from database.validation import ACTIVITY_FIELDS, pad_date, pad_time
+
+# the column of a NOT NULL violation, in SQLite and Postgres error messages
+NOT_NULL_COLUMN = re.compile(
+    r"NOT NULL constraint failed: \w+\.(\w+)|null value in column \"(\w+)\""
+)
+# the integer activity fields
+INTEGER_FIELDS = [
+    field
+    for field in ACTIVITY_FIELDS
+    if isinstance(Activity.__table__.c[field].type, Integer)
+]
+# the INSERT statements with ON CONFLICT clauses, for each database
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def key_value(field: str, value):
+    """returns a natural key value in a canonical form, as the database may convert a
+    trusted row's values (e.g. a user_id of "1" is stored as 1), so the key of a row
+    matches the key of the row returned for it. Integer fields are compared as floats,
+    where the value is a number."""
+    if field in INTEGER_FIELDS:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            pass
+    return value
+
+
+def natural_key(row: dict):
+    """returns the natural key of an activity (see ACTIVITY_NATURAL_KEY) as a tuple"""
+    return tuple(key_value(field, row[field]) for field in ACTIVITY_NATURAL_KEY)
+
+
+def upsert_activity_rows(session: Session, rows: list):
+    """upserts activities with one multi-row INSERT ... ON CONFLICT DO UPDATE: a row
+    with the natural key of an existing activity updates that activity's other fields
+    rather than inserting a duplicate.
+
+    :param rows: a list of dictionaries of every activity field. Rows with the same
+    natural key are upserted once, with the values of the last of them.
+    :returns: a list of the upserted activities as dictionaries, in the order of rows,
+    with their ids, the columns generated by the database (e.g. pace_s_per_km) and
+    inserted (False if an existing activity was updated)
+    """
+    if not rows:
+        return []
+    table = Activity.__table__
+    dialect_name = session.get_bind().dialect.name
+    # Postgres rejects a statement that updates the same row twice
+    unique_rows = {natural_key(row): row for row in rows}
+    statement = UPSERT_INSERTS[dialect_name](table)
+    statement = statement.on_conflict_do_update(
+        index_elements=ACTIVITY_NATURAL_KEY,
+        set_={
+            field: statement.excluded[field]
+            for field in ACTIVITY_FIELDS
+            if field not in ACTIVITY_NATURAL_KEY
+        },
+    )
+    if dialect_name == "postgresql":
+        # xmax is 0 for a row version written by an INSERT, rather than an UPDATE
+        inserted = literal_column("xmax = 0")
+    else:
+        # SQLite gives an inserted row a greater id than any existing row
+        last_id = session.execute(select(func.max(table.c.id))).scalar_one()
+        inserted = table.c.id > (last_id or 0)
+    generated = [table.c.id] + [column for column in table.c if column.computed]
+    result = session.execute(
+        statement.returning(
+            *generated,
+            *(table.c[field] for field in ACTIVITY_NATURAL_KEY),
+            inserted.label("inserted"),
+        ),
+        list(unique_rows.values()),
+    )
+    # matched by natural key, as the order of the returned rows isn't guaranteed
+    upserted = {natural_key(values): values for values in result.mappings()}
+    return [
+        {"id": upserted[key]["id"], **unique_rows[key], **upserted[key]}
+        for key in map(natural_key, rows)
+    ]
+
+
+def upsert_activity(session: Session, row: dict):
+    """upserts one activity (see upsert_activity_rows), first selecting the existing
+    activity with its natural key in the same transaction (and locking it on Postgres,
+    so it can't change before the upsert), as RETURNING only has the upserted values.
+
+    :param row: a dictionary of every activity field
+    :returns: the upserted activity as a dictionary, and the existing activity's values
+    before the upsert (None if there wasn't one)
+    """
+    table = Activity.__table__
+    existing = session.execute(
+        select(table)
+        .where(*(table.c[field] == row[field] for field in ACTIVITY_NATURAL_KEY))
+        .with_for_update()
+    ).mappings()
+    previous = existing.one_or_none()
+    return upsert_activity_rows(session, [row])[0], previous and dict(previous)
+
+
+def rejection_error(error: StatementError):
+    """describes why the database (or the driver, for a value it can't convert) rejected
+    a row, as a "field - message" string in the format of the Activity validation errors
+    where the violated constraint is known"""
+    message = str(error.orig)
+    for constraint, (field, field_error) in ACTIVITY_CONSTRAINT_ERRORS.items():
+        if re.search(rf"\b{constraint}\b", message):
+            return f"{field} - Value error, {field_error}"
+    not_null = NOT_NULL_COLUMN.search(message)
+    if not_null:
+        return f"{not_null.group(1) or not_null.group(2)} - Field required"
+    return f"Rejected by the database: {message.splitlines()[0]}"
+
+
+def fractional_integers(rows: list):
+    """finds the rows with a float that isn't a whole number in an integer field, which
+    the Activity validators reject (as Postgres would round it when inserted).
+
+    :returns: a dictionary of row index to a list with the row's error
+    """
+    return {
+        index: [
+            f"{field} - Input should be a valid integer, got a number with a "
+            "fractional part"
+        ]
+        for index, row in enumerate(rows)
+        for field in INTEGER_FIELDS
+        if isinstance(row[field], float) and not row[field].is_integer()
+    }
+
+
+def find_rejected_rows(session: Session, rows: list, offset: int = 0):
+    """inserts rows in a savepoint, splitting them in half and trying each half again
+    if the database rejects any of them, until each rejected row is found.
+
+    :param offset: the index of the first of rows in the whole batch
+    :returns: a dictionary of row index to a list with the row's error
+    """
+    savepoint = session.begin_nested()
+    try:
+        upsert_activity_rows(session, rows)
+    except StatementError as e:
+        savepoint.rollback()
+        if len(rows) == 1:
+            return {offset: [rejection_error(e)]}
+        middle = len(rows) // 2
+        return {
+            **find_rejected_rows(session, rows[:middle], offset),
+            **find_rejected_rows(session, rows[middle:], offset + middle),
+        }
+    # accepted rows are kept until the search ends, so later rows are checked against
+    # them (as they would be in one INSERT)
+    savepoint.commit()
+    return {}
+
+
+def insert_activities_trusted(session: Session, rows: list):
+    """upserts a batch of activities (see upsert_activity_rows) without validating
+    them in Python, relying on the database's constraints. Either every activity is
+    upserted, or none are.
+
+    :param rows: a list of dictionaries of activity fields. Other keys are ignored,
+    and missing fields are NULL. Dates and times are zero padded, as by the Activity
+    validators.
+    :returns: a list of the upserted activities as dictionaries (with their ids), and
+    a dictionary of row index to a list with the error for each rejected row (the
+    first constraint the row violated)
+    """
+    rows = [{field: row.get(field) for field in ACTIVITY_FIELDS} for row in rows]
+    for row in rows:
+        row["date"] = pad_date(row["date"])
+        row["time"] = pad_time(row["time"])
+    rejects = fractional_integers(rows)
+    if rejects:
+        return [], rejects
+    savepoint = session.begin_nested()
+    try:
+        created = upsert_activity_rows(session, rows)
+    except StatementError as e:
+        error = e
+        savepoint.rollback()
+    else:
+        savepoint.commit()
+        return created, {}
+
+    savepoint = session.begin_nested()
+    rejects = find_rejected_rows(session, rows)
+    savepoint.rollback()
+    if not rejects:
+        # the batch failed for a reason other than its rows (e.g. a lost connection)
+        raise error
+    return [], rejects
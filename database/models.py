@@ -1,7 +1,23 @@
 from datetime import datetime
+from typing import Any, ClassVar, Literal
 from pydantic import field_validator
+from sqlalchemy import (
+    CheckConstraint,
+    Column,
+    Computed,
+    Enum,
+    Float,
+    Index,
+    Integer,
+    UniqueConstraint,
+    case,
+    column,
+    type_coerce,
+)
 from sqlmodel import Field, SQLModel
 
+from database.sql import MatchesFormat, MovingTimeSeconds
+
 
 class UserBase(SQLModel):
     name: str
@@ -12,6 +28,8 @@ class User(UserBase, table=True):
     user_id: int | None = Field(default=None, primary_key=True)
     # name comes from UserBase
     email: str
+    # bumped whenever the user's activities are written, for the ETag of the summary
+    data_version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
 
 
 class UserPublic(UserBase):
@@ -31,38 +49,34 @@ class UserUpdate(UserBase):  # optional updates to a specific user_id
     email: str | None = None
 
 
-class Activity(SQLModel, table=True):
-    __tablename__ = "activity_table"
-    id: int | None = Field(default=None, primary_key=True)
-    user_id: int = Field(foreign_key="user_table.user_id")
-    date: str
-    time: str
-    activity: str
-    activity_type: str
-    moving_time: str
-    distance_km: float
-    perceived_effort: int
-    elevation_m: int | None = None #optional
+class ActivityValidators(SQLModel):
+    # field validators shared by Activity and ActivityUpdate. The same rules are
+    # checked a whole column at a time by database/validation.py for batches.
+    VALID_ACTIVITIES: ClassVar[list] = ["run", "ride"]
 
-    @field_validator('date', mode='before')
+    @field_validator('date', mode='before', check_fields=False)
     @classmethod
     def date_valid(cls, value: str):
         try:
-            datetime.strptime(value, "%Y/%m/%d")
-            return value
+            day = datetime.strptime(value, "%Y/%m/%d")
+            # stored zero padded (e.g. "2025/2/4" as "2025/02/04"), so dates sort, and
+            # fall in their partition, by their string
+            return f"{day.year:04}/{day.month:02}/{day.day:02}"
         except (ValueError, TypeError):
             raise ValueError("Date does not match format 'YYYY/MM/DD'")
 
-    @field_validator('time', mode='before')
+    @field_validator('time', mode='before', check_fields=False)
     @classmethod
     def time_valid(cls, value: str):
         try:
-            datetime.strptime(value, "%H:%M")
-            return value
+            time = datetime.strptime(value, "%H:%M")
+            # stored zero padded (e.g. "9:05" as "09:05"), so a retried activity has
+            # the same natural key (see ACTIVITY_NATURAL_KEY)
+            return f"{time.hour:02}:{time.minute:02}"
         except (ValueError, TypeError):
             raise ValueError("Time does not match format 'HH:MM'")
 
-    @field_validator('moving_time', mode='before')
+    @field_validator('moving_time', mode='before', check_fields=False)
     @classmethod
     def moving_time_valid(cls, value: str):
         try:
@@ -71,15 +85,14 @@ class Activity(SQLModel, table=True):
         except (ValueError, AttributeError):
             raise ValueError("Time does not match format 'HH:MM:SS'")
 
-    @field_validator('activity', mode='before')
+    @field_validator('activity', mode='before', check_fields=False)
     @classmethod
     def activity_valid(cls, value: str):
-        valid_activities = ["run", "ride"]
-        if value not in valid_activities:
-            raise ValueError(f"Activity not in {valid_activities}")
+        if value not in cls.VALID_ACTIVITIES:
+            raise ValueError(f"Activity not in {cls.VALID_ACTIVITIES}")
         return value
         
-    @field_validator('perceived_effort', mode='before')
+    @field_validator('perceived_effort', mode='before', check_fields=False)
     @classmethod
     def perceived_effort_valid(cls, value: int):
         try:
@@ -90,6 +103,114 @@ class Activity(SQLModel, table=True):
             raise ValueError("Perceived_effort not a valid number in the range 1 - 10")
 
 
+# the constraints mirroring the Activity validators in the database, with the field
+# and validator error for rows they reject (used to report trusted ingest rejects)
+ACTIVITY_CONSTRAINT_ERRORS = {
+    "activity_date_format": ("date", "Date does not match format 'YYYY/MM/DD'"),
+    "activity_time_format": ("time", "Time does not match format 'HH:MM'"),
+    "activity_moving_time_format": (
+        "moving_time", "Time does not match format 'HH:MM:SS'"
+    ),
+    "activity_kind": (
+        "activity", f"Activity not in {ActivityValidators.VALID_ACTIVITIES}"
+    ),
+    "activity_perceived_effort_range": (
+        "perceived_effort", "Perceived_effort not in range 1 - 10"
+    ),
+}
+
+# the fields identifying an activity: a user can't start two activities of the same
+# kind at the same time
+ACTIVITY_NATURAL_KEY = ["user_id", "date", "time", "activity"]
+
+
+class Activity(ActivityValidators, table=True):
+    __tablename__ = "activity_table"
+    # the validators are also enforced by the database, so rows inserted without them
+    # (see database/ingest.py) are still checked
+    __table_args__ = (
+        CheckConstraint(
+            MatchesFormat("date", "YYYY/MM/DD"), name="activity_date_format"
+        ),
+        CheckConstraint(MatchesFormat("time", "HH:MM"), name="activity_time_format"),
+        CheckConstraint(
+            MatchesFormat("moving_time", "HH:MM:SS"),
+            name="activity_moving_time_format",
+        ),
+        CheckConstraint(
+            # the CAST rejects fractions, which SQLite stores in an integer column
+            "perceived_effort BETWEEN 1 AND 10 "
+            "AND perceived_effort = CAST(perceived_effort AS INTEGER)",
+            name="activity_perceived_effort_range",
+        ),
+        # for filtering and sorting by pace (e.g. runs faster than 5:00/km)
+        Index("ix_activity_table_activity_pace", "activity", "pace_s_per_km"),
+        # the natural key of an activity, so a retried submission updates the activity
+        # rather than duplicating it (see database/ingest.py). It includes date, which
+        # Postgres requires of unique indexes on the partitioned table.
+        Index("ux_activity_table_natural_key", *ACTIVITY_NATURAL_KEY, unique=True),
+    )
+    id: int | None = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user_table.user_id")
+    date: str
+    time: str
+    # an enum type on Postgres, and a CHECK constraint on other databases
+    activity: str = Field(
+        sa_type=Enum(
+            *ActivityValidators.VALID_ACTIVITIES,
+            name="activity_kind",
+            create_constraint=True,
+        )
+    )
+    activity_type: str
+    moving_time: str
+    distance_km: float
+    perceived_effort: int
+    elevation_m: int | None = None #optional
+    # derived metrics, generated by the database from distance_km and moving_time on
+    # every write, so they can be filtered, sorted and indexed. Pace and speed are
+    # NULL (rather than infinite) when the distance or moving time is 0.
+    moving_time_s: int | None = Field(
+        default=None,
+        sa_column=Column(
+            Integer, Computed(MovingTimeSeconds("moving_time"), persisted=True)
+        ),
+    )
+    pace_s_per_km: float | None = Field(
+        default=None,
+        sa_column=Column(
+            Float,
+            Computed(
+                case(
+                    (
+                        column("distance_km", Float) > 0,
+                        MovingTimeSeconds("moving_time") / column("distance_km", Float),
+                    )
+                ),
+                persisted=True,
+            ),
+        ),
+    )
+    speed_kmh: float | None = Field(
+        default=None,
+        sa_column=Column(
+            Float,
+            Computed(
+                case(
+                    (
+                        MovingTimeSeconds("moving_time") > 0,
+                        column("distance_km", Float)
+                        * 3600
+                        # divided as floats (not numerics), as in Python
+                        / type_coerce(MovingTimeSeconds("moving_time"), Float),
+                    )
+                ),
+                persisted=True,
+            ),
+        ),
+    )
+
+
 class ActivityCreate(SQLModel):
     # auto generated id
     user_id: int
@@ -103,7 +224,7 @@ class ActivityCreate(SQLModel):
     elevation_m: int | None = None  # optional
 
 
-class ActivityUpdate(SQLModel): #optional updates to a specific activity id
+class ActivityUpdate(ActivityValidators): #optional updates to a specific activity id
     user_id: int | None = None
     date: str | None = None
     time: str | None = None
@@ -114,47 +235,174 @@ class ActivityUpdate(SQLModel): #optional updates to a specific activity id
     perceived_effort: int | None = None
     elevation_m: int | None = None
 
-    @field_validator('date', mode='before')
-    @classmethod
-    def date_valid(cls, value: str):
-        try:
-            datetime.strptime(value, "%Y/%m/%d")
-            return value
-        except (ValueError, TypeError):
-            raise ValueError("Date does not match format 'YYYY/MM/DD'")
+class TrainingLoad(SQLModel, table=True):
+    # training load state per user, kept up to date as activities are written
+    __tablename__ = "training_load_table"
+    user_id: int = Field(foreign_key="user_table.user_id", primary_key=True)
+    last_date: str
+    fitness: float
+    fatigue: float
+    recent_distances: str  # comma separated daily distances for the last 28 days
 
-    @field_validator('time', mode='before')
-    @classmethod
-    def time_valid(cls, value: str):
-        try:
-            datetime.strptime(value, "%H:%M")
-            return value
-        except (ValueError, TypeError):
-            raise ValueError("Time does not match format 'HH:MM'")
 
-    @field_validator('moving_time', mode='before')
-    @classmethod
-    def moving_time_valid(cls, value: str):
-        try:
-            hours,  minutes, seconds = map(int, value.split(":"))
-            return value
-        except (ValueError, AttributeError):
-            raise ValueError("Time does not match format 'HH:MM:SS'")
+class TrainingLoadPublic(SQLModel):
+    user_id: int
+    date: str
+    acute_load_km: float
+    chronic_load_km: float
+    acwr: float | None
+    fitness: float
+    fatigue: float
+    form: float
 
-    @field_validator('activity', mode='before')
-    @classmethod
-    def activity_valid(cls, value: str):
-        valid_activities = ["run", "ride"]
-        if value not in valid_activities:
-            raise ValueError(f"Activity not in {valid_activities}")
-        return value
-        
-    @field_validator('perceived_effort', mode='before')
-    @classmethod
-    def perceived_effort_valid(cls, value: int):
-        try:
-            if value < 1 or value > 10:
-                raise ValueError("Perceived_effort not in range 1 - 10")
-            return value
-        except TypeError:
-            raise ValueError("Perceived_effort not a valid number in the range 1 - 10")
\ No newline at end of file
+
+class PersonalRecord(SQLModel, table=True):
+    # best value per user, activity (run/ride) and record, kept up to date as
+    # activities are written. The unique constraint also indexes lookups by user_id.
+    __tablename__ = "personal_records"
+    __table_args__ = (UniqueConstraint("user_id", "activity", "record"),)
+    id: int | None = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user_table.user_id")
+    activity: str
+    record: str
+    value: float
+    # not a foreign key, as records are recomputed after their activity is deleted
+    activity_id: int = Field(index=True)
+    date: str
+
+
+class TrendlineStats(SQLModel, table=True):
+    # running sums for the linear pace trendline of each metric (e.g. distance_km)
+    # per user, kept up to date as activities are written
+    __tablename__ = "trendline_table"
+    user_id: int = Field(foreign_key="user_table.user_id", primary_key=True)
+    metric: str = Field(primary_key=True)
+    n: int = 0
+    sum_x: float = 0.0
+    sum_y: float = 0.0
+    sum_xy: float = 0.0
+    sum_xx: float = 0.0
+
+
+class Trendline(SQLModel):
+    metric: str
+    fit: str
+    n: int
+    slope: float | None
+    intercept: float | None
+
+
+class CalendarDay(SQLModel):
+    date: str
+    count: int
+    distance_km: float
+
+
+class ActivityFrequency(SQLModel):
+    day_of_week: int  # 0 (Monday) to 6 (Sunday)
+    hour: int
+    count: int
+    distance_km: float
+
+
+class ActivityBatchUpdate(ActivityUpdate):  # optional updates to activity id
+    id: int
+
+
+class Job(SQLModel, table=True):
+    # a background job (e.g. an export or a plot), run on the job process pool
+    __tablename__ = "job_table"
+    id: int | None = Field(default=None, primary_key=True)
+    kind: str
+    params: str  # JSON of the job's validated parameters
+    job_key: str = Field(index=True)  # kind and params, to find identical jobs
+    status: str = "queued"  # queued, running, succeeded or failed
+    result: str | None = None  # JSON of the job's result
+    error: str | None = None
+    created_at: datetime
+    completed_at: datetime | None = None
+    expires_at: datetime | None = None  # completed jobs are deleted after this
+
+
+class JobCreate(SQLModel):
+    kind: Literal["export", "plot", "rebuild_state"]
+    params: dict = {}
+
+
+class JobPublic(SQLModel):
+    id: int
+    kind: str
+    params: dict
+    status: str
+    result: Any | None
+    error: str | None
+    created_at: datetime
+    completed_at: datetime | None
+
+
+class ActivityStream(SQLModel, table=True):
+    # per point channels of an activity's track, each stored as a zlib compressed
+    # little-endian array (see database/streams.py). activity_id isn't a foreign key,
+    # as the activity_table may be partitioned (with a primary key of id and date), so
+    # streams are deleted with their activity by the delete endpoints.
+    __tablename__ = "activity_stream_table"
+    activity_id: int = Field(primary_key=True)
+    n_points: int
+    start_time: float  # seconds since the epoch of the first point
+    time: bytes  # int32 seconds since start_time
+    lat: bytes  # float32 degrees
+    lon: bytes  # float32 degrees
+    elevation: bytes | None = None  # float32 metres, NaN where missing
+    heart_rate: bytes | None = None  # int32 beats per minute, 0 where missing
+
+
+class Lap(SQLModel):
+    lap: int
+    distance_km: float
+    moving_time_s: float
+    pace_s_per_km: float | None
+    elevation_change_m: float | None
+
+
+class BestEffort(SQLModel):
+    effort: str
+    distance_km: float
+    moving_time_s: float
+    pace_s_per_km: float
+    start_distance_km: float
+    start_time_s: float
+
+
+class SummaryActivity(SQLModel):
+    id: int
+    date: str
+    time: str
+    activity: str
+    distance_km: float
+    moving_time: str
+    pace_s_per_km: float | None
+
+
+class UserSummary(SQLModel):
+    user_id: int
+    activity_count: int
+    total_distance_km: float
+    total_moving_time_s: int
+    total_elevation_m: int
+    average_distance_km: float | None
+    average_pace_s_per_km: float | None
+    average_perceived_effort: float | None
+    last_activity: SummaryActivity | None
+    # the last 7 days (including today) and the 7 days before
+    week_activity_count: int
+    week_distance_km: float
+    previous_week_activity_count: int
+    previous_week_distance_km: float
+    week_distance_change_pct: float | None
+
+
+class ActivitySplits(SQLModel):
+    activity_id: int
+    splits: list[Lap]
+    laps: list[Lap]
+    best_efforts: list[BestEffort]
@@ -0,0 +1,100 @@
+import json
+import select
+
+from sqlalchemy import Engine, text
+from sqlmodel import Session
+from sqlmodel import select as sql_select
+
+from database.models import User
+
+ACTIVITIES_CHANGED_CHANNEL = "activities_changed"
+
+
+def notify_activities_changed(session: Session, user_ids: set):
+    """sends a Postgres notification on the activities_changed channel with the user_id
+    of each user whose activities have been created, updated or deleted. The
+    notifications are only delivered to listeners when the session's transaction
+    commits. Other databases (e.g. SQLite) have no notifications, so nothing is sent."""
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    for user_id in sorted(user_ids):
+        session.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {
+                "channel": ACTIVITIES_CHANGED_CHANNEL,
+                "payload": json.dumps({"user_id": user_id}),
+            },
+        )
+
+
+def read_data_version(engine: Engine, user_id: int):
+    """returns a user's data_version, which every write to their activities bumps (or
+    None if the user doesn't exist)"""
+    with Session(engine) as session:
+        return session.exec(
+            sql_select(User.data_version).where(User.user_id == user_id)
+        ).first()
+
+
+class ActivityListener:
+    """Checks whether a user's activities have changed (been created, updated or
+    deleted).
+
+    On Postgres this listens for the notifications sent by notify_activities_changed,
+    so checking costs no queries. Other databases fall back to polling the user's
+    data_version, which is a primary key index lookup. Unlike the activities' ids, the
+    data_version also changes when activities are updated or deleted, and when they
+    are committed in a different order to their ids.
+    """
+
+    def __init__(self, engine: Engine, user_id: int, data_version: int | None = None):
+        """
+        :param data_version: the user's data_version when their activities were last
+        read, so changes made before listening started are reported by the first check
+        (default the current data_version)
+        """
+        self.engine = engine
+        self.user_id = int(user_id)
+        self.connection = None
+        if engine.dialect.name == "postgresql":
+            # notifications are only received outside a transaction. The connection's
+            # isolation level is reset when it is returned to the pool, so sessions
+            # that check it out later aren't left in autocommit mode.
+            self.connection = engine.connect().execution_options(
+                isolation_level="AUTOCOMMIT"
+            )
+            self.connection.exec_driver_sql(f"LISTEN {ACTIVITIES_CHANGED_CHANNEL}")
+        # read after listening, so no change is missed in between
+        self.data_version = read_data_version(engine, self.user_id)
+        self.changed = data_version is not None and data_version != self.data_version
+
+    def has_changed(self, timeout: float = 0):
+        """returns True if the user's activities may have changed since the last check,
+        waiting up to timeout seconds for a notification on Postgres"""
+        if self.changed:
+            self.changed = False
+            return True
+        if self.connection is None:
+            data_version = read_data_version(self.engine, self.user_id)
+            changed = data_version != self.data_version
+            self.data_version = data_version
+            return changed
+
+        driver_connection = self.connection.connection.driver_connection
+        readable, _, _ = select.select([driver_connection], [], [], timeout)
+        if not readable:
+            return False
+        driver_connection.poll()
+        notifications = driver_connection.notifies[:]
+        driver_connection.notifies.clear()
+        return any(
+            json.loads(notification.payload)["user_id"] == self.user_id
+            for notification in notifications
+        )
+
+    def close(self):
+        """stops listening and returns the connection to the pool"""
+        if self.connection is not None:
+            self.connection.exec_driver_sql(f"UNLISTEN {ACTIVITIES_CHANGED_CHANNEL}")
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,150 @@
+"""Optional Postgres range partitioning of the activity_table by date.
+
+Partitioning is enabled by setting ACTIVITY_PARTITION_INTERVAL to "month" or "year". The
+activity_table is then created as a partitioned table, with one partition per month (or
+year) from ACTIVITY_PARTITION_START (default "2020/01/01") to ACTIVITY_PARTITIONS_AHEAD
+intervals (default 12) after today, plus a default partition for any other dates.
+Future partitions are created each time the API starts. Queries bounded by date (e.g.
+select_activity_data) then only scan the partitions for those dates.
+
+Dates are stored as zero padded "YYYY/MM/DD" strings (unpadded dates such as "2025/2/4"
+are padded when activities are written), which sort in date order, so the partitions
+are ranges of these strings. Other databases (e.g. SQLite for tests) are unaffected.
+"""
+
+from datetime import date, datetime
+import os
+
+from sqlalchemy import Connection, Engine, inspect, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from database.models import Activity
+
+PARTITION_INTERVALS = ["month", "year"]
+
+
+def next_partition_start(start: date, interval: str):
+    """returns the first day of the partition after the one starting on start"""
+    if interval == "year":
+        return start.replace(year=start.year + 1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_ranges(interval: str, start: date, end: date):
+    """calculates the partitions needed to cover the dates from start to end.
+
+    :param interval: "month" or "year"
+    :returns: a list of tuples (partition name, from date, to date), with dates as
+    "YYYY/MM/DD" strings. Each partition includes its from date and excludes its to date.
+    """
+    if interval not in PARTITION_INTERVALS:
+        raise ValueError(f"Partition interval not in {PARTITION_INTERVALS}")
+    partition_start = start.replace(day=1)
+    if interval == "year":
+        partition_start = partition_start.replace(month=1)
+    name_format = "%Y" if interval == "year" else "%Y_%m"
+    ranges = []
+    while partition_start <= end:
+        partition_end = next_partition_start(partition_start, interval)
+        ranges.append(
+            (
+                f"{Activity.__tablename__}_{partition_start.strftime(name_format)}",
+                partition_start.strftime("%Y/%m/%d"),
+                partition_end.strftime("%Y/%m/%d"),
+            )
+        )
+        partition_start = partition_end
+    return ranges
+
+
+def partitioned_activity_table_ddl(dialect):
+    """returns the CREATE TABLE statement for a partitioned activity_table, generated
+    from the Activity model so that it includes all of its columns and constraints.
+    Postgres requires the partition key (date) to be part of the primary key."""
+    ddl = str(CreateTable(Activity.__table__).compile(dialect=dialect)).strip()
+    primary_key = "PRIMARY KEY (id)"
+    if primary_key not in ddl:
+        raise ValueError("Unexpected activity_table primary key")
+    ddl = ddl.replace(primary_key, "PRIMARY KEY (id, date)")
+    return f"{ddl} PARTITION BY RANGE (date)"
+
+
+def create_partitioned_activity_table(connection: Connection):
+    """creates the activity_table as a partitioned table, with its indexes and a
+    default partition"""
+    # the table is created from text, so its enum type isn't created with it
+    Activity.__table__.c.activity.type.create(connection, checkfirst=True)
+    connection.execute(text(partitioned_activity_table_ddl(connection.dialect)))
+    for index in Activity.__table__.indexes:
+        connection.execute(CreateIndex(index))
+    connection.execute(
+        text(
+            f"CREATE TABLE {Activity.__tablename__}_default "
+            f"PARTITION OF {Activity.__tablename__} DEFAULT"
+        )
+    )
+
+
+def ensure_activity_partitions(
+    connection: Connection,
+    interval: str,
+    start: date,
+    partitions_ahead: int,
+    today: date | None = None,
+):
+    """creates any missing partitions from start to partitions_ahead intervals after
+    today. Rows already in the default partition for a new partition's dates are moved
+    into the new partition."""
+    end = today or date.today()
+    for _ in range(partitions_ahead):
+        end = next_partition_start(end.replace(day=1), interval)
+    existing = set(inspect(connection).get_table_names())
+    table = Activity.__tablename__
+    # generated columns (e.g. pace_s_per_km) can't be inserted, so are recalculated
+    columns = ", ".join(
+        column.name for column in Activity.__table__.c if column.computed is None
+    )
+    for name, from_date, to_date in partition_ranges(interval, start, end):
+        if name in existing:
+            continue
+        connection.execute(
+            text(
+                f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS "
+                "INCLUDING CONSTRAINTS INCLUDING GENERATED)"
+            )
+        )
+        connection.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {table}_default "
+                "WHERE date >= :from_date AND date < :to_date RETURNING *) "
+                f"INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+            ),
+            {"from_date": from_date, "to_date": to_date},
+        )
+        connection.execute(
+            text(
+                f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{from_date}') TO ('{to_date}')"
+            )
+        )
+
+
+def setup_activity_partitioning(engine: Engine):
+    """creates the partitioned activity_table (if it doesn't exist yet) and its future
+    partitions, when partitioning is enabled on Postgres. This must run before
+    SQLModel.metadata.create_all, which would create an unpartitioned table."""
+    interval = os.getenv("ACTIVITY_PARTITION_INTERVAL")
+    if not interval or engine.dialect.name != "postgresql":
+        return
+    start = datetime.strptime(
+        os.getenv("ACTIVITY_PARTITION_START", "2020/01/01"), "%Y/%m/%d"
+    ).date()
+    partitions_ahead = int(os.getenv("ACTIVITY_PARTITIONS_AHEAD", "12"))
+    with engine.begin() as connection:
+        if not inspect(connection).has_table(Activity.__tablename__):
+            # the table's foreign key needs the user_table to exist first
+            Activity.metadata.tables["user_table"].create(connection, checkfirst=True)
+            create_partitioned_activity_table(connection)
+        ensure_activity_partitions(connection, interval, start, partitions_ahead)
@@ -0,0 +1,255 @@
+from sqlalchemy import ARRAY, Boolean, Integer, String, any_, bindparam
+from sqlalchemy import column as sql_column
+from sqlalchemy.exc import CompileError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.sql.visitors import InternalTraversal
+
+
+def in_ids(column, ids: list, dialect_name: str):
+    """returns a filter for rows where column is one of the given ids. On Postgres
+    this is "column = ANY(:ids)", which sends the ids as one array parameter, and on
+    other databases "column IN (...)"."""
+    if dialect_name == "postgresql":
+        return column == any_(bindparam("ids", value=list(ids), type_=ARRAY(Integer)))
+    return column.in_(ids)
+
+
+class MatchesFormat(ColumnElement):
+    """A boolean SQL expression that is true where a string column's value is in one
+    of the formats accepted by the Activity validators (see FORMAT_PATTERNS), for CHECK
+    constraints. It is compiled differently for each database:
+
+    - Postgres checks the format with a regular expression, and that dates exist (e.g.
+      not "2025/02/30") with make_date
+    - SQLite has no regular expressions, so the format is checked with GLOB patterns
+      and its string functions, and dates with its date function
+    """
+
+    # only compiled into DDL, so isn't cached
+    inherit_cache = False
+    type = Boolean()
+
+    def __init__(self, column_name: str, format: str):
+        """
+        :param column_name: the column to check
+        :param format: one of FORMAT_PATTERNS
+        """
+        if format not in FORMAT_PATTERNS:
+            raise ValueError(f"Format not in {list(FORMAT_PATTERNS)}")
+        self.column = sql_column(column_name)
+        self.format = format
+
+
+# regular expressions for the formats accepted by the Activity validators: the
+# datetime.strptime formats "%Y/%m/%d" and "%H:%M", and three integers separated by
+# colons for moving times
+FORMAT_PATTERNS = {
+    "YYYY/MM/DD": r"^[0-9]{4}/(1[0-2]|0?[1-9])/(3[01]|[12][0-9]|0?[1-9]| [1-9])$",
+    "HH:MM": r"^(2[0-3]|[01]?[0-9]):[0-5]?[0-9]$",
+    "HH:MM:SS": r"^ *[+-]?[0-9]+ *: *[+-]?[0-9]+ *: *[+-]?[0-9]+ *$",
+}
+# the same formats as GLOB patterns for each part, for SQLite (which has no regular
+# expressions)
+DATE_PART_GLOBS = (
+    ["[0-9][0-9][0-9][0-9]"],
+    ["[1-9]", "0[1-9]", "1[0-2]"],
+    ["[1-9]", "0[1-9]", "[12][0-9]", "3[01]", " [1-9]"],
+)
+TIME_PART_GLOBS = (["[0-9]", "[01][0-9]", "2[0-3]"], ["[0-9]", "[0-5][0-9]"])
+
+
+@compiles(MatchesFormat, "postgresql")
+def compile_matches_format_postgresql(element: MatchesFormat, compiler, **kw):
+    column_sql = compiler.process(element.column, **kw)
+    pattern_sql = f"{column_sql} ~ '{FORMAT_PATTERNS[element.format]}'"
+    if element.format != "YYYY/MM/DD":
+        return f"({pattern_sql})"
+    year, month, day = (
+        f"trim(split_part({column_sql}, '/', {part}))::int" for part in (1, 2, 3)
+    )
+    # CASE checks the format before the date is built, as AND may be evaluated in any
+    # order, and make_date raises an error for year 0
+    return (
+        f"(CASE WHEN NOT ({pattern_sql}) THEN false WHEN {year} < 1 THEN false "
+        f"ELSE {day} <= extract(day from make_date({year}, {month}, 1) "
+        "+ interval '1 month - 1 day') END)"
+    )
+
+
+def sqlite_globs(value_sql: str, part_globs: tuple, separator: str):
+    """returns SQLite SQL that is true where a value matches any combination of the
+    GLOB patterns for each part, joined by separator"""
+    globs = part_globs[0]
+    for patterns in part_globs[1:]:
+        globs = [
+            f"{glob}{separator}{pattern}" for glob in globs for pattern in patterns
+        ]
+    return "(" + " OR ".join(f"{value_sql} GLOB '{glob}'" for glob in globs) + ")"
+
+
+def sqlite_integer(value_sql: str):
+    """returns SQLite SQL that is true where a value is an integer as parsed by int()
+    (digits with an optional sign, and surrounding spaces)"""
+    trimmed = f"trim({value_sql})"
+    return (
+        f"({trimmed} <> '' AND {trimmed} NOT GLOB '*[^0-9]*' "
+        f"OR substr({trimmed}, 1, 1) IN ('+', '-') AND length({trimmed}) > 1 "
+        f"AND substr({trimmed}, 2) NOT GLOB '*[^0-9]*')"
+    )
+
+
+def sqlite_split(value_sql: str, separator: str, parts: int):
+    """returns SQLite SQL expressions for the first parts of a value split on separator
+    (the last part is the rest of the value)"""
+    split = []
+    rest = value_sql
+    for _ in range(parts - 1):
+        split.append(f"substr({rest}, 1, instr({rest}, '{separator}') - 1)")
+        rest = f"substr({rest}, instr({rest}, '{separator}') + 1)"
+    return split + [rest]
+
+
+def sqlite_date_parts(value_sql: str):
+    """returns SQLite SQL expressions for the integer year, month and day of a
+    "YYYY/MM/DD" value"""
+    return tuple(
+        f"CAST(trim({part}) AS INTEGER)" for part in sqlite_split(value_sql, "/", 3)
+    )
+
+
+@compiles(MatchesFormat, "sqlite")
+def compile_matches_format_sqlite(element: MatchesFormat, compiler, **kw):
+    column_sql = compiler.process(element.column, **kw)
+    if element.format == "HH:MM":
+        return sqlite_globs(column_sql, TIME_PART_GLOBS, ":")
+    if element.format == "HH:MM:SS":
+        separators = f"length({column_sql}) - length(replace({column_sql}, ':', ''))"
+        parts = sqlite_split(column_sql, ":", 3)
+        return (
+            f"({separators} = 2 AND " + " AND ".join(map(sqlite_integer, parts)) + ")"
+        )
+    # date(..., '+0 days') normalises days past the end of the month (e.g. February 30
+    # becomes March 2), so only dates that exist are unchanged by it
+    year, month, day = sqlite_date_parts(column_sql)
+    iso_date = f"printf('%04d-%02d-%02d', {year}, {month}, {day})"
+    return (
+        f"({sqlite_globs(column_sql, DATE_PART_GLOBS, '/')} AND {year} >= 1 "
+        f"AND date({iso_date}, '+0 days') = {iso_date})"
+    )
+
+
+@compiles(MatchesFormat)
+def compile_matches_format(element: MatchesFormat, compiler, **kw):
+    raise CompileError(
+        f"Format checks are not supported by the {compiler.dialect.name} database"
+    )
+
+
+class MovingTimeSeconds(ColumnElement):
+    """An integer SQL expression for the number of seconds in a "HH:MM:SS" moving time
+    column (as calculated by calculate_time_secs), for generated columns. The column's
+    format is checked by MatchesFormat, so every part is an integer."""
+
+    # only compiled into DDL, so isn't cached
+    inherit_cache = False
+    type = Integer()
+
+    def __init__(self, column_name: str):
+        self.column = sql_column(column_name)
+
+
+@compiles(MovingTimeSeconds, "postgresql")
+def compile_moving_time_seconds_postgresql(element: MovingTimeSeconds, compiler, **kw):
+    column_sql = compiler.process(element.column, **kw)
+    hours, minutes, seconds = (
+        f"split_part({column_sql}, ':', {part})::int" for part in (1, 2, 3)
+    )
+    return f"({hours} * 3600 + {minutes} * 60 + {seconds})"
+
+
+@compiles(MovingTimeSeconds, "sqlite")
+def compile_moving_time_seconds_sqlite(element: MovingTimeSeconds, compiler, **kw):
+    column_sql = compiler.process(element.column, **kw)
+    hours, minutes, seconds = (
+        f"CAST({part} AS INTEGER)" for part in sqlite_split(column_sql, ":", 3)
+    )
+    return f"({hours} * 3600 + {minutes} * 60 + {seconds})"
+
+
+@compiles(MovingTimeSeconds)
+def compile_moving_time_seconds(element: MovingTimeSeconds, compiler, **kw):
+    raise CompileError(
+        f"Moving times are not supported by the {compiler.dialect.name} database"
+    )
+
+
+class DatePart(ColumnElement):
+    """An SQL expression for a part of an activity's "YYYY/MM/DD" date or "HH:MM" time
+    column, for grouping activities in queries. Dates and times are zero padded when
+    written (and by the upgrade for rows written before, see database/upgrade.py), but
+    the database's constraints also accept a space padded day (e.g. "2025/02/ 4") from
+    trusted inserts, so the column's values are parsed rather than compared as
+    strings. Parts (see DATE_PARTS):
+
+    - date: the date as "YYYY/MM/DD", with the month and day zero padded
+    - day_of_week: the day of the week of a date, from 0 (Monday) to 6 (Sunday), as
+      datetime.weekday
+    - hour: the hour of a time, from 0 to 23
+    """
+
+    inherit_cache = True
+    _traverse_internals = [
+        ("column", InternalTraversal.dp_clauseelement),
+        ("part", InternalTraversal.dp_string),
+    ]
+
+    def __init__(self, column, part: str):
+        """
+        :param column: the date or time column (e.g. Activity.date)
+        :param part: one of DATE_PARTS
+        """
+        if part not in DATE_PARTS:
+            raise ValueError(f"Part not in {list(DATE_PARTS)}")
+        self.column = column
+        self.part = part
+        self.type = DATE_PARTS[part]
+
+    @property
+    def _from_objects(self):
+        # the column's table, so it's in the FROM clause of queries
+        return self.column._from_objects
+
+
+DATE_PARTS = {"date": String(), "day_of_week": Integer(), "hour": Integer()}
+
+
+@compiles(DatePart, "postgresql")
+def compile_date_part_postgresql(element: DatePart, compiler, **kw):
+    column_sql = compiler.process(element.column, **kw)
+    if element.part == "hour":
+        return f"split_part({column_sql}, ':', 1)::int"
+    date_sql = f"to_date({column_sql}, 'YYYY/MM/DD')"
+    if element.part == "date":
+        return f"to_char({date_sql}, 'YYYY/MM/DD')"
+    return f"(extract(isodow from {date_sql})::int - 1)"
+
+
+@compiles(DatePart, "sqlite")
+def compile_date_part_sqlite(element: DatePart, compiler, **kw):
+    column_sql = compiler.process(element.column, **kw)
+    if element.part == "hour":
+        return f"CAST({sqlite_split(column_sql, ':', 2)[0]} AS INTEGER)"
+    year, month, day = sqlite_date_parts(column_sql)
+    if element.part == "date":
+        return f"printf('%04d/%02d/%02d', {year}, {month}, {day})"
+    # strftime's %w is 0 for Sunday
+    iso_date = f"printf('%04d-%02d-%02d', {year}, {month}, {day})"
+    return f"((CAST(strftime('%w', {iso_date}) AS INTEGER) + 6) % 7)"
+
+
+@compiles(DatePart)
+def compile_date_part(element: DatePart, compiler, **kw):
+    raise CompileError(
+        f"Date parts are not supported by the {compiler.dialect.name} database"
+    )
@@ -0,0 +1,108 @@
+"""Compact storage of activity streams (per point track channels).
+
+Each channel is stored as one zlib compressed little-endian float32 or int32 array, so
+an hour long track of per second points is one row of a few tens of KB rather than
+3600 rows. Channels are decoded with np.frombuffer, without creating a Python object per
+point, and only the requested channel columns are queried.
+"""
+
+import zlib
+
+import numpy as np
+from sqlalchemy import delete, select
+from sqlmodel import Session
+
+from database.models import ActivityStream
+from database.sql import in_ids
+
+# numpy dtype of each channel
+STREAM_CHANNELS = {
+    "time": "<i4",
+    "lat": "<f4",
+    "lon": "<f4",
+    "elevation": "<f4",
+    "heart_rate": "<i4",
+}
+
+
+def encode_channel(values, channel: str):
+    """encodes a channel's values as a compressed little-endian array"""
+    array = np.ascontiguousarray(values, dtype=STREAM_CHANNELS[channel])
+    return zlib.compress(array.tobytes())
+
+
+def decode_channel(data: bytes, channel: str):
+    """decodes a compressed channel into a (read only) numpy array"""
+    return np.frombuffer(zlib.decompress(data), dtype=STREAM_CHANNELS[channel])
+
+
+def encode_track_stream(track: dict):
+    """encodes the points of a parsed track (the output of parse_track) as the columns
+    of an ActivityStream. Missing elevations are stored as NaN and missing heart rates
+    as 0, and a channel is None if the track has no values for it.
+
+    :returns: a dictionary of ActivityStream column values, without the activity_id
+    """
+    times = track["times"]
+    start_time = float(times[0]) if len(times) else 0.0
+    stream = {
+        "n_points": len(times),
+        "start_time": start_time,
+        "time": encode_channel(np.rint(times - start_time), "time"),
+        "lat": encode_channel(track["latitudes"], "lat"),
+        "lon": encode_channel(track["longitudes"], "lon"),
+        "elevation": None,
+        "heart_rate": None,
+    }
+    elevations = track.get("elevations")
+    if elevations is not None and len(elevations) and not np.isnan(elevations).all():
+        stream["elevation"] = encode_channel(elevations, "elevation")
+    heart_rates = track.get("heart_rates")
+    if heart_rates is not None and len(heart_rates) and not np.isnan(heart_rates).all():
+        stream["heart_rate"] = encode_channel(
+            np.nan_to_num(heart_rates, nan=0), "heart_rate"
+        )
+    return stream
+
+
+def save_activity_stream(session: Session, activity_id: int, stream: dict):
+    """adds an activity's encoded stream (the output of encode_track_stream) to the
+    session, replacing any stream it already has (e.g. if its track was uploaded
+    again)"""
+    session.merge(ActivityStream(activity_id=activity_id, **stream))
+
+
+def load_activity_stream(
+    session: Session, activity_id: int, channels: list | None = None
+):
+    """loads an activity's stream, querying only the requested channels.
+
+    :param channels: the channels to load (default all of STREAM_CHANNELS)
+    :returns: a dictionary with keys start_time, n_points and each channel (a numpy
+    array, or None if the track has no values for it), or None if the activity has no
+    stream
+    """
+    channels = list(STREAM_CHANNELS) if channels is None else channels
+    columns = ActivityStream.__table__.c
+    row = session.execute(
+        select(
+            columns.start_time, columns.n_points, *(columns[c] for c in channels)
+        ).where(columns.activity_id == activity_id)
+    ).first()
+    if row is None:
+        return None
+    stream = {"start_time": row.start_time, "n_points": row.n_points}
+    for channel in channels:
+        data = row._mapping[channel]
+        stream[channel] = None if data is None else decode_channel(data, channel)
+    return stream
+
+
+def delete_activity_streams(session: Session, activity_ids: list):
+    """deletes the streams of the given activities"""
+    dialect_name = session.get_bind().dialect.name
+    session.execute(
+        delete(ActivityStream.__table__).where(
+            in_ids(ActivityStream.__table__.c.activity_id, activity_ids, dialect_name)
+        )
+    )
@@ -0,0 +1,288 @@
+"""Upgrades tables created by earlier versions of the models.
+
+SQLModel.metadata.create_all only creates tables that don't exist yet, so the columns
+and indexes added to the models since a table was created are added here, each time
+the API starts (see create_db_and_tables). Every step checks what the database already
+has, so running the upgrade again does nothing.
+
+New columns must be nullable, generated or have a server default, so they can be added
+to tables with rows. SQLite can't add stored generated columns to an existing table, so
+they are added as virtual columns there, computed when read (and still indexable).
+
+Missing CHECK constraints are added on Postgres NOT VALID, so adding one doesn't wait
+for the existing rows to be checked, then validated. A constraint some existing rows
+violate stays NOT VALID, still checking new rows, and a warning is logged. SQLite can't
+add constraints to an existing table, so trusted inserts (see database/ingest.py) are
+refused while any are missing (see missing_constraints).
+
+Dates and times are zero padded on write (e.g. "2025/2/4" as "2025/02/04" and "9:05"
+as "09:05"). Activities written before that are padded here, so that they sort (and on
+Postgres, fall in their partition) by their string. Padding is done before the natural
+key's unique index is created, so the index sees each activity's stored key.
+
+Activity tables created before the unique index on the natural key (see
+ACTIVITY_NATURAL_KEY) may have duplicate activities (e.g. retried submissions, or the
+same activity with and without padding), which would stop the index being created. As
+deleting them loses data, the upgrade at startup raises DuplicateActivitiesError
+instead, and upgrade_db.py lists the duplicates, or exports and deletes them when asked.
+"""
+
+import logging
+from typing import Callable
+from sqlalchemy import (
+    CheckConstraint,
+    Connection,
+    Engine,
+    Table,
+    delete,
+    inspect,
+    bindparam,
+    func,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateColumn
+from sqlmodel import Session
+
+from database.models import ACTIVITY_NATURAL_KEY, Activity, User
+from database.sql import in_ids
+from database.streams import delete_activity_streams
+from database.validation import pad_date, pad_time
+
+# the tables upgraded, in order
+UPGRADED_TABLES = [User.__table__, Activity.__table__]
+NATURAL_KEY_INDEX = "ux_activity_table_natural_key"
+# the fields zero padded on write, with their padded width and padding
+PADDED_FIELDS = {
+    "date": (len("YYYY/MM/DD"), pad_date),
+    "time": (len("HH:MM"), pad_time),
+}
+
+logger = logging.getLogger(__name__)
+
+
+class DuplicateActivitiesError(Exception):
+    """Raised when existing activities have the same natural key, so its unique index
+    can't be created"""
+
+    def __init__(self, count: int):
+        super().__init__(
+            f"{count} activities have the natural key of an earlier activity. Run "
+            "python upgrade_db.py to list them, and python upgrade_db.py "
+            "--delete-duplicates EXPORT_FILE to delete them."
+        )
+        self.count = count
+
+
+def column_definition(connection: Connection, column):
+    """returns a column's definition for ALTER TABLE ... ADD COLUMN"""
+    definition = str(CreateColumn(column).compile(dialect=connection.dialect))
+    if connection.dialect.name == "sqlite" and column.computed is not None:
+        definition = definition.replace(" STORED", " VIRTUAL")
+    return definition
+
+
+def add_missing_columns(connection: Connection, table: Table):
+    """adds the columns of a table's model that the table doesn't have"""
+    existing = {
+        column["name"] for column in inspect(connection).get_columns(table.name)
+    }
+    for column in table.columns:
+        if column.name not in existing:
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table.name} "
+                    f"ADD COLUMN {column_definition(connection, column)}"
+                )
+            )
+
+
+def add_missing_indexes(connection: Connection, table: Table):
+    """creates the indexes of a table's model that the table doesn't have"""
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def missing_constraints(connection: Connection, table: Table):
+    """returns the CHECK constraints of a table's model that the table doesn't have. On
+    Postgres, the constraint of an enum (e.g. activity_kind) is its column's type."""
+    inspector = inspect(connection)
+    existing = {
+        constraint["name"] for constraint in inspector.get_check_constraints(table.name)
+    }
+    existing |= {
+        getattr(column["type"], "name", None)
+        for column in inspector.get_columns(table.name)
+    }
+    return [
+        constraint
+        for constraint in table.constraints
+        if isinstance(constraint, CheckConstraint) and constraint.name not in existing
+    ]
+
+
+def add_missing_constraints(connection: Connection, table: Table):
+    """adds the CHECK constraints of a table's model that the table doesn't have, on
+    Postgres, validating each against the existing rows where they all satisfy it"""
+    if connection.dialect.name != "postgresql":
+        return
+    for constraint in missing_constraints(connection, table):
+        check_sql = constraint.sqltext.compile(
+            dialect=connection.dialect, compile_kwargs={"literal_binds": True}
+        )
+        connection.exec_driver_sql(
+            f"ALTER TABLE {table.name} ADD CONSTRAINT {constraint.name} "
+            f"CHECK ({check_sql}) NOT VALID"
+        )
+        try:
+            with connection.begin_nested():
+                connection.exec_driver_sql(
+                    f"ALTER TABLE {table.name} VALIDATE CONSTRAINT {constraint.name}"
+                )
+        except DBAPIError as e:
+            logger.warning(
+                "Existing rows of %s violate %s, so it only checks new rows: %s",
+                table.name,
+                constraint.name,
+                str(e.orig).splitlines()[0],
+            )
+
+
+def unpadded_values(connection: Connection, field: str):
+    """returns the (id, value) of each activity whose value of a padded field (see
+    PADDED_FIELDS) is shorter than its padded width (e.g. "9:05" for a time), as it
+    was written before the field was zero padded on write"""
+    activities = Activity.__table__
+    column = activities.c[field]
+    width, _ = PADDED_FIELDS[field]
+    return connection.execute(
+        select(activities.c.id, column).where(func.length(column) < width)
+    ).all()
+
+
+def pad_activity_values(connection: Connection, field: str, unpadded: list):
+    """zero pads the given (id, value) of a padded field (see unpadded_values)"""
+    if not unpadded:
+        return
+    activities = Activity.__table__
+    _, pad = PADDED_FIELDS[field]
+    connection.execute(
+        update(activities)
+        .where(activities.c.id == bindparam("activity_id"))
+        .values({field: bindparam("padded")}),
+        [
+            {"activity_id": activity_id, "padded": pad(value)}
+            for activity_id, value in unpadded
+        ],
+    )
+
+
+def padded_key(values):
+    """returns an activity's natural key (see ACTIVITY_NATURAL_KEY) as a tuple, with
+    its date and time zero padded as they are on write"""
+    return tuple(
+        (
+            PADDED_FIELDS[field][1](values[field])
+            if field in PADDED_FIELDS
+            else values[field]
+        )
+        for field in ACTIVITY_NATURAL_KEY
+    )
+
+
+def find_duplicate_activities(connection: Connection):
+    """finds every activity with the natural key (once zero padded) of an activity with
+    a lower id, which stop the natural key's unique index being created.
+
+    :returns: a list of the duplicate activities' values, in order of id
+    """
+    activities = Activity.__table__
+    # the table may not have the columns added since (see add_missing_columns)
+    existing = [
+        activities.c[column["name"]]
+        for column in inspect(connection).get_columns(activities.name)
+        if column["name"] in activities.c
+    ]
+    keys = connection.execute(
+        select(
+            activities.c.id, *(activities.c[field] for field in ACTIVITY_NATURAL_KEY)
+        ).order_by(activities.c.id)
+    ).mappings()
+    seen = set()
+    duplicate_ids = []
+    for values in keys:
+        key = padded_key(values)
+        if key in seen:
+            duplicate_ids.append(values["id"])
+        seen.add(key)
+    if not duplicate_ids:
+        return []
+    duplicates = connection.execute(
+        select(*existing)
+        .where(in_ids(activities.c.id, duplicate_ids, connection.dialect.name))
+        .order_by(activities.c.id)
+    ).mappings()
+    return [dict(values) for values in duplicates]
+
+
+def delete_activities(session: Session, ids: list):
+    """deletes activities and their streams, without updating derived state"""
+    activities = Activity.__table__
+    session.execute(
+        delete(activities).where(
+            in_ids(activities.c.id, ids, session.get_bind().dialect.name)
+        )
+    )
+    delete_activity_streams(session, ids)
+
+
+def upgrade_activity_keys(
+    connection: Connection, after_delete: Callable[[Session, list], None] | None
+):
+    """zero pads the dates and times of existing activities, first checking that no
+    two activities have the same natural key once padded, if there are any to pad or
+    the natural key's unique index doesn't exist yet. Duplicate activities are only
+    deleted if after_delete is given (see upgrade_tables).
+
+    :raises: DuplicateActivitiesError if there are duplicate activities and no
+    after_delete
+    """
+    unpadded = {field: unpadded_values(connection, field) for field in PADDED_FIELDS}
+    indexes = {
+        index["name"]
+        for index in inspect(connection).get_indexes(Activity.__tablename__)
+    }
+    if NATURAL_KEY_INDEX not in indexes or any(unpadded.values()):
+        duplicates = find_duplicate_activities(connection)
+        if duplicates and after_delete is None:
+            raise DuplicateActivitiesError(len(duplicates))
+        if duplicates:
+            with Session(bind=connection) as session:
+                delete_activities(session, [values["id"] for values in duplicates])
+                after_delete(session, duplicates)
+                session.flush()
+    for field, values in unpadded.items():
+        pad_activity_values(connection, field, values)
+
+
+def upgrade_tables(
+    engine: Engine, after_delete: Callable[[Session, list], None] | None = None
+):
+    """adds any missing columns, indexes and constraints to existing tables, and pads
+    the dates and times of existing activities, in one transaction.
+
+    :param after_delete: if given, duplicate activities are deleted (with their
+    streams), then after_delete is called with a session and their values, e.g. to
+    export them and rebuild derived state
+    :raises: DuplicateActivitiesError if there are duplicate activities and no
+    after_delete, before anything is changed
+    """
+    with engine.begin() as connection:
+        for table in UPGRADED_TABLES:
+            add_missing_columns(connection, table)
+            if table is Activity.__table__:
+                upgrade_activity_keys(connection, after_delete)
+            add_missing_indexes(connection, table)
+            add_missing_constraints(connection, table)
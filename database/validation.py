@@ -0,0 +1,175 @@
+"""Validates batches of activities a whole column at a time.
+
+Validating each row with Activity.model_validate calls datetime.strptime and str.split
+once per field per row, which dominates the time of bulk loads. Here the rules of the
+ActivityValidators in database/models.py are checked for every row of a batch at once,
+with vectorized pandas string matching, date parsing and numpy range checks.
+
+The vectorized checks are stricter than the model (e.g. a perceived_effort of "5" or a
+date of " 2025/2/4" is flagged), so only the rows they flag, usually none, are validated
+with the Activity model. That decides whether the row is valid and gives the same error
+messages, per row and per field, as POST /activities/.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from database.models import Activity, ActivityCreate, ActivityValidators
+
+ACTIVITY_FIELDS = list(ActivityCreate.model_fields)
+# a date with its parts in groups, which may not be zero padded (e.g. "2025/2/4")
+DATE_PARTS = re.compile(r"([0-9]{4})/([0-9]{1,2})/([0-9]{1,2})")
+# a time with its parts in groups, which may not be zero padded (e.g. "9:05")
+TIME_PARTS = re.compile(r"([0-9]{1,2}):([0-9]{1,2})")
+
+
+def pad_date(value):
+    """zero pads the month and day of a "YYYY/M/D" date string, as the Activity
+    validator does (e.g. "2025/2/4" to "2025/02/04"). Other values are returned
+    unchanged, for the database's constraints to check."""
+    match = DATE_PARTS.fullmatch(value) if isinstance(value, str) else None
+    if match is None:
+        return value
+    year, month, day = match.groups()
+    return f"{year}/{int(month):02}/{int(day):02}"
+
+
+def pad_time(value):
+    """zero pads the hour and minute of a "H:M" time string, as the Activity validator
+    does (e.g. "9:5" to "09:05"). Other values are returned unchanged, for the
+    database's constraints to check."""
+    match = TIME_PARTS.fullmatch(value) if isinstance(value, str) else None
+    if match is None:
+        return value
+    hour, minute = match.groups()
+    return f"{int(hour):02}:{int(minute):02}"
+
+
+def format_errors(error: ValueError):
+    """formats the errors of a failed model validation as "field - message" strings,
+    as in the 422 responses of POST /activities/"""
+    return [f"{err['loc'][0]} - {err['msg']}" for err in error.errors()]
+
+
+def is_string(column: pd.Series):
+    """returns a numpy boolean array, True where a value is a string"""
+    if column.dtype != object:
+        return np.zeros(len(column), dtype=bool)
+    return column.map(type).to_numpy() == str
+
+
+def matches(column: pd.Series, pattern: str):
+    """returns a numpy boolean array, True where a value is a string matching the whole
+    of the regular expression pattern"""
+    if column.dtype != object:
+        return np.zeros(len(column), dtype=bool)
+    return (column.str.fullmatch(pattern) == True).to_numpy()  # NaN for non strings
+
+
+def valid_datetimes(column: pd.Series, pattern: str, format: str):
+    """returns a numpy boolean array, True where a value is a string matching pattern
+    that parses as a real date or time with format (e.g. not "2025/02/30")"""
+    matched = matches(column, pattern)
+    parsed = pd.to_datetime(column.where(matched), format=format, errors="coerce")
+    return matched & parsed.notna().to_numpy()
+
+
+def as_numbers(column: pd.Series):
+    """returns a column's int and float values as a float numpy array, with NaN where
+    a value is missing or isn't an int or float (e.g. a string or a bool)"""
+    if column.dtype.kind in "iuf":
+        return column.to_numpy(dtype=float)
+    if column.dtype != object:
+        return np.full(len(column), np.nan)
+    numeric = column.map(type).isin([int, float])
+    return pd.to_numeric(column.where(numeric), errors="coerce").to_numpy(dtype=float)
+
+
+def whole_numbers(values: np.ndarray, low: float = -np.inf, high: float = np.inf):
+    """returns a numpy boolean array, True where a value is a whole number from low to
+    high"""
+    with np.errstate(invalid="ignore"):
+        return (
+            np.isfinite(values)
+            & (values == np.round(values))
+            & (values >= low)
+            & (values <= high)
+        )
+
+
+def check_columns(data: pd.DataFrame):
+    """checks each field of a batch of activities with vectorized operations.
+
+    :param data: a DataFrame with a column per activity field (NaN where missing)
+    :returns: a numpy boolean array, True for the rows where every field is valid, and
+    a dictionary of field to a list of its values converted to the field's type
+    """
+    user_ids = as_numbers(data["user_id"])
+    distances = as_numbers(data["distance_km"])
+    efforts = as_numbers(data["perceived_effort"])
+    elevations = as_numbers(data["elevation_m"])
+    elevation_missing = data["elevation_m"].isna().to_numpy()
+
+    valid_dates = valid_datetimes(data["date"], DATE_PARTS.pattern, "%Y/%m/%d")
+    valid_times = valid_datetimes(data["time"], TIME_PARTS.pattern, "%H:%M")
+
+    valid = (
+        whole_numbers(user_ids)
+        & valid_dates
+        & valid_times
+        & data["activity"].isin(ActivityValidators.VALID_ACTIVITIES).to_numpy()
+        & is_string(data["activity_type"])
+        & matches(data["moving_time"], r"[0-9]+:[0-9]+:[0-9]+")
+        & np.isfinite(distances)
+        & whole_numbers(efforts, 1, 10)
+        & (elevation_missing | whole_numbers(elevations))
+    )
+    # elevation_m is None where it is missing
+    elevation_values = np.nan_to_num(elevations).astype(np.int64).astype(object)
+    elevation_values[elevation_missing] = None
+    values = {
+        "user_id": np.nan_to_num(user_ids).astype(np.int64),
+        # zero padded, as by the Activity validators
+        "date": data["date"].where(~valid_dates, data["date"].map(pad_date)),
+        "time": data["time"].where(~valid_times, data["time"].map(pad_time)),
+        "activity": data["activity"],
+        "activity_type": data["activity_type"],
+        "moving_time": data["moving_time"],
+        "distance_km": distances,
+        "perceived_effort": np.nan_to_num(efforts).astype(np.int64),
+        "elevation_m": elevation_values,
+    }
+    # tolist converts numpy values to Python ints and floats
+    return valid, {field: column.tolist() for field, column in values.items()}
+
+
+def validate_activity_batch(rows: list):
+    """validates a batch of activities, checking each field for all rows at once.
+
+    :param rows: a list of dictionaries of activity fields (as for POST /activities/).
+    Other keys (e.g. id) are ignored.
+    :returns: a list of the valid activities as dictionaries of their fields (converted
+    to the field types, in the order of rows), and a dictionary of row index to a list
+    of "field - message" errors for each invalid row
+    """
+    if not rows:
+        return [], {}
+    data = pd.DataFrame.from_records(rows, columns=ACTIVITY_FIELDS)
+    valid, values = check_columns(data)
+    activities = [dict(zip(values, row)) for row in zip(*values.values())]
+
+    errors = {}
+    for row in np.flatnonzero(~valid):
+        row_data = {
+            field: rows[row][field] for field in ACTIVITY_FIELDS if field in rows[row]
+        }
+        try:
+            activity = Activity.model_validate(row_data)
+        except ValueError as e:
+            errors[int(row)] = format_errors(e)
+            continue
+        activities[row] = activity.model_dump(include=set(ACTIVITY_FIELDS))
+        valid[row] = True
+    return [activity for activity, ok in zip(activities, valid) if ok], errors
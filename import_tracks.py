@@ -0,0 +1,183 @@
+"""Imports GPX and TCX track files as activities.
+
+Files are parsed on a process pool, and the activities are inserted in batches, each
+in one transaction (with derived state updated as for activities created via the API).
+Activities are inserted in trusted mode, with the database's constraints checking them
+rather than Python validation. Importing a file again updates its activity (matched on
+user, date, time and activity) rather than duplicating it.
+
+    python import_tracks.py <files or directories> --user-id 1 --perceived-effort 5
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
+
+from sqlmodel import Session
+
+from analytics.derived_state import on_activities_created
+from database.database import engine
+from database.ingest import insert_activities_trusted
+from database.models import Activity, User
+from database.streams import encode_track_stream, save_activity_stream
+from database.upgrade import missing_constraints
+from ingestion.track_files import (
+    TRACK_FILE_EXTENSIONS,
+    TrackFileError,
+    activity_from_track,
+    parse_track,
+)
+
+# number of activities inserted in each transaction
+INSERT_BATCH_SIZE = 100
+
+
+def find_track_files(paths: list):
+    """returns the track files in the given paths, including the files in any
+    directories (and their subdirectories)"""
+    track_files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            track_files.append(path)
+            continue
+        for directory, _, file_names in os.walk(path):
+            track_files.extend(
+                os.path.join(directory, file_name)
+                for file_name in sorted(file_names)
+                if file_name.lower().endswith(TRACK_FILE_EXTENSIONS)
+            )
+    return track_files
+
+
+def parse_track_file(path: str, **activity_options):
+    """parses a track file into activity data and its encoded stream (in a worker
+    process), returning a tuple of (path, (activity data, stream), error message)"""
+    try:
+        track = parse_track(path)
+        activity_data = activity_from_track(track, **activity_options)
+        return path, (activity_data, encode_track_stream(track)), None
+    except (TrackFileError, OSError) as e:
+        return path, None, str(e)
+
+
+def insert_activities(session: Session, activities: list):
+    """inserts a batch of activities and their streams in one transaction, updating
+    derived state. The activities are created from the tracks, so they aren't
+    validated in Python: any the database rejects (see insert_activities_trusted) are
+    left out and the rest of the batch is inserted.
+
+    :param activities: a list of (file path, (activity data, stream)) tuples
+    :returns: a list of (file path, error message) for any activities that were
+    rejected
+    """
+    failed = []
+    while True:
+        rows = [activity_data for _, (activity_data, _) in activities]
+        created, rejects = insert_activities_trusted(session, rows)
+        if not rejects:
+            break
+        failed.extend(
+            (activities[row][0], ", ".join(errors)) for row, errors in rejects.items()
+        )
+        activities = [item for row, item in enumerate(activities) if row not in rejects]
+    for values, (_, (_, stream)) in zip(created, activities):
+        save_activity_stream(session, values["id"], stream)
+    on_activities_created(session, created)
+    session.commit()
+    return failed
+
+
+def import_tracks(
+    paths: list,
+    user_id: int,
+    perceived_effort: int,
+    activity: str | None = None,
+    activity_type: str = "road",
+    workers: int | None = None,
+):
+    """imports track files as activities, parsing them on a process pool of workers
+    processes (default the number of CPUs).
+
+    :returns: the number of activities imported, and a list of (file path, error
+    message) for the files that failed
+    :raises: ValueError if the user doesn't exist, or the activity_table is missing
+    any of the constraints trusted inserts rely on (see missing_constraints)
+    """
+    track_files = find_track_files(paths)
+    parse = partial(
+        parse_track_file,
+        user_id=user_id,
+        perceived_effort=perceived_effort,
+        activity=activity,
+        activity_type=activity_type,
+    )
+    imported = 0
+    errors = []
+    batch = []
+    with Session(engine) as session:
+        if session.get(User, user_id) is None:
+            raise ValueError(f"User {user_id} not found")
+        missing = missing_constraints(session.connection(), Activity.__table__)
+        if missing:
+            raise ValueError(
+                "The activity_table is missing the constraints "
+                f"{[constraint.name for constraint in missing]}"
+            )
+        with ProcessPoolExecutor(workers) as executor:
+            results = executor.map(parse, track_files, chunksize=4)
+            for path, activity_data, error in results:
+                if error:
+                    errors.append((path, error))
+                    continue
+                batch.append((path, activity_data))
+                if len(batch) == INSERT_BATCH_SIZE:
+                    failed = insert_activities(session, batch)
+                    imported += len(batch) - len(failed)
+                    errors.extend(failed)
+                    batch = []
+        if batch:
+            failed = insert_activities(session, batch)
+            imported += len(batch) - len(failed)
+            errors.extend(failed)
+    return imported, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Import GPX and TCX track files as activities"
+    )
+    parser.add_argument("paths", nargs="+", help="track files or directories")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument(
+        "--perceived-effort",
+        type=int,
+        required=True,
+        help="1 (very easy) to 10 (very hard), used for every imported activity",
+    )
+    parser.add_argument(
+        "--activity",
+        choices=["run", "ride"],
+        help="activity for every file (default taken from each file)",
+    )
+    parser.add_argument("--activity-type", default="road")
+    parser.add_argument(
+        "--workers", type=int, help="number of parsing processes (default CPUs)"
+    )
+    args = parser.parse_args()
+
+    imported, errors = import_tracks(
+        args.paths,
+        args.user_id,
+        args.perceived_effort,
+        args.activity,
+        args.activity_type,
+        args.workers,
+    )
+    for path, error in errors:
+        print(f"Skipped {path}: {error}")
+    print(f"Imported {imported} activities")
+
+
+if __name__ == "__main__":
+    main()
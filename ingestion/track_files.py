@@ -0,0 +1,197 @@
+"""Creates activities from GPX and TCX track files.
+
+Files are parsed incrementally with iterparse, and each track point is removed from the
+XML tree once its values have been read, so memory only grows with the compact arrays of
+point values (not the XML) on multi-hour tracks.
+"""
+
+from array import array
+from datetime import datetime, timezone
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from analytics.track_metrics import calculate_track_metrics
+
+TRACK_FILE_EXTENSIONS = (".gpx", ".tcx")
+# GPX <type> and TCX Sport values for each activity
+ACTIVITY_SPORTS = {
+    "run": "run",
+    "running": "run",
+    "ride": "ride",
+    "cycling": "ride",
+    "biking": "ride",
+}
+
+
+class TrackFileError(ValueError):
+    """Raised when a track file can't be parsed into an activity"""
+
+
+def local_name(tag: str):
+    """returns an XML tag without its namespace"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_time(value: str):
+    """parses an ISO 8601 track point time (e.g. "2025-03-01T17:30:00Z"), returning
+    the datetime. Times without a UTC offset are taken as UTC."""
+    parsed = datetime.fromisoformat(value.strip())
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def read_gpx_point(element: ET.Element):
+    """reads (latitude, longitude, time, elevation, heart rate) from a GPX trkpt
+    element. Heart rate is read from the Garmin TrackPointExtension (hr)."""
+    values = {local_name(child.tag): child.text for child in element.iter()}
+    return (
+        element.get("lat"),
+        element.get("lon"),
+        values.get("time"),
+        values.get("ele"),
+        values.get("hr"),
+    )
+
+
+def read_tcx_point(element: ET.Element):
+    """reads (latitude, longitude, time, elevation, heart rate) from a TCX Trackpoint
+    element"""
+    values = {}
+    for child in element.iter():
+        values[local_name(child.tag)] = child.text
+    heart_rate = None
+    for child in element:
+        if local_name(child.tag) == "HeartRateBpm" and len(child):
+            heart_rate = child[0].text
+    return (
+        values.get("LatitudeDegrees"),
+        values.get("LongitudeDegrees"),
+        values.get("Time"),
+        values.get("AltitudeMeters"),
+        heart_rate,
+    )
+
+
+POINT_READERS = {"trkpt": read_gpx_point, "Trackpoint": read_tcx_point}
+
+
+def parse_track(source):
+    """parses the track points of a GPX or TCX file. Points without a position or a
+    time are skipped.
+
+    :param source: a file path or a binary file object
+    :returns: a dictionary with keys latitudes, longitudes, times (seconds since the
+    epoch), elevations (metres) and heart_rates (beats per minute) as numpy arrays
+    (NaN where a value is missing), start (datetime of the first point) and sport (the
+    file's activity type, or None)
+    :raises: TrackFileError if the file isn't valid XML
+    """
+    latitudes = array("d")
+    longitudes = array("d")
+    times = array("d")
+    elevations = array("d")
+    heart_rates = array("d")
+    start = None
+    sport = None
+    parents = []
+    try:
+        for event, element in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                parents.append(element)
+                continue
+            parents.pop()
+            name = local_name(element.tag)
+            if name == "type" and parents and local_name(parents[-1].tag) == "trk":
+                sport = element.text
+            elif name == "Activity" and element.get("Sport"):
+                sport = element.get("Sport")
+            elif name in POINT_READERS:
+                latitude, longitude, time, elevation, heart_rate = POINT_READERS[name](
+                    element
+                )
+                # the point is no longer needed, so it's removed from the tree
+                if parents:
+                    parents[-1].remove(element)
+                if latitude is None or longitude is None or time is None:
+                    continue
+                point_time = parse_time(time)
+                start = start or point_time
+                latitudes.append(float(latitude))
+                longitudes.append(float(longitude))
+                times.append(point_time.timestamp())
+                elevations.append(np.nan if elevation is None else float(elevation))
+                heart_rates.append(np.nan if heart_rate is None else float(heart_rate))
+    except (ET.ParseError, ValueError) as e:
+        raise TrackFileError(f"Track file could not be parsed: {e}")
+    return {
+        "latitudes": np.frombuffer(latitudes),
+        "longitudes": np.frombuffer(longitudes),
+        "times": np.frombuffer(times),
+        "elevations": np.frombuffer(elevations),
+        "heart_rates": np.frombuffer(heart_rates),
+        "start": start,
+        "sport": sport,
+    }
+
+
+def format_moving_time(moving_time_s: int):
+    """formats a number of seconds as "HH:MM:SS" """
+    minutes, seconds = divmod(moving_time_s, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+
+def activity_from_track(
+    track: dict,
+    user_id: int,
+    perceived_effort: int,
+    activity: str | None = None,
+    activity_type: str = "road",
+):
+    """creates the data for an activity from a parsed track (the output of
+    parse_track), with its distance, moving time and elevation gain calculated from the
+    track. The activity's date and time are the time of the first track point, as given
+    in the file (usually UTC).
+
+    :param activity: "run" or "ride". If None, this is taken from the track's sport.
+    :returns: a dictionary of the activity's fields (to be validated as an Activity)
+    :raises: TrackFileError if the track has fewer than two points, or the activity
+    isn't given and can't be determined from the track
+    """
+    if len(track["times"]) < 2:
+        raise TrackFileError("Track file has fewer than two points with a time")
+    if activity is None:
+        activity = ACTIVITY_SPORTS.get((track["sport"] or "").strip().lower())
+        if activity is None:
+            raise TrackFileError(
+                f"Activity could not be determined from the file's sport ({track['sport']})"
+            )
+
+    elevations = track["elevations"][~np.isnan(track["elevations"])]
+    metrics = calculate_track_metrics(
+        track["latitudes"],
+        track["longitudes"],
+        track["times"],
+        elevations if len(elevations) else None,
+    )
+    return {
+        "user_id": user_id,
+        "date": track["start"].strftime("%Y/%m/%d"),
+        "time": track["start"].strftime("%H:%M"),
+        "activity": activity,
+        "activity_type": activity_type,
+        "moving_time": format_moving_time(metrics["moving_time_s"]),
+        "distance_km": round(metrics["distance_km"], 2),
+        "perceived_effort": perceived_effort,
+        "elevation_m": (
+            None if metrics["elevation_m"] is None else round(metrics["elevation_m"])
+        ),
+    }
+
+
+def track_to_activity(source, *args, **kwargs):
+    """parses a GPX or TCX file and creates the data for an activity from its track
+    (see parse_track and activity_from_track for the arguments)"""
+    return activity_from_track(parse_track(source), *args, **kwargs)
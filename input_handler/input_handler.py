@@ -3,11 +3,33 @@ import sys
 
 
 def get_user_id():
-    """gets and returns user_id"""
-    user_id = input("Please enter your User ID: ")
+    """gets and returns user_id (or comma separated user ids, to compare users)"""
+    user_id = input("Please enter your User ID (or comma separated IDs to compare): ")
     return user_id
 
 
+def parse_user_ids(user_id: str):
+    """parses an entered user_id, or comma separated user ids (e.g. "1, 2, 3"),
+    returning a list of the user ids as integers without duplicates. Returns None if
+    any of the ids isn't a number."""
+    user_ids = [id.strip() for id in user_id.split(",")]
+    if not all(id.isnumeric() for id in user_ids):
+        return None
+    return list(dict.fromkeys(int(id) for id in user_ids))
+
+
+def get_activity_id():
+    """gets and returns activity_id"""
+    activity_id = input("Please enter the Activity ID: ")
+    return activity_id
+
+
+def get_year():
+    """gets and returns the year to plot"""
+    year = input("Please enter the year to plot (YYYY): ")
+    return year
+
+
 def plot_all_activity_data():
     """gets user input for whether to plot all data or plot
     activities between specific dates. Returns True if
@@ -51,6 +73,10 @@ def plot_activity_input():
     print(" [c] Plot Pace vs Elevation ")
     print(" [d] Plot Pace vs Perceived Effort ")
     print(" [e] Plot Weekly Distance vs Date ")
+    print(" [f] Plot Training Load ")
+    print(" [g] Plot Activity Splits ")
+    print(" [h] Plot Calendar Heatmap ")
+    print(" [i] Plot Activity Frequency (day of week vs time of day) ")
     print(" [x] Exit application ")
     print()
     query = "Please enter the letter of the action you would like to take: "
@@ -0,0 +1,303 @@
+"""Background jobs for expensive work, such as full history exports, plots and derived
+state rebuilds, so they don't run inside request handlers.
+
+Jobs are stored in the job_table and run on a bounded process pool. A request for a job
+identical to one that is queued, running or recently succeeded (same kind and
+parameters, and submitted at the same data_version of the user) returns the existing job
+rather than running it again, so a job isn't reused once the user's activities change. Completed jobs (and
+their results) are kept for JOB_TTL_S seconds, then deleted.
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from typing import Literal
+
+import matplotlib
+from sqlalchemy import delete, update
+from sqlmodel import Session, SQLModel, select
+
+from analytics.derived_state import rebuild_user_state
+from database.database import engine
+from database.models import Job, JobPublic, User
+from visualisation import plots
+from visualisation.plots_utils import (
+    ALL_DATA_END_DATE,
+    ALL_DATA_START_DATE,
+    select_activity_data,
+)
+
+ACTIVE_STATUSES = ["queued", "running"]
+PLOTS = {
+    "pace_vs_date": plots.plot_pace_vs_date,
+    "pace_vs_distance": plots.plot_pace_vs_distance,
+    "pace_vs_elevation": plots.plot_pace_vs_elevation,
+    "pace_vs_perceived_effort": plots.plot_pace_vs_perceived_effort,
+    "weekly_distance": plots.plot_distance_vs_time_weekly,
+    "training_load": plots.plot_training_load,
+    "activity_frequency": plots.plot_activity_frequency,
+}
+
+
+class JobQueueFullError(Exception):
+    """Raised when a job is submitted while the most jobs are already queued"""
+
+
+class ExportJobParams(SQLModel):
+    user_id: int
+    start_date: str = ALL_DATA_START_DATE
+    end_date: str = ALL_DATA_END_DATE
+
+
+class PlotJobParams(SQLModel):
+    user_id: int
+    plot: Literal[tuple(PLOTS)]
+    start_date: str = ALL_DATA_START_DATE
+    end_date: str = ALL_DATA_END_DATE
+    format: Literal["png", "svg", "pdf"] = "png"
+
+
+class RebuildStateJobParams(SQLModel):
+    user_id: int
+
+
+JOB_PARAMS = {
+    "export": ExportJobParams,
+    "plot": PlotJobParams,
+    "rebuild_state": RebuildStateJobParams,
+}
+
+
+def job_output_dir():
+    """returns the directory that job output files (e.g. plots) are saved in, from the
+    JOB_OUTPUT_DIR environment variable (default a fitness_jobs temporary directory)"""
+    output_dir = os.getenv(
+        "JOB_OUTPUT_DIR", os.path.join(tempfile.gettempdir(), "fitness_jobs")
+    )
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+
+def export_job(job_id: int, params: dict):
+    """returns all of a user's activity data between two dates"""
+    return select_activity_data(
+        params["user_id"], params["start_date"], params["end_date"]
+    )
+
+
+def plot_job(job_id: int, params: dict):
+    """saves a plot of a user's activity data, returning the path of the file"""
+    output_path = os.path.join(job_output_dir(), f"job_{job_id}.{params['format']}")
+    PLOTS[params["plot"]](
+        params["user_id"],
+        params["start_date"],
+        params["end_date"],
+        output_path=output_path,
+    )
+    return {"path": output_path}
+
+
+def rebuild_state_job(job_id: int, params: dict):
+    """rebuilds all derived state (training load, records and trendlines) for a user"""
+    with Session(engine) as session:
+        rebuild_user_state(session, params["user_id"])
+        session.commit()
+    return {"user_id": params["user_id"]}
+
+
+JOB_FUNCTIONS = {
+    "export": export_job,
+    "plot": plot_job,
+    "rebuild_state": rebuild_state_job,
+}
+
+
+def init_worker():
+    """sets up a job worker process. Plots are only saved to files, so no window
+    backend is needed."""
+    matplotlib.use("Agg")
+
+
+def run_job(job_id: int, kind: str, params: dict):
+    """runs a job (in a worker process), marking it as running first. Returns the
+    job's result, which must be JSON serialisable."""
+    with Session(engine) as session:
+        session.execute(update(Job).where(Job.id == job_id).values(status="running"))
+        session.commit()
+    return JOB_FUNCTIONS[kind](job_id, params)
+
+
+def job_to_public(job: Job):
+    """converts a stored job to its public form, with its params and result decoded
+    from JSON"""
+    return JobPublic(
+        id=job.id,
+        kind=job.kind,
+        params=json.loads(job.params),
+        status=job.status,
+        result=None if job.result is None else json.loads(job.result),
+        error=job.error,
+        created_at=job.created_at,
+        completed_at=job.completed_at,
+    )
+
+
+class JobManager:
+    """Submits jobs to a bounded process pool and records their results.
+
+    Jobs are saved in the job_table before they are submitted, and their status,
+    result or error are saved when they complete. Workers are started with "spawn" so
+    they don't inherit the API's threads and database connections.
+    """
+
+    def __init__(
+        self,
+        engine,
+        executor=None,
+        max_workers: int = 2,
+        max_queued: int = 100,
+        ttl_s: float = 3600,
+    ):
+        """
+        :param engine: engine for the database the jobs are saved in
+        :param executor: runs the jobs (default a process pool of max_workers)
+        :param max_queued: most jobs queued or running at once
+        :param ttl_s: seconds completed jobs are kept for
+        """
+        self.engine = engine
+        self.executor = executor or ProcessPoolExecutor(
+            max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        )
+        self.max_queued = max_queued
+        self.ttl = timedelta(seconds=ttl_s)
+        self.active_job_ids = set()
+        self.lock = threading.Lock()
+
+    def submit(self, session: Session, kind: str, params: dict):
+        """submits a job, or returns an identical job (see the module docstring) that is
+        queued, running or has succeeded and not yet expired.
+
+        :param kind: one of JOB_PARAMS
+        :param params: parameters for the kind of job. A pydantic ValidationError is
+        raised if they are invalid.
+        :returns: the Job
+        """
+        validated_params = JOB_PARAMS[kind].model_validate(params).model_dump()
+        params_json = json.dumps(validated_params, sort_keys=True)
+        # every kind of job reads the user's activities, so a job is only identical if
+        # they haven't changed since
+        data_version = session.exec(
+            select(User.data_version).where(User.user_id == validated_params["user_id"])
+        ).first()
+        job_key = f"{kind}:{params_json}:{data_version}"
+        with self.lock:
+            self.evict_expired_jobs(session)
+            existing_job = session.exec(
+                select(Job)
+                .where(
+                    Job.job_key == job_key,
+                    Job.status.in_(ACTIVE_STATUSES + ["succeeded"]),
+                )
+                .order_by(Job.id.desc())
+            ).first()
+            if existing_job:
+                return existing_job
+            if len(self.active_job_ids) >= self.max_queued:
+                raise JobQueueFullError(
+                    f"No more than {self.max_queued} jobs can be queued"
+                )
+
+            job = Job(
+                kind=kind,
+                params=params_json,
+                job_key=job_key,
+                created_at=datetime.now(),
+            )
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            self.active_job_ids.add(job.id)
+
+        try:
+            future = self.executor.submit(run_job, job.id, kind, validated_params)
+        except Exception as e:
+            # e.g. the pool is broken or shutting down, so the job would never run
+            failed = Future()
+            failed.set_exception(e)
+            self.on_job_done(job.id, failed)
+            session.refresh(job)
+            return job
+        future.add_done_callback(partial(self.on_job_done, job.id))
+        return job
+
+    def on_job_done(self, job_id: int, future: Future):
+        """saves a completed job's result, or its error if it failed"""
+        now = datetime.now()
+        values = {"completed_at": now, "expires_at": now + self.ttl}
+        try:
+            values["result"] = json.dumps(future.result())
+            values["status"] = "succeeded"
+        except Exception as e:
+            values["error"] = repr(e)
+            values["status"] = "failed"
+        with Session(self.engine) as session:
+            session.execute(update(Job).where(Job.id == job_id).values(**values))
+            session.commit()
+        with self.lock:
+            self.active_job_ids.discard(job_id)
+
+    def evict_expired_jobs(self, session: Session):
+        """deletes completed jobs that have expired, and their output files"""
+        now = datetime.now()
+        expired_jobs = session.exec(select(Job).where(Job.expires_at < now)).all()
+        if not expired_jobs:
+            return
+        for job in expired_jobs:
+            result = json.loads(job.result or "null")
+            if isinstance(result, dict) and "path" in result:
+                try:
+                    os.remove(result["path"])
+                except FileNotFoundError:
+                    pass
+            session.expunge(job)
+        session.execute(delete(Job).where(Job.expires_at < now))
+        session.commit()
+
+    def fail_interrupted_jobs(self):
+        """marks jobs left queued or running by a previous run of the API as failed, as
+        their workers no longer exist"""
+        with Session(self.engine) as session:
+            session.execute(
+                update(Job)
+                .where(Job.status.in_(ACTIVE_STATUSES))
+                .values(
+                    status="failed",
+                    error="Interrupted by an API restart",
+                    completed_at=datetime.now(),
+                    expires_at=datetime.now() + self.ttl,
+                )
+            )
+            session.commit()
+
+    def close(self):
+        """stops the workers, cancelling any jobs that haven't started"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_job_manager(engine):
+    """creates the JobManager for the API, with settings from the JOB_WORKERS
+    (default 2), JOB_MAX_QUEUED (default 100) and JOB_TTL_S (default 3600) environment
+    variables"""
+    return JobManager(
+        engine,
+        max_workers=int(os.getenv("JOB_WORKERS", "2")),
+        max_queued=int(os.getenv("JOB_MAX_QUEUED", "100")),
+        ttl_s=float(os.getenv("JOB_TTL_S", "3600")),
+    )
@@ -1,37 +1,78 @@
+import argparse
+
+from visualisation.dashboard import ActivityDashboard
 from visualisation.plots import (
+    plot_activity_frequency,
+    plot_activity_splits,
+    plot_calendar_heatmap,
     plot_distance_vs_time_weekly,
+    plot_pace_comparison,
     plot_pace_vs_date,
     plot_pace_vs_distance,
     plot_pace_vs_elevation,
     plot_pace_vs_perceived_effort,
+    plot_training_load,
+    plot_weekly_distance_comparison,
 )
 from input_handler.input_handler import (
+    get_activity_id,
     get_dates,
     get_user_id,
+    get_year,
     is_valid_date,
+    parse_user_ids,
     plot_activity_input,
     plot_all_activity_data,
     exit,
 )
 
 
-def activity_plotter():
+# letter of each plot option and "x" (exit)
+PLOT_OPTIONS = ["a", "b", "c", "d", "e", "f", "g", "h", "i", "x"]
+# dashboard chart for each plot option
+DASHBOARD_CHARTS = {
+    "a": "pace_vs_date",
+    "b": "pace_vs_distance",
+    "c": "pace_vs_elevation",
+    "d": "pace_vs_perceived_effort",
+    "e": "weekly_distance",
+}
+# metric that pace is compared against for each plot option, when comparing users
+COMPARISON_METRICS = {
+    "a": "date",
+    "b": "distance_km",
+    "c": "elevation_m",
+    "d": "perceived_effort",
+}
+
+
+def activity_plotter(dashboard: bool = False, watch: bool = False):
     """main script for running the activity plotter - it retrieves the
     user_id and dates between which to plot the data, validates the inputs are
     in the correct format, then plots the appropriate graph based on the user
     input.
 
+    If several comma separated user ids are entered, the pace and weekly
+    distance plots compare the users, with all of their data queried at once.
+
+    In dashboard mode, the data is queried once and the plots are shown in a
+    single window that switches between them in place, rather than a new
+    window being created for each plot. Watch mode uses the dashboard and keeps
+    the chosen plot up to date as new activities are added, until its window is
+    closed.
+
     If there is no data available to plot, a message is printed stating this."""
 
     print("Hi, welcome to activity plotter!")
 
-    # retrieve valid user_id
+    # retrieve valid user_id, or user ids to compare
     user_id = get_user_id()
-    while not user_id.isnumeric():
+    while parse_user_ids(user_id) is None:
         print()
-        print("Invalid User ID. User ID it must be a number.")
+        print("Invalid User ID. User ID must be a number (or comma separated numbers).")
         print()
         user_id = get_user_id()
+    user_ids = parse_user_ids(user_id)
 
     # does the user want to plot all data or specify dates?
     plot_all_data = plot_all_activity_data()
@@ -53,11 +94,14 @@ def activity_plotter():
             print()
             start_date, end_date = get_dates()
 
+    dashboard = dashboard or watch
+    activity_dashboard = None
+
     # loop continually runs until "x" (exit) selected
     while True:
         # retrieve valid option for graph to plot
         activity_input = plot_activity_input()
-        while activity_input not in ["a", "b", "c", "d", "e", "x"]:
+        while activity_input not in PLOT_OPTIONS:
             print()
             print("Invalid input.")
             print()
@@ -66,6 +110,29 @@ def activity_plotter():
         try:
             if activity_input == "x":
                 exit()
+            elif len(user_ids) > 1:
+                if activity_input in COMPARISON_METRICS:
+                    plot_pace_comparison(
+                        user_ids,
+                        COMPARISON_METRICS[activity_input],
+                        start_date,
+                        end_date,
+                    )
+                elif activity_input == "e":
+                    plot_weekly_distance_comparison(user_ids, start_date, end_date)
+                else:
+                    print()
+                    print("This plot is only available for one user.")
+                    print()
+            elif dashboard and activity_input in DASHBOARD_CHARTS:
+                if activity_dashboard is None:
+                    activity_dashboard = ActivityDashboard(
+                        user_id, start_date, end_date
+                    )
+                activity_dashboard.show(DASHBOARD_CHARTS[activity_input])
+                if watch:
+                    print("Watching for new activities. Close the plot to continue.")
+                    activity_dashboard.watch()
             elif activity_input == "a":
                 plot_pace_vs_date(user_id, start_date, end_date)
             elif activity_input == "b":
@@ -76,6 +143,36 @@ def activity_plotter():
                 plot_pace_vs_perceived_effort(user_id, start_date, end_date)
             elif activity_input == "e":
                 plot_distance_vs_time_weekly(user_id, start_date, end_date)
+            elif activity_input == "f":
+                plot_training_load(user_id, start_date, end_date)
+            elif activity_input == "g":
+                activity_id = get_activity_id()
+                while not activity_id.isnumeric():
+                    print()
+                    print("Invalid Activity ID. Activity ID must be a number.")
+                    print()
+                    activity_id = get_activity_id()
+                try:
+                    plot_activity_splits(int(activity_id))
+                except KeyError:
+                    print()
+                    print(f"No track data available for activity id {activity_id}.")
+                    print()
+            elif activity_input == "h":
+                year = get_year()
+                while not (year.isnumeric() and 1 <= int(year) <= 9998):
+                    print()
+                    print("Invalid year. Year must be a number (e.g. 2025).")
+                    print()
+                    year = get_year()
+                try:
+                    plot_calendar_heatmap(user_id, int(year))
+                except KeyError:
+                    print()
+                    print(f"No data available for user_id {user_id} in {year}.")
+                    print()
+            elif activity_input == "i":
+                plot_activity_frequency(user_id, start_date, end_date)
         except KeyError as e:
             print()
             print(
@@ -85,4 +182,16 @@ def activity_plotter():
 
 
 if __name__ == "__main__":
-    activity_plotter()
+    parser = argparse.ArgumentParser(description="Plot activity data.")
+    parser.add_argument(
+        "--dashboard",
+        action="store_true",
+        help="show all plots in a single window that switches between them in place",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="dashboard mode, with plots updated as new activities are added",
+    )
+    args = parser.parse_args()
+    activity_plotter(dashboard=args.dashboard, watch=args.watch)
@@ -1,27 +1,282 @@
-from fastapi import FastAPI, HTTPException
+from datetime import date
+import hmac
+import os
+import time
+from typing import Literal
+
+from fastapi import FastAPI, Form, Header, HTTPException, Query, UploadFile
+from sqlalchemy import case, delete, update
+from sqlalchemy import select as select_columns
 from sqlmodel import select
 from fastapi.requests import Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, Response
+from pydantic import ValidationError
 from sqlalchemy.exc import IntegrityError
 
+from admission import create_admission_limiters, route_budget
+from analytics.activity_calendar import activity_frequency_query, calendar_days_query
+from analytics.derived_state import (
+    on_activities_created,
+    on_activities_deleted,
+    on_activities_updated,
+    on_activity_created,
+    on_activity_deleted,
+    on_activity_updated,
+    delete_user_state,
+    training_load_to_state,
+)
+from analytics.splits import analyse_stream
+from analytics.summary import format_user_summary, summary_etag, user_summary_query
+from analytics.training_load import summarise_training_load_state
+from analytics.trendlines import (
+    TRENDLINE_METRICS,
+    calculate_linear_coefficients,
+    fit_trendline,
+    trendline_points,
+)
 from database.models import (
     Activity,
+    ActivityBatchUpdate,
     ActivityCreate,
+    ActivityFrequency,
+    ActivitySplits,
     ActivityUpdate,
+    CalendarDay,
+    Job,
+    JobCreate,
+    JobPublic,
+    PersonalRecord,
+    TrainingLoad,
+    TrainingLoadPublic,
+    Trendline,
+    TrendlineStats,
     User,
     UserCreate,
     UserPublic,
+    UserSummary,
     UserUpdate,
 )
-from database.database import create_db_and_tables, SessionDep
+from database.database import (
+    LAST_WRITE_COOKIE,
+    READ_YOUR_WRITES_SECONDS,
+    create_db_and_tables,
+    engine,
+    ReadSessionDep,
+    SessionDep,
+)
+from database.group_commit import create_group_commit_buffer
+from database.ingest import (
+    insert_activities_trusted,
+    upsert_activity,
+    upsert_activity_rows,
+)
+from database.sql import in_ids
+from database.streams import (
+    STREAM_CHANNELS,
+    delete_activity_streams,
+    encode_track_stream,
+    load_activity_stream,
+    save_activity_stream,
+)
+from database.upgrade import missing_constraints
+from database.validation import (
+    ACTIVITY_FIELDS,
+    format_errors,
+    validate_activity_batch,
+)
+from ingestion.track_files import TrackFileError, activity_from_track, parse_track
+from jobs import JobQueueFullError, create_job_manager, job_to_public
 
 app = FastAPI()
 
+admission_limiters = create_admission_limiters()
+job_manager = create_job_manager(engine)
+
+
+def upsert_new_activity(session, db_activity: Activity):
+    """Upserts a validated activity and updates derived state, without committing, so
+    other rows (e.g. the activity's stream) can be written in the same transaction.
+    Returns the stored activity."""
+    values, previous = upsert_activity(
+        session, db_activity.model_dump(include=set(ACTIVITY_FIELDS))
+    )
+    inserted = values.pop("inserted")
+    db_activity = Activity(**values)
+    if inserted:
+        on_activity_created(session, db_activity)
+    elif previous:
+        on_activity_updated(session, previous, db_activity)
+    else:
+        # another request inserted the activity after it was selected, so its
+        # previous values aren't known and derived state is rebuilt
+        on_activities_created(session, [values])
+    return db_activity
+
+
+# opt-in group commit for POST /activities/ (see create_group_commit_buffer)
+activity_buffer = create_group_commit_buffer(engine, upsert_new_activity)
+
+# most activities that can be fetched, modified or deleted in one batch request
+MAX_BATCH_SIZE = 1000
+# most activities that can be created in one bulk request
+MAX_BULK_SIZE = 10000
+# the key internal pipelines send to create activities in trusted mode (trusted mode
+# is disabled if it isn't set)
+TRUSTED_INGEST_KEY = os.getenv("TRUSTED_INGEST_KEY")
+# shortest auto-laps, so an activity can't be split into millions of laps
+MIN_LAP_DISTANCE_KM = 0.1
+MIN_LAP_TIME_S = 10
+# fields that GET /activities/ can be sorted by
+SORT_FIELDS = ["date", "distance_km", "moving_time_s", "pace_s_per_km", "speed_kmh"]
+
+
+def parse_ids(ids: str):
+    """Parses a comma separated list of ids (e.g. "1,2,3") into a list of unique
+    integers, raising an exception with 422 status code if it is invalid"""
+    try:
+        parsed_ids = list(dict.fromkeys(int(id) for id in ids.split(",")))
+    except ValueError:
+        raise HTTPException(
+            status_code=422, detail="ids must be a comma separated list of integers"
+        )
+    if len(parsed_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=422, detail=f"No more than {MAX_BATCH_SIZE} ids can be given"
+        )
+    return parsed_ids
+
+
+def select_activities_by_ids(session, ids: list):
+    """Selects the activities with the given ids in a single query, returning them in
+    the order of ids and leaving out any ids that don't exist"""
+    dialect_name = session.get_bind().dialect.name
+    activities = session.exec(
+        select(Activity).where(in_ids(Activity.id, ids, dialect_name))
+    ).all()
+    activities_by_id = {activity.id: activity for activity in activities}
+    return [activities_by_id[id] for id in ids if id in activities_by_id]
+
+
+def parse_fields(fields: str | None):
+    """Parses a comma separated list of Activity fields (e.g. "date,distance_km"),
+    returning all fields if none are given. An exception with 422 status code is raised
+    for unknown fields."""
+    if fields is None:
+        return list(Activity.model_fields)
+    parsed_fields = list(dict.fromkeys(field.strip() for field in fields.split(",")))
+    unknown_fields = [
+        field for field in parsed_fields if field not in Activity.model_fields
+    ]
+    if unknown_fields:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown fields {unknown_fields}. Fields must be in {list(Activity.model_fields)}",
+        )
+    return parsed_fields
+
+
+def parse_sort(sort: str):
+    """Parses an activity sort order (one of SORT_FIELDS, with a leading "-" for
+    descending, e.g. "-speed_kmh"), returning the ORDER BY clauses. Activities with no
+    value are sorted last, and ties are sorted by id so pages don't overlap. An
+    exception with 422 status code is raised for other fields."""
+    field = sort.removeprefix("-")
+    if field not in SORT_FIELDS:
+        raise HTTPException(
+            status_code=422, detail=f"sort must be one of {SORT_FIELDS}, or -field"
+        )
+    column = Activity.__table__.c[field]
+    order = column.desc() if sort.startswith("-") else column.asc()
+    return [order.nulls_last(), Activity.__table__.c.id]
+
+
+def select_activity_fields(fields: list):
+    """Returns a select statement for only the given Activity columns. The statement is
+    built with SQLAlchemy's select, so that results keep their column names even when
+    only one column is selected."""
+    return select_columns(*(Activity.__table__.c[field] for field in fields))
+
+
+def etag_matches(request: Request, etag: str):
+    """checks whether a request's If-None-Match header matches an ETag, so the client
+    already has the current version of the response"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def fast_json_response(result):
+    """Serialises the rows of a column query result straight to a JSON response with
+    orjson, as a list of dictionaries of column name to value.
+
+    This is the fast path for list, export and aggregate endpoints: the rows come from
+    typed columns, so they skip being built into models and validated against the
+    route's response_model (which is still used for the API docs)."""
+    keys = list(result.keys())
+    return ORJSONResponse([dict(zip(keys, row)) for row in result])
+
+
+def check_all_activities_found(ids: list, activities: list):
+    """Raises an exception with 404 status code listing any ids that weren't found"""
+    missing_ids = set(ids) - {activity.id for activity in activities}
+    if missing_ids:
+        raise HTTPException(
+            status_code=404, detail=f"Activities not found: {sorted(missing_ids)}"
+        )
+
 
 @app.on_event("startup")
 def on_startup():
-    """Create tables on startup"""
+    """Create (or upgrade) tables on startup, and fail any jobs interrupted by a
+    restart"""
     create_db_and_tables()
+    job_manager.fail_interrupted_jobs()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    """Write any activities waiting for a group commit and stop the job workers"""
+    if activity_buffer:
+        activity_buffer.close()
+    job_manager.close()
+
+
+@app.middleware("http")
+async def set_last_write_cookie(request: Request, call_next):
+    """Sets the last_write cookie after a successful write request, so the client's
+    following reads go to the primary database (see get_read_session)"""
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        response.set_cookie(
+            LAST_WRITE_COOKIE,
+            str(time.time()),
+            max_age=int(READ_YOUR_WRITES_SECONDS) + 1,
+            httponly=True,
+        )
+    return response
+
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Admits each request through the limiter for its route's budget (see
+    admission.py), returning a 503 response with a Retry-After header if the request
+    is rejected"""
+    budget = route_budget(request.url.path)
+    if budget is None:
+        return await call_next(request)
+    limiter = admission_limiters[budget]
+    if not await limiter.acquire():
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server is busy, try again later"},
+            headers={"Retry-After": str(limiter.retry_after_s)},
+        )
+    try:
+        return await call_next(request)
+    finally:
+        limiter.release()
 
 
 @app.exception_handler(IntegrityError)
@@ -70,39 +325,261 @@ def create_activity(activity: ActivityCreate, session: SessionDep):
 
     If any of the fields are in the incorrect format, an exception with 422
     status code is raised.
+
+    Submitting an activity is idempotent: if the user already has an activity of the
+    same kind at the same date and time, that activity is updated with the request
+    body instead of a duplicate being created (e.g. when a device retries).
+
+    If group commit is enabled, the activity is upserted together with other
+    activities created at the same time, in one transaction.
+    """
+    return insert_new_activity(activity, session)
+
+
+def validate_new_activity(activity):
+    """Validates a new activity. If any of the fields are in the incorrect format, an
+    exception with 422 status code is raised.
+
+    :param activity: an ActivityCreate, or a dictionary of activity fields
     """
     try:
-        db_activity = Activity.model_validate(activity)
-        session.add(db_activity)
-        session.commit()
-        session.refresh(db_activity)
-        return db_activity
+        return Activity.model_validate(activity)
     except ValueError as e:
-        error_messages = [f"{err['loc'][0]} - {err['msg']}" for err in e.errors()]
         raise HTTPException(
             status_code=422,
-            detail=f"Format of data incorrect: {", ".join(error_messages)}",
+            detail=f"Format of data incorrect: {", ".join(format_errors(e))}",
+        )
+
+
+def insert_new_activity(activity, session):
+    """Validates and upserts a new activity (with group commit, if it is enabled),
+    updating derived state. If any of the fields are in the incorrect format, an
+    exception with 422 status code is raised.
+
+    :param activity: an ActivityCreate, or a dictionary of activity fields
+    """
+    db_activity = validate_new_activity(activity)
+    if activity_buffer:
+        return activity_buffer.submit(db_activity).result()
+    db_activity = upsert_new_activity(session, db_activity)
+    session.commit()
+    return db_activity
+
+
+def check_trusted_ingest(session, ingest_key: str | None):
+    """Raises an exception with 403 status code unless ingest_key is the server's
+    TRUSTED_INGEST_KEY, or with 409 status code if the activity_table is missing any of
+    the constraints trusted inserts rely on"""
+    if not TRUSTED_INGEST_KEY or not hmac.compare_digest(
+        (ingest_key or "").encode(), TRUSTED_INGEST_KEY.encode()
+    ):
+        raise HTTPException(
+            status_code=403,
+            detail="Trusted mode requires the server's ingest key (X-Ingest-Key)",
+        )
+    missing = missing_constraints(session.connection(), Activity.__table__)
+    if missing:
+        raise HTTPException(
+            status_code=409,
+            detail="Trusted mode requires the activity_table's constraints, missing: "
+            f"{[constraint.name for constraint in missing]}",
+        )
+
+
+@app.post("/activities/bulk", response_model=list[Activity])
+def create_activities(
+    activities: list[dict],
+    session: SessionDep,
+    trusted: bool = False,
+    x_ingest_key: str | None = Header(None),
+):
+    """Endpoint that allows a batch of activities to be created in one transaction.
+    The request body is a list of activities, each in the same format as for
+    POST /activities/.
+
+    The whole batch is validated a column at a time (see database/validation.py),
+    then upserted with a single multi-row INSERT, and derived state is rebuilt once per
+    user in the batch. As for POST /activities/, an activity with the same user, date,
+    time and activity as an existing one updates it rather than creating a duplicate,
+    so a retried batch is upserted in one round trip. Each activity in the response
+    has an inserted field, which is False if it updated an existing activity.
+
+    With ?trusted=true (for internal pipelines that create valid activities), the
+    activities aren't validated in Python, and the database's constraints are relied
+    on instead (see database/ingest.py). Trusted mode is only enabled by setting the
+    TRUSTED_INGEST_KEY environment variable, and requests must send it in the
+    X-Ingest-Key header, else an exception with 403 status code is raised. It is
+    refused with 409 status code if the activity_table doesn't have the constraints
+    (e.g. a SQLite table created before they were added).
+
+    If any of the activities are in the incorrect format, no activities are created
+    and an exception with 422 status code is raised, with the errors for each invalid
+    activity (its row, starting from 0, and the same message as POST /activities/).
+    Trusted batches only report the first error of each rejected activity.
+    """
+    if len(activities) > MAX_BULK_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"No more than {MAX_BULK_SIZE} activities can be created",
+        )
+    if trusted:
+        check_trusted_ingest(session, x_ingest_key)
+        created, errors = insert_activities_trusted(session, activities)
+    else:
+        activities_data, errors = validate_activity_batch(activities)
+        if not errors:
+            created = upsert_activity_rows(session, activities_data)
+    if errors:
+        raise HTTPException(
+            status_code=422,
+            detail=[
+                {
+                    "row": row,
+                    "detail": f"Format of data incorrect: {", ".join(messages)}",
+                }
+                for row, messages in errors.items()
+            ],
+        )
+    on_activities_created(session, created)
+    session.commit()
+    return ORJSONResponse(created)
+
+
+@app.post("/users/{user_id}/activities/upload", response_model=Activity)
+def upload_activity(
+    user_id: int,
+    session: SessionDep,
+    file: UploadFile,
+    perceived_effort: int = Form(),
+    activity: Literal["run", "ride"] | None = Form(None),
+    activity_type: str = Form("road"),
+):
+    """Endpoint to create an activity from an uploaded GPX or TCX track file. The
+    distance, moving time and elevation gain are calculated from the track, and the
+    date and time are those of the first track point. The activity (run or ride) is
+    taken from the file if it isn't given. The track points are saved as the
+    activity's stream, in the same transaction as the activity (so group commit isn't
+    used).
+
+    If the file can't be parsed into an activity, an exception with 422 status code is
+    raised."""
+    try:
+        track = parse_track(file.file)
+        activity_data = activity_from_track(
+            track, user_id, perceived_effort, activity, activity_type
         )
+    except TrackFileError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    db_activity = upsert_new_activity(session, validate_new_activity(activity_data))
+    save_activity_stream(session, db_activity.id, encode_track_stream(track))
+    session.commit()
+    return db_activity
+
+
+@app.post("/jobs/", response_model=JobPublic, status_code=202)
+def create_job(job: JobCreate, session: SessionDep):
+    """Endpoint to start a background job (an export, plot or derived state rebuild),
+    which runs on the job worker pool. Poll GET /jobs/{id} for its status and result.
+    If an identical job is queued, running or has recently succeeded, that job is
+    returned instead of starting a new one."""
+    try:
+        new_job = job_manager.submit(session, job.kind, job.params)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=422, detail=e.errors(include_url=False, include_context=False)
+        )
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job_to_public(new_job)
 
 
 @app.get("/users/", response_model=list[UserPublic])
-def get_users(session: SessionDep, offset: int = 0, limit: int = 10):
+def get_users(session: ReadSessionDep, offset: int = 0, limit: int = 10):
     """Endpoint to get a paginated list of users."""
-    users = session.exec(select(User).offset(offset).limit(limit)).all()
-    return users
+    result = session.exec(select(User.user_id, User.name).offset(offset).limit(limit))
+    return fast_json_response(result)
 
 
-@app.get("/activities/")
+@app.get("/activities/", response_model=list[Activity])
 def get_activities(
-    session: SessionDep, offset: int = 0, limit: int = 10
-) -> list[Activity]:
-    """Endpoint to get a paginated list of activities."""
-    activities = session.exec(select(Activity).offset(offset).limit(limit)).all()
-    return activities
+    session: ReadSessionDep,
+    offset: int = 0,
+    limit: int = 10,
+    fields: str | None = None,
+    start_date: str | None = None,
+    end_date: str | None = None,
+    user_id: int | None = None,
+    activity: Literal["run", "ride"] | None = None,
+    min_pace_s_per_km: float | None = None,
+    max_pace_s_per_km: float | None = None,
+    min_speed_kmh: float | None = None,
+    max_speed_kmh: float | None = None,
+    sort: str | None = None,
+):
+    """Endpoint to get a paginated list of activities. Optionally, fields can be a
+    comma separated list of the activity fields to return (e.g.
+    fields=date,distance_km), in which case only those columns are queried and
+    returned. Optionally, only the activities after start_date and/or before end_date
+    (in the format "YYYY/MM/DD") are returned, which only scans the matching
+    partitions if the table is partitioned.
+
+    Activities can also be filtered by user_id, activity, and pace (in seconds per km)
+    or speed (in km/h), e.g. runs faster than 5:00/km with
+    activity=run&max_pace_s_per_km=300, and sorted by one of SORT_FIELDS (descending
+    with a leading "-", e.g. sort=-speed_kmh). Activities with no pace or speed (0
+    distance or moving time) are left out by pace and speed filters and sorted last."""
+    activity_fields = parse_fields(fields)
+    statement = select_activity_fields(activity_fields)
+    if start_date is not None:
+        statement = statement.where(Activity.date > start_date)
+    if end_date is not None:
+        statement = statement.where(Activity.date < end_date)
+    if user_id is not None:
+        statement = statement.where(Activity.user_id == user_id)
+    if activity is not None:
+        statement = statement.where(Activity.activity == activity)
+    columns = Activity.__table__.c
+    if min_pace_s_per_km is not None:
+        statement = statement.where(columns.pace_s_per_km >= min_pace_s_per_km)
+    if max_pace_s_per_km is not None:
+        statement = statement.where(columns.pace_s_per_km <= max_pace_s_per_km)
+    if min_speed_kmh is not None:
+        statement = statement.where(columns.speed_kmh >= min_speed_kmh)
+    if max_speed_kmh is not None:
+        statement = statement.where(columns.speed_kmh <= max_speed_kmh)
+    if sort is not None:
+        statement = statement.order_by(*parse_sort(sort))
+    result = session.exec(statement.offset(offset).limit(limit))
+    return fast_json_response(result)
+
+
+@app.get("/users/{user_id}/activities/export", response_model=list[Activity])
+def export_activities(
+    user_id: int,
+    session: ReadSessionDep,
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+    fields: str | None = None,
+):
+    """Endpoint to export all of a user's activities between two dates (in the format
+    "YYYY/MM/DD"), ordered by date and time. Optionally, fields can be a comma separated
+    list of the activity fields to return (e.g. fields=date,distance_km), in which case
+    only those columns are queried and returned."""
+    activity_fields = parse_fields(fields)
+    result = session.exec(
+        select_activity_fields(activity_fields)
+        .where(
+            Activity.user_id == user_id,
+            Activity.date > start_date,
+            Activity.date < end_date,
+        )
+        .order_by(Activity.date, Activity.time)
+    )
+    return fast_json_response(result)
 
 
 @app.get("/users/{user_id}", response_model=UserPublic)
-def get_user_by_user_id(user_id: int, session: SessionDep):
+def get_user_by_user_id(user_id: int, session: ReadSessionDep):
     """Endpoint to get a specific user by user_id."""
     user = session.get(User, user_id)
     if not user:
@@ -110,8 +587,18 @@ def get_user_by_user_id(user_id: int, session: SessionDep):
     return user
 
 
+# batch routes are declared before the /activities/{id} routes, so "batch" isn't
+# treated as an id
+@app.get("/activities/batch", response_model=list[Activity])
+def get_activities_by_ids(ids: str, session: ReadSessionDep):
+    """Endpoint that gets the activities with the given comma separated ids (e.g.
+    ?ids=1,2,3) in a single query. Activities are returned in the order of the ids,
+    leaving out any ids that don't exist."""
+    return select_activities_by_ids(session, parse_ids(ids))
+
+
 @app.get("/activities/{id}", response_model=Activity)
-def get_activity_by_activity_id(id: int, session: SessionDep):
+def get_activity_by_activity_id(id: int, session: ReadSessionDep):
     """Endpoint that gets a specific activity by id. If the ID does not exist,
     an exception with 404 status code is raised."""
     activity = session.get(Activity, id)
@@ -120,6 +607,253 @@ def get_activity_by_activity_id(id: int, session: SessionDep):
     return activity
 
 
+@app.get("/activities/{id}/stream")
+def get_activity_stream(id: int, session: ReadSessionDep, channels: str | None = None):
+    """Endpoint that gets an activity's stream (its per point track data, for
+    activities created from track files). Optionally, channels can be a comma separated
+    list of the channels to return (e.g. channels=time,heart_rate), in which case only
+    those channels are queried and decoded. The response has the stream's start_time
+    (seconds since the epoch), n_points and a list of values for each channel (time is
+    in seconds since start_time), or null if the track has no values for a channel.
+
+    If the activity has no stream, an exception with 404 status code is raised."""
+    if channels is None:
+        stream_channels = list(STREAM_CHANNELS)
+    else:
+        stream_channels = list(dict.fromkeys(c.strip() for c in channels.split(",")))
+    unknown_channels = [c for c in stream_channels if c not in STREAM_CHANNELS]
+    if unknown_channels:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown channels {unknown_channels}. Channels must be in {list(STREAM_CHANNELS)}",
+        )
+    stream = load_activity_stream(session, id, stream_channels)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Activity stream not found")
+    # orjson serialises the numpy arrays directly
+    return ORJSONResponse({"activity_id": id, **stream})
+
+
+@app.get("/activities/{id}/splits", response_model=ActivitySplits)
+def get_activity_splits(
+    id: int,
+    session: ReadSessionDep,
+    lap_distance_km: float | None = Query(None, ge=MIN_LAP_DISTANCE_KM),
+    lap_time_s: float | None = Query(None, ge=MIN_LAP_TIME_S),
+):
+    """Endpoint that gets an activity's per km splits and best efforts (the fastest
+    1k, 5k, 10k, half marathon and marathon within the activity), calculated from its
+    stream. Optionally, auto-laps are also calculated every lap_distance_km (at least
+    0.1) or every lap_time_s seconds (at least 10) of moving time, but not both.
+
+    If the activity has no stream, an exception with 404 status code is raised."""
+    if lap_distance_km is not None and lap_time_s is not None:
+        raise HTTPException(
+            status_code=422, detail="Give only one of lap_distance_km or lap_time_s"
+        )
+    stream = load_activity_stream(session, id, ["time", "lat", "lon", "elevation"])
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Activity stream not found")
+    lap_distance_m = None if lap_distance_km is None else lap_distance_km * 1000
+    return {"activity_id": id, **analyse_stream(stream, lap_distance_m, lap_time_s)}
+
+
+@app.get("/users/{user_id}/training-load", response_model=TrainingLoadPublic)
+def get_training_load(user_id: int, session: ReadSessionDep):
+    """Endpoint that gets a user's current training load: rolling 7 day (acute) and
+    28 day (chronic) distance, the acute:chronic workload ratio, and exponentially
+    weighted fitness, fatigue and form, as of the date of their latest activity.
+
+    If the user has no activities, an exception with 404 status code is raised."""
+    training_load = session.get(TrainingLoad, user_id)
+    if not training_load:
+        raise HTTPException(status_code=404, detail="Training load not found")
+    summary = summarise_training_load_state(training_load_to_state(training_load))
+    return TrainingLoadPublic(user_id=user_id, **summary)
+
+
+@app.get("/users/{user_id}/records", response_model=list[PersonalRecord])
+def get_personal_records(user_id: int, session: ReadSessionDep):
+    """Endpoint that gets a user's personal records for each activity (e.g. run), which
+    are kept up to date as activities are added, modified and deleted. Records are:
+
+        fastest_1k, fastest_5k, fastest_10k, fastest_half_marathon, fastest_marathon:
+            time in seconds to cover the distance, at the average pace of an activity
+            at least that long
+        longest_distance: distance in km
+        most_elevation: elevation in m
+        best_pace: pace in seconds per km
+    """
+    result = session.exec(
+        select(*PersonalRecord.__table__.c).where(PersonalRecord.user_id == user_id)
+    )
+    return fast_json_response(result)
+
+
+@app.get("/users/{user_id}/summary", response_model=UserSummary)
+def get_user_summary(user_id: int, request: Request, session: ReadSessionDep):
+    """Endpoint that gets a summary of a user's activities: totals and averages, their
+    last activity, and their distance this week (the last 7 days) compared to the week
+    before. The summary is computed with a single aggregate query.
+
+    The response has an ETag made from the user's data_version, which is bumped by
+    every write to their activities. If the request's If-None-Match header matches it,
+    a 304 response is returned without aggregating the user's activities.
+
+    If the user doesn't exist, an exception with 404 status code is raised."""
+    data_version = session.execute(
+        select_columns(User.data_version).where(User.user_id == user_id)
+    ).scalar_one_or_none()
+    if data_version is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    today = date.today()
+    etag = summary_etag(user_id, data_version, today)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    row = session.execute(user_summary_query(user_id, today)).one()
+    return ORJSONResponse(
+        format_user_summary(user_id, row),
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/users/{user_id}/calendar", response_model=list[CalendarDay])
+def get_activity_calendar(
+    user_id: int,
+    session: ReadSessionDep,
+    year: int = Query(ge=1, le=9998),
+    activity: Literal["run", "ride"] | None = None,
+):
+    """Endpoint that gets the number of activities and total distance on each day of a
+    year that a user has activities (e.g. for a calendar heatmap), ordered by date.
+    Optionally, only activities of one kind (run or ride) are counted. The days are
+    aggregated by the database, so there are at most 366 whatever the number of
+    activities."""
+    result = session.execute(calendar_days_query(user_id, year, activity))
+    return fast_json_response(result)
+
+
+@app.get("/users/{user_id}/activity-frequency", response_model=list[ActivityFrequency])
+def get_activity_frequency(
+    user_id: int,
+    session: ReadSessionDep,
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+    activity: Literal["run", "ride"] | None = None,
+):
+    """Endpoint that gets the number of activities and total distance started in each
+    hour (0 to 23) of each day of the week (0 for Monday to 6 for Sunday), for a user's
+    activities between two dates (in the format "YYYY/MM/DD"). Optionally, only
+    activities of one kind (run or ride) are counted. Only the hours with activities
+    are returned, so there are at most 168."""
+    result = session.execute(
+        activity_frequency_query(user_id, start_date, end_date, activity)
+    )
+    return fast_json_response(result)
+
+
+@app.get("/users/{user_id}/trendlines", response_model=list[Trendline])
+def get_trendlines(
+    user_id: int,
+    session: ReadSessionDep,
+    fit: Literal["linear", "robust", "windowed"] = "linear",
+    window: int = Query(default=20, ge=2),
+):
+    """Endpoint that gets the pace (min/km) trendline against distance_km, elevation_m
+    and perceived_effort for a user, as the slope and intercept of a straight line.
+
+    fit options:
+        linear: least squares over all activities, read from running statistics that
+            are kept up to date as activities are written
+        robust: Theil-Sen fit over all activities (less affected by outliers), over
+            a random sample of pairs of activities for users with many activities
+        windowed: least squares over the most recent window activities
+
+    slope and intercept are null if there are not enough activities for a trendline.
+    """
+    if fit == "linear":
+        stored_stats = session.exec(
+            select(TrendlineStats).where(TrendlineStats.user_id == user_id)
+        ).all()
+        stats = {
+            trendline_stats.metric: trendline_stats.model_dump()
+            for trendline_stats in stored_stats
+        }
+        coefficients = {
+            metric: calculate_linear_coefficients(metric_stats)
+            for metric, metric_stats in stats.items()
+        }
+        counts = {metric: metric_stats["n"] for metric, metric_stats in stats.items()}
+    else:
+        activities = session.exec(
+            select(Activity)
+            .where(Activity.user_id == user_id)
+            .order_by(Activity.date, Activity.time)
+        ).all()
+        points = [trendline_points(activity.model_dump()) for activity in activities]
+        coefficients = {}
+        counts = {}
+        for metric in TRENDLINE_METRICS:
+            metric_points = [point[metric] for point in points if metric in point]
+            x = [x for x, _ in metric_points]
+            y = [y for _, y in metric_points]
+            coefficients[metric] = fit_trendline(x, y, fit, window)
+            counts[metric] = min(len(x), window) if fit == "windowed" else len(x)
+
+    trendlines = []
+    for metric in TRENDLINE_METRICS:
+        slope, intercept = coefficients.get(metric) or (None, None)
+        trendlines.append(
+            {
+                "metric": metric,
+                "fit": fit,
+                "n": counts.get(metric, 0),
+                "slope": slope,
+                "intercept": intercept,
+            }
+        )
+    return ORJSONResponse(trendlines)
+
+
+def get_job_or_404(session, id: int):
+    """Gets a job by id, raising an exception with 404 status code if it doesn't
+    exist (or has expired)"""
+    job = session.get(Job, id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+# jobs are read from the primary database, where their status is updated
+@app.get("/jobs/{id}", response_model=JobPublic)
+def get_job(id: int, session: SessionDep):
+    """Endpoint to get a job's status, and its result (or error) once it has
+    completed."""
+    return job_to_public(get_job_or_404(session, id))
+
+
+@app.get("/jobs/{id}/file")
+def get_job_file(id: int, session: SessionDep):
+    """Endpoint to download the file saved by a completed plot job."""
+    job = get_job_or_404(session, id)
+    result = job_to_public(job).result
+    if (
+        job.status != "succeeded"
+        or not isinstance(result, dict)
+        or "path" not in result
+    ):
+        raise HTTPException(status_code=404, detail="Job has no file")
+    return FileResponse(result["path"])
+
+
+@app.get("/metrics/admission")
+def get_admission_metrics():
+    """Endpoint to get the admission control metrics for each budget: the limits,
+    the number of requests running and queued, and the number admitted and rejected
+    since the API started."""
+    return [limiter.metrics() for limiter in admission_limiters.values()]
+
+
 @app.patch("/users/{user_id}", response_model=UserPublic)
 def update_user(user_id: int, user: UserUpdate, session: SessionDep):
     """Endpoint that allows a user of specified user_id to be modified. All
@@ -141,6 +875,59 @@ def update_user(user_id: int, user: UserUpdate, session: SessionDep):
     return user_db
 
 
+@app.patch("/activities/batch", response_model=list[Activity])
+def update_activities(activities: list[ActivityBatchUpdate], session: SessionDep):
+    """Endpoint that allows a batch of activities to be modified in a single UPDATE
+    statement. The request body is a list of activity updates, each with the id of the
+    activity and the (optional) properties to modify, validated in the same way as
+    PATCH /activities/{id}.
+
+    If any of the IDs do not exist, no activities are modified and an exception with
+    404 status code is raised.
+
+    If any of the fields are in the incorrect format, an exception with
+    422 status code is raised.
+    """
+    updates = {}
+    for activity in activities:
+        activity_data = activity.model_dump(exclude_unset=True)
+        updates.setdefault(activity_data.pop("id"), {}).update(activity_data)
+    ids = list(updates)
+    if len(ids) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"No more than {MAX_BATCH_SIZE} activities can be modified",
+        )
+    activities_db = select_activities_by_ids(session, ids)
+    check_all_activities_found(ids, activities_db)
+    previous = [activity_db.model_dump() for activity_db in activities_db]
+
+    # each modified column is set with a CASE on the id, so every activity is
+    # modified by the same statement
+    columns = Activity.__table__.c
+    fields = {field for activity_data in updates.values() for field in activity_data}
+    values = {}
+    for field in sorted(fields):
+        new_values = {
+            id: activity_data[field]
+            for id, activity_data in updates.items()
+            if field in activity_data
+        }
+        values[field] = case(new_values, value=columns.id, else_=columns[field])
+    if values:
+        dialect_name = session.get_bind().dialect.name
+        session.execute(
+            update(Activity.__table__)
+            .where(in_ids(columns.id, ids, dialect_name))
+            .values(values)
+        )
+        session.expire_all()
+        activities_db = select_activities_by_ids(session, ids)
+        on_activities_updated(session, previous, activities_db)
+    session.commit()
+    return select_activities_by_ids(session, ids)
+
+
 @app.patch("/activities/{id}", response_model=Activity)
 def update_activity(id: int, activity: ActivityUpdate, session: SessionDep):
     """Endpoint that allows an activity of specified id to be modified. All
@@ -155,11 +942,14 @@ def update_activity(id: int, activity: ActivityUpdate, session: SessionDep):
     activity_db = session.get(Activity, id)
     if not activity_db:
         raise HTTPException(status_code=404, detail="Activity not found")
+    previous = activity_db.model_dump()
     activity_data = activity.model_dump(exclude_unset=True)
     # don't need to validate against Activity because model_dump is validating against
     # ActivityUpdate (optional fields required which Activity doesn't have)
     activity_db.sqlmodel_update(activity_data)
     session.add(activity_db)
+    session.flush()
+    on_activity_updated(session, previous, activity_db)
     session.commit()
     session.refresh(activity_db)
     return activity_db
@@ -172,11 +962,37 @@ def delete_user(user_id: int, session: SessionDep):
     user = session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    delete_user_state(session, user_id)
     session.delete(user)
     session.commit()
     return {"message": f"User_id {user_id} deleted"}
 
 
+@app.delete("/activities/batch")
+def delete_activities(ids: str, session: SessionDep):
+    """Endpoint that deletes the activities with the given comma separated ids (e.g.
+    ?ids=1,2,3) in a single DELETE statement.
+
+    If any of the IDs do not exist, no activities are deleted and an exception with
+    404 status code is raised."""
+    parsed_ids = parse_ids(ids)
+    activities = select_activities_by_ids(session, parsed_ids)
+    check_all_activities_found(parsed_ids, activities)
+    deleted = [activity.model_dump() for activity in activities]
+    dialect_name = session.get_bind().dialect.name
+    session.execute(
+        delete(Activity.__table__).where(
+            in_ids(Activity.__table__.c.id, parsed_ids, dialect_name)
+        )
+    )
+    delete_activity_streams(session, parsed_ids)
+    for activity in activities:
+        session.expunge(activity)
+    on_activities_deleted(session, deleted)
+    session.commit()
+    return {"message": f"Activity ids {parsed_ids} deleted"}
+
+
 @app.delete("/activities/{id}")
 def delete_activity(id: int, session: SessionDep):
     """Endpoint that deletes an activity, according to the given id.
@@ -185,5 +1001,8 @@ def delete_activity(id: int, session: SessionDep):
     if not activity:
         raise HTTPException(status_code=404, detail="Activity not found")
     session.delete(activity)
+    delete_activity_streams(session, [id])
+    session.flush()
+    on_activity_deleted(session, activity)
     session.commit()
     return {"message": f"Activity id {id} deleted"}
@@ -1,4 +1,5 @@
 from sqlmodel import Session
+from analytics.derived_state import rebuild_user_state
 from database.models import Activity, User
 from database.database import engine
 
@@ -167,6 +168,10 @@ def create_activities():
 
     session.commit()
 
+    # training load, personal records and trendlines are derived from the activities
+    rebuild_user_state(session, 1)
+    session.commit()
+
 
 if __name__ == "__main__":
     create_users()
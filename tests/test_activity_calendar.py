@@ -0,0 +1,144 @@
+from datetime import date
+
+import numpy as np
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from analytics.activity_calendar import (
+    activity_frequency_query,
+    calendar_days_query,
+    calendar_grid,
+    calendar_position,
+    frequency_grid,
+)
+from database.models import Activity
+
+
+@pytest.fixture(name="session")
+def session_fixture():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def add_activity(
+    session: Session,
+    date: str,
+    time: str = "17:30",
+    distance_km: float = 5,
+    activity: str = "run",
+    user_id: int = 1,
+):
+    session.add(
+        Activity(
+            user_id=user_id,
+            date=date,
+            time=time,
+            activity=activity,
+            activity_type="road",
+            moving_time="00:30:00",
+            distance_km=distance_km,
+            perceived_effort=5,
+        )
+    )
+    session.commit()
+
+
+class TestCalendarDaysQuery:
+    def test_calendar_days_query_groups_activities_by_day(self, session: Session):
+        add_activity(session, "2025/02/04", distance_km=5)
+        # the same day without zero padding
+        add_activity(session, "2025/2/4", "7:05", distance_km=10)
+        add_activity(session, "2025/12/31", distance_km=3)
+        add_activity(session, "2024/12/31")
+        add_activity(session, "2026/01/01")
+        add_activity(session, "2025/03/01", user_id=2)
+
+        rows = session.execute(calendar_days_query(1, 2025)).mappings().all()
+
+        assert [dict(row) for row in rows] == [
+            {"date": "2025/02/04", "count": 2, "distance_km": 15.0},
+            {"date": "2025/12/31", "count": 1, "distance_km": 3.0},
+        ]
+
+    def test_calendar_days_query_filters_activity(self, session: Session):
+        add_activity(session, "2025/02/04")
+        add_activity(session, "2025/02/04", activity="ride", distance_km=20)
+
+        rows = session.execute(calendar_days_query(1, 2025, "ride")).all()
+
+        assert rows == [("2025/02/04", 1, 20.0)]
+
+    def test_calendar_days_query_compiles_for_postgres(self):
+        sql = str(calendar_days_query(1, 2025).compile(dialect=postgresql.dialect()))
+        assert (
+            "to_char(to_date(activity_table.date, 'YYYY/MM/DD'), 'YYYY/MM/DD')" in sql
+        )
+        assert "GROUP BY" in sql
+
+
+class TestActivityFrequencyQuery:
+    def test_activity_frequency_query_groups_by_day_of_week_and_hour(
+        self, session: Session
+    ):
+        add_activity(session, "2025/03/03", "7:05")  # Monday
+        add_activity(session, "2025/03/10", "07:45", distance_km=10)  # Monday
+        add_activity(session, "2025/3/9", "18:00")  # Sunday
+        add_activity(session, "2025/03/11", "00:10")  # Tuesday
+
+        rows = session.execute(activity_frequency_query(1)).all()
+
+        assert rows == [(0, 7, 2, 15.0), (1, 0, 1, 5.0), (6, 18, 1, 5.0)]
+
+    def test_activity_frequency_query_filters_dates(self, session: Session):
+        add_activity(session, "2025/03/03")
+        add_activity(session, "2025/04/03")
+
+        rows = session.execute(
+            activity_frequency_query(1, "2025/03/31", "2025/05/01")
+        ).all()
+
+        assert rows == [(3, 17, 1, 5.0)]
+
+
+class TestCalendarGrid:
+    def test_calendar_position(self):
+        # 2025 starts on a Wednesday
+        assert calendar_position(date(2025, 1, 1)) == (2, 0)
+        assert calendar_position(date(2025, 1, 6)) == (0, 1)
+        assert calendar_position(date(2025, 12, 31)) == (2, 52)
+
+    def test_calendar_grid_has_a_cell_for_each_day(self):
+        grid = calendar_grid([], 2024)
+        assert grid.shape == (7, 54)
+        assert (grid == 0).sum() == 366
+        assert np.isnan(grid).sum() == 7 * 54 - 366
+
+    def test_calendar_grid_fills_days_with_metric(self):
+        days = [
+            {"date": "2025/01/01", "count": 2, "distance_km": 15.0},
+            {"date": "2025/12/31", "count": 1, "distance_km": 3.0},
+        ]
+        grid = calendar_grid(days, 2025, "distance_km")
+        assert grid[2, 0] == 15.0
+        assert grid[2, 52] == 3.0
+        assert np.nansum(grid) == 18.0
+        assert np.isnan(grid[0, 0])
+
+
+class TestFrequencyGrid:
+    def test_frequency_grid(self):
+        cells = [
+            {"day_of_week": 0, "hour": 7, "count": 2, "distance_km": 15.0},
+            {"day_of_week": 6, "hour": 18, "count": 1, "distance_km": 5.0},
+        ]
+        grid = frequency_grid(cells)
+        assert grid.shape == (7, 24)
+        assert grid[0, 7] == 2
+        assert grid[6, 18] == 1
+        assert grid.sum() == 3
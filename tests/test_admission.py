@@ -0,0 +1,93 @@
+import asyncio
+
+from admission import (
+    ANALYTICS_BUDGET,
+    DEFAULT_BUDGET,
+    AdmissionLimiter,
+    route_budget,
+)
+
+
+def make_limiter(max_concurrent=1, max_queue=1, queue_timeout_s=1.0):
+    return AdmissionLimiter("test", max_concurrent, max_queue, queue_timeout_s)
+
+
+class TestAdmissionLimiter:
+    def test_admits_up_to_max_concurrent(self):
+        async def run():
+            limiter = make_limiter(max_concurrent=2, max_queue=0)
+            return [await limiter.acquire() for _ in range(3)], limiter
+
+        results, limiter = asyncio.run(run())
+        assert results == [True, True, False]
+        assert limiter.in_flight == 2
+        assert limiter.admitted == 2
+        assert limiter.rejected == 1
+
+    def test_queued_request_is_admitted_when_slot_released(self):
+        async def run():
+            limiter = make_limiter()
+            await limiter.acquire()
+            waiting = asyncio.create_task(limiter.acquire())
+            await asyncio.sleep(0)
+            queue_depth = limiter.metrics()["queue_depth"]
+            limiter.release()
+            return await waiting, queue_depth, limiter
+
+        admitted, queue_depth, limiter = asyncio.run(run())
+        assert admitted
+        assert queue_depth == 1
+        assert limiter.in_flight == 1
+        assert limiter.metrics()["queue_depth"] == 0
+
+    def test_rejects_when_queue_full(self):
+        async def run():
+            limiter = make_limiter()
+            await limiter.acquire()
+            waiting = asyncio.create_task(limiter.acquire())
+            await asyncio.sleep(0)
+            rejected = await limiter.acquire()
+            limiter.release()
+            await waiting
+            return rejected, limiter
+
+        admitted, limiter = asyncio.run(run())
+        assert not admitted
+        assert limiter.rejected == 1
+
+    def test_rejects_after_queue_timeout(self):
+        async def run():
+            limiter = make_limiter(queue_timeout_s=0.01)
+            await limiter.acquire()
+            return await limiter.acquire(), limiter
+
+        admitted, limiter = asyncio.run(run())
+        assert not admitted
+        assert limiter.metrics()["queue_depth"] == 0
+        assert limiter.in_flight == 1
+
+    def test_release_frees_slot(self):
+        async def run():
+            limiter = make_limiter(max_queue=0)
+            await limiter.acquire()
+            limiter.release()
+            return await limiter.acquire(), limiter
+
+        admitted, limiter = asyncio.run(run())
+        assert admitted
+        assert limiter.in_flight == 1
+
+
+class TestRouteBudget:
+    def test_analytics_routes_use_analytics_budget(self):
+        assert route_budget("/users/1/training-load") == ANALYTICS_BUDGET
+        assert route_budget("/users/1/activities/export") == ANALYTICS_BUDGET
+        assert route_budget("/users/1/calendar") == ANALYTICS_BUDGET
+        assert route_budget("/users/1/summary") == ANALYTICS_BUDGET
+
+    def test_other_routes_use_default_budget(self):
+        assert route_budget("/activities/") == DEFAULT_BUDGET
+        assert route_budget("/users/1") == DEFAULT_BUDGET
+
+    def test_metrics_routes_are_unlimited(self):
+        assert route_budget("/metrics/admission") is None
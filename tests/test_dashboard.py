@@ -0,0 +1,59 @@
+from visualisation.dashboard import CHARTS, build_chart_data, charts_affected_by
+from visualisation.plots_utils import create_dataframe
+import pytest
+
+# visual test for the dashboard done manually
+
+
+class TestBuildChartData:
+    def test_build_chart_data_precomputes_all_charts(self):
+        data = [
+            {
+                "date": "2025/02/25",
+                "distance_km": 5.0,
+                "moving_time": "00:30:00",
+                "elevation_m": None,
+                "perceived_effort": 4,
+            },
+            {
+                "date": "2025/02/24",
+                "distance_km": 10.0,
+                "moving_time": "01:10:00",
+                "elevation_m": 100,
+                "perceived_effort": 6,
+            },
+        ]
+        result = build_chart_data(create_dataframe(data))
+
+        assert list(result) == CHARTS
+        assert list(result["pace_vs_date"]["y"]) == [7.0, 6.0]
+        assert len(result["pace_vs_elevation"]["x"]) == 1
+        assert result["pace_vs_elevation"]["trendline"] is None
+        trendline_x, trendline_y = result["pace_vs_distance"]["trendline"]
+        assert list(trendline_x) == [5.0, 10.0]
+        assert list(trendline_y) == pytest.approx([6.0, 7.0])
+        assert result["weekly_distance"]["y"].sum() == 15.0
+
+    def test_build_chart_data_for_some_charts(self):
+        data = [{"date": "2025/02/25", "distance_km": 5.0, "moving_time": "00:30:00"}]
+        result = build_chart_data(
+            create_dataframe(data), ["pace_vs_distance", "weekly_distance"]
+        )
+
+        assert list(result) == ["pace_vs_distance", "weekly_distance"]
+        assert list(result["pace_vs_distance"]["y"]) == [6.0]
+
+
+class TestChartsAffectedBy:
+    def test_charts_without_values_are_unaffected(self):
+        data = [
+            {
+                "date": "2025/02/25",
+                "distance_km": 5.0,
+                "moving_time": "00:30:00",
+                "elevation_m": None,
+                "perceived_effort": 4,
+            }
+        ]
+        affected = charts_affected_by(create_dataframe(data, compact=True))
+        assert affected == [chart for chart in CHARTS if chart != "pace_vs_elevation"]
@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.pool import StaticPool
+
+from database.group_commit import GroupCommitBuffer, insert_activity
+from database.models import Activity
+
+
+@pytest.fixture(name="engine")
+def engine_fixture():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def make_activity(distance_km=5.0, time="17:30"):
+    return Activity(
+        user_id=1,
+        date="2025/03/01",
+        time=time,
+        activity="run",
+        activity_type="road",
+        moving_time="00:30:00",
+        distance_km=distance_km,
+        perceived_effort=5,
+    )
+
+
+class TestGroupCommitBuffer:
+    def test_concurrent_activities_committed_together(self, engine):
+        commits = []
+        event.listen(engine, "commit", lambda connection: commits.append(1))
+        buffer = GroupCommitBuffer(
+            lambda: Session(engine, expire_on_commit=False),
+            max_delay_ms=200,
+            max_batch=10,
+        )
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            futures = [buffer.submit(make_activity(time=f"17:{i}")) for i in range(10)]
+            activities = list(executor.map(lambda future: future.result(), futures))
+        buffer.close()
+
+        assert sorted(activity.id for activity in activities) == list(range(1, 11))
+        assert len(commits) == 1
+
+    def test_failed_activity_only_fails_its_own_request(self, engine):
+        def write(session, activity):
+            insert_activity(session, activity)
+            if activity.distance_km < 0:
+                raise ValueError("negative distance")
+            return activity
+
+        buffer = GroupCommitBuffer(
+            lambda: Session(engine, expire_on_commit=False),
+            max_delay_ms=200,
+            max_batch=3,
+            write=write,
+        )
+        futures = [
+            buffer.submit(make_activity()),
+            buffer.submit(make_activity(-1, "17:31")),
+            buffer.submit(make_activity(time="17:32")),
+        ]
+        buffer.close()
+
+        assert futures[0].result().id is not None
+        with pytest.raises(ValueError):
+            futures[1].result()
+        assert futures[2].result().id is not None
+        with Session(engine) as session:
+            assert len(session.exec(select(Activity)).all()) == 2
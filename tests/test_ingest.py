@@ -0,0 +1,175 @@
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from database.ingest import insert_activities_trusted, upsert_activity_rows
+from database.models import Activity
+from database.sql import MatchesFormat
+from database.validation import validate_activity_batch
+from tests.test_validation import FIELD_VALUES, VALID_ACTIVITY
+
+
+@pytest.fixture(name="session")
+def session_fixture():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def count_activities(session: Session):
+    return session.execute(select(func.count()).select_from(Activity)).scalar_one()
+
+
+class TestMatchesFormat:
+    @pytest.mark.parametrize(
+        "field, format",
+        [("date", "YYYY/MM/DD"), ("time", "HH:MM"), ("moving_time", "HH:MM:SS")],
+    )
+    def test_sqlite_check_matches_validator(
+        self, session: Session, field: str, format: str
+    ):
+        values = [value for value in FIELD_VALUES[field] if isinstance(value, str)]
+        values += ["2024/02/29", "2025/02/29", "0000/01/01", "2025/04/31", "1:2:3:4"]
+        check = MatchesFormat("value", format)
+        for value in values:
+            matches = session.execute(
+                select(check).select_from(text("(SELECT :value AS value)")),
+                {"value": value},
+            ).scalar_one()
+            _, errors = validate_activity_batch([{**VALID_ACTIVITY, field: value}])
+            assert bool(matches) == (not errors), value
+
+    def test_postgres_check_uses_regular_expression(self):
+        sql = str(MatchesFormat("time", "HH:MM").compile(dialect=postgresql.dialect()))
+        assert sql == "(time ~ '^(2[0-3]|[01]?[0-9]):[0-5]?[0-9]$')"
+
+    def test_unknown_format(self):
+        with pytest.raises(ValueError):
+            MatchesFormat("date", "DD/MM/YYYY")
+
+
+class TestUpsertActivityRows:
+    def test_returns_activities_in_order(self, session: Session):
+        rows = [
+            {**VALID_ACTIVITY, "time": f"0{hour}:00", "distance_km": km}
+            for hour, km in ((7, 3.0), (8, 1.0), (9, 2.0))
+        ]
+        created = upsert_activity_rows(session, rows)
+
+        assert [activity["id"] for activity in created] == [1, 2, 3]
+        assert created[1]["distance_km"] == 1.0
+        assert created[1]["pace_s_per_km"] == 1925
+        assert all(activity["inserted"] for activity in created)
+        assert session.get(Activity, 2).distance_km == 1.0
+
+    def test_updates_activity_with_same_natural_key(self, session: Session):
+        upsert_activity_rows(session, [VALID_ACTIVITY])
+        retried = {**VALID_ACTIVITY, "distance_km": 6.0}
+        other = {**VALID_ACTIVITY, "activity": "ride"}
+        upserted = upsert_activity_rows(session, [retried, other])
+
+        assert [activity["id"] for activity in upserted] == [1, 2]
+        assert [activity["inserted"] for activity in upserted] == [False, True]
+        assert upserted[0]["distance_km"] == 6.0
+        assert count_activities(session) == 2
+        session.expire_all()
+        assert session.get(Activity, 1).distance_km == 6.0
+
+    def test_last_row_with_natural_key_is_kept(self, session: Session):
+        rows = [{**VALID_ACTIVITY, "distance_km": km} for km in (3.0, 1.0)]
+        upserted = upsert_activity_rows(session, rows)
+
+        assert [activity["id"] for activity in upserted] == [1, 1]
+        assert upserted[0]["distance_km"] == 1.0
+        assert count_activities(session) == 1
+
+    def test_empty_batch(self, session: Session):
+        assert upsert_activity_rows(session, []) == []
+
+
+class TestInsertActivitiesTrusted:
+    def test_inserts_valid_rows(self, session: Session):
+        rows = [
+            VALID_ACTIVITY,
+            {**VALID_ACTIVITY, "time": "07:00", "elevation_m": None, "id": 9},
+        ]
+        created, rejects = insert_activities_trusted(session, rows)
+
+        assert rejects == {}
+        assert [activity["id"] for activity in created] == [1, 2]
+        assert created[1]["elevation_m"] is None
+        assert count_activities(session) == 2
+
+    @pytest.mark.parametrize(
+        "field, value",
+        [
+            ("date", "2025/02/30"),
+            ("time", "24:00"),
+            ("moving_time", "30 mins"),
+            ("activity", "swim"),
+            ("perceived_effort", 11),
+            ("perceived_effort", 5.5),
+        ],
+    )
+    def test_rejects_match_validation_errors(self, session: Session, field: str, value):
+        row = {**VALID_ACTIVITY, field: value}
+        _, rejects = insert_activities_trusted(session, [VALID_ACTIVITY, row])
+        _, errors = validate_activity_batch([VALID_ACTIVITY, row])
+
+        assert rejects == errors
+        assert count_activities(session) == 0
+
+    def test_unpadded_dates_are_padded(self, session: Session):
+        created, _ = insert_activities_trusted(
+            session, [{**VALID_ACTIVITY, "date": "2025/2/4"}]
+        )
+        assert created[0]["date"] == "2025/02/04"
+        assert session.get(Activity, 1).date == "2025/02/04"
+
+    def test_unpadded_times_are_padded(self, session: Session):
+        created, _ = insert_activities_trusted(
+            session, [{**VALID_ACTIVITY, "time": "9:05"}]
+        )
+        assert created[0]["time"] == "09:05"
+
+    def test_values_the_database_converts_are_matched(self, session: Session):
+        created, rejects = insert_activities_trusted(
+            session, [{**VALID_ACTIVITY, "user_id": "1"}]
+        )
+        assert rejects == {}
+        assert created[0]["id"] == 1
+        assert created[0]["user_id"] == 1
+
+    def test_value_the_driver_cannot_convert_is_rejected(self, session: Session):
+        row = {**VALID_ACTIVITY, "distance_km": "abc"}
+        _, rejects = insert_activities_trusted(session, [VALID_ACTIVITY, row])
+
+        assert list(rejects) == [1]
+        assert "could not convert string to float" in rejects[1][0]
+        assert count_activities(session) == 0
+
+    def test_missing_field(self, session: Session):
+        row = {key: value for key, value in VALID_ACTIVITY.items() if key != "time"}
+        _, rejects = insert_activities_trusted(session, [row])
+        assert rejects == {0: ["time - Field required"]}
+
+    def test_sqlite_constraint_rejects_fractional_perceived_effort(
+        self, session: Session
+    ):
+        with pytest.raises(IntegrityError, match="activity_perceived_effort_range"):
+            upsert_activity_rows(session, [{**VALID_ACTIVITY, "perceived_effort": 5.5}])
+
+    def test_finds_every_rejected_row(self, session: Session):
+        rows = [{**VALID_ACTIVITY, "time": f"{i // 60}:{i % 60}"} for i in range(100)]
+        for row in (3, 50, 51, 99):
+            rows[row]["perceived_effort"] = 0
+        _, rejects = insert_activities_trusted(session, rows)
+
+        assert sorted(rejects) == [3, 50, 51, 99]
+        assert count_activities(session) == 0
@@ -1,9 +1,12 @@
 import pytest
 
 from input_handler.input_handler import (
+    get_activity_id,
     get_dates,
     get_user_id,
+    get_year,
     is_valid_date,
+    parse_user_ids,
     plot_activity_input,
     plot_all_activity_data,
     exit,
@@ -22,6 +25,28 @@ class TestGetUserId:
         assert result == "1"
 
 
+class TestGetYear:
+    def test_get_year_returns_year(self, mocker):
+        input_mock = mocker.patch("builtins.input")
+        input_mock.return_value = "2025"
+
+        result = get_year()
+
+        assert result == "2025"
+
+
+class TestParseUserIds:
+    def test_parse_user_ids_single_id(self):
+        assert parse_user_ids("1") == [1]
+
+    def test_parse_user_ids_comma_separated_ids(self):
+        assert parse_user_ids("3, 1,2,3") == [3, 1, 2]
+
+    def test_parse_user_ids_returns_none_for_invalid_ids(self):
+        assert parse_user_ids("1,a") is None
+        assert parse_user_ids("1,") is None
+
+
 class TestPlotAllActivityData:
     def test_plot_all_activity_data_returns_true(self, mocker):
         input_mock = mocker.patch("builtins.input")
@@ -109,3 +134,13 @@ class TestExit:
 #     #assert that the get_user_id is called in the else block
 #     #(should be 0 if input is correct)
 #     assert func_mock.call_count == 1
+
+
+class TestGetActivityId:
+    def test_get_activity_id_returns_activity_id(self, mocker):
+        input_mock = mocker.patch("builtins.input")
+        input_mock.return_value = "3"
+
+        result = get_activity_id()
+
+        assert result == "3"
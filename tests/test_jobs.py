@@ -0,0 +1,201 @@
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+import json
+
+import pytest
+from pydantic import ValidationError
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.pool import StaticPool
+
+import jobs
+from database.models import Activity, Job, TrainingLoad, User
+from jobs import JobManager, JobQueueFullError, job_to_public
+
+
+class ImmediateExecutor:
+    """runs submitted jobs straight away, in the calling thread"""
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class PendingExecutor(ImmediateExecutor):
+    """queues submitted jobs without running them"""
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        return Future()
+
+
+class ShutDownExecutor(ImmediateExecutor):
+    """refuses submitted jobs, as an executor that has been shut down does"""
+
+    def submit(self, fn, *args):
+        raise RuntimeError("cannot schedule new futures after shutdown")
+
+
+@pytest.fixture(name="engine")
+def engine_fixture(monkeypatch):
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(jobs, "engine", engine)
+    with Session(engine) as session:
+        session.add(User(user_id=1, name="Test", email="test email"))
+        session.add(
+            Activity(
+                user_id=1,
+                date="2025/03/01",
+                time="17:30",
+                activity="run",
+                activity_type="road",
+                moving_time="00:30:00",
+                distance_km=5,
+                perceived_effort=5,
+            )
+        )
+        session.commit()
+    return engine
+
+
+class TestJobManager:
+    def test_job_result_is_saved(self, engine):
+        manager = JobManager(engine, executor=ImmediateExecutor())
+        with Session(engine) as session:
+            job = manager.submit(session, "rebuild_state", {"user_id": 1})
+            session.refresh(job)
+
+            assert job.status == "succeeded"
+            assert json.loads(job.result) == {"user_id": 1}
+            assert job.expires_at > job.completed_at
+            assert session.get(TrainingLoad, 1) is not None
+
+    def test_failed_job_saves_error(self, engine, monkeypatch):
+        def failing_job(job_id, params):
+            raise RuntimeError("broken")
+
+        monkeypatch.setitem(jobs.JOB_FUNCTIONS, "rebuild_state", failing_job)
+        manager = JobManager(engine, executor=ImmediateExecutor())
+        with Session(engine) as session:
+            job = manager.submit(session, "rebuild_state", {"user_id": 1})
+            session.refresh(job)
+
+            assert job.status == "failed"
+            assert "broken" in job.error
+            assert manager.active_job_ids == set()
+
+    def test_job_the_executor_refuses_fails(self, engine):
+        manager = JobManager(engine, executor=ShutDownExecutor())
+        with Session(engine) as session:
+            job = manager.submit(session, "export", {"user_id": 1})
+
+            assert job.status == "failed"
+            assert "shutdown" in job.error
+            assert manager.active_job_ids == set()
+
+    def test_identical_in_flight_job_is_deduplicated(self, engine):
+        executor = PendingExecutor()
+        manager = JobManager(engine, executor=executor)
+        with Session(engine) as session:
+            first_job = manager.submit(session, "export", {"user_id": 1})
+            second_job = manager.submit(
+                session, "export", {"user_id": 1, "start_date": "1981/01/01"}
+            )
+
+            assert first_job.id == second_job.id
+        assert executor.submitted == 1
+
+    def test_different_params_are_not_deduplicated(self, engine):
+        executor = PendingExecutor()
+        manager = JobManager(engine, executor=executor)
+        with Session(engine) as session:
+            first_job = manager.submit(session, "export", {"user_id": 1})
+            second_job = manager.submit(session, "export", {"user_id": 2})
+
+            assert first_job.id != second_job.id
+        assert executor.submitted == 2
+
+    def test_succeeded_job_result_is_reused(self, engine):
+        executor = ImmediateExecutor()
+        manager = JobManager(engine, executor=executor)
+        with Session(engine) as session:
+            first_job = manager.submit(session, "rebuild_state", {"user_id": 1})
+            second_job = manager.submit(session, "rebuild_state", {"user_id": 1})
+
+            assert first_job.id == second_job.id
+        assert executor.submitted == 1
+
+    def test_succeeded_job_is_rerun_after_data_changes(self, engine):
+        executor = ImmediateExecutor()
+        manager = JobManager(engine, executor=executor)
+        with Session(engine) as session:
+            first_job = manager.submit(session, "export", {"user_id": 1})
+            session.get(User, 1).data_version += 1
+            session.commit()
+            second_job = manager.submit(session, "export", {"user_id": 1})
+
+            assert first_job.id != second_job.id
+        assert executor.submitted == 2
+
+    def test_expired_job_is_evicted_and_rerun(self, engine):
+        executor = ImmediateExecutor()
+        manager = JobManager(engine, executor=executor, ttl_s=0)
+        with Session(engine) as session:
+            manager.submit(session, "rebuild_state", {"user_id": 1})
+            manager.submit(session, "rebuild_state", {"user_id": 1})
+
+            assert len(session.exec(select(Job)).all()) == 1
+        assert executor.submitted == 2
+
+    def test_queue_full_raises_error(self, engine):
+        manager = JobManager(engine, executor=PendingExecutor(), max_queued=1)
+        with Session(engine) as session:
+            manager.submit(session, "export", {"user_id": 1})
+            with pytest.raises(JobQueueFullError):
+                manager.submit(session, "export", {"user_id": 2})
+
+    def test_invalid_params_raise_validation_error(self, engine):
+        manager = JobManager(engine, executor=PendingExecutor())
+        with Session(engine) as session:
+            with pytest.raises(ValidationError):
+                manager.submit(session, "plot", {"user_id": 1, "plot": "unknown"})
+
+    def test_fail_interrupted_jobs(self, engine):
+        manager = JobManager(engine, executor=PendingExecutor())
+        with Session(engine) as session:
+            job = manager.submit(session, "export", {"user_id": 1})
+            manager.fail_interrupted_jobs()
+            session.refresh(job)
+
+            assert job.status == "failed"
+
+
+class TestJobToPublic:
+    def test_params_and_result_are_decoded(self):
+        job = Job(
+            id=1,
+            kind="rebuild_state",
+            params='{"user_id": 1}',
+            job_key='rebuild_state:{"user_id": 1}',
+            status="succeeded",
+            result='{"user_id": 1}',
+            created_at=datetime(2025, 3, 1),
+            completed_at=datetime(2025, 3, 1) + timedelta(seconds=1),
+        )
+        public_job = job_to_public(job)
+
+        assert public_job.params == {"user_id": 1}
+        assert public_job.result == {"user_id": 1}
@@ -0,0 +1,80 @@
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from analytics.derived_state import (
+    bump_data_versions,
+    on_activity_created,
+    on_activity_updated,
+)
+from database.models import Activity, User
+from database.notifications import ActivityListener
+
+
+def make_activity(user_id):
+    return Activity(
+        user_id=user_id,
+        date="2025/03/01",
+        time="17:30",
+        activity="run",
+        activity_type="road",
+        moving_time="00:30:00",
+        distance_km=5,
+        perceived_effort=5,
+    )
+
+
+@pytest.fixture(name="engine")
+def engine_fixture():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(user_id=1, name="Test", email="test email"))
+        session.commit()
+    return engine
+
+
+class TestActivityListenerPolling:
+    def test_listener_polls_data_version_on_sqlite(self, engine):
+        listener = ActivityListener(engine, user_id=1)
+        assert listener.has_changed() is False
+
+        with Session(engine) as session:
+            activity = make_activity(1)
+            session.add(activity)
+            session.flush()
+            # notifications are Postgres only, so this only bumps the data_version
+            on_activity_created(session, activity)
+            session.commit()
+
+        assert listener.has_changed() is True
+        assert listener.has_changed() is False
+        listener.close()
+
+    def test_updated_activity_is_a_change(self, engine):
+        with Session(engine) as session:
+            activity = make_activity(1)
+            session.add(activity)
+            session.commit()
+            session.refresh(activity)
+            listener = ActivityListener(engine, user_id=1)
+
+            previous = activity.model_dump()
+            activity.distance_km = 10
+            on_activity_updated(session, previous, activity)
+            session.commit()
+
+        assert listener.has_changed() is True
+        listener.close()
+
+    def test_change_before_listening_is_reported(self, engine):
+        with Session(engine) as session:
+            bump_data_versions(session, {1})
+            session.commit()
+        listener = ActivityListener(engine, user_id=1, data_version=0)
+
+        assert listener.has_changed() is True
+        assert listener.has_changed() is False
+        listener.close()
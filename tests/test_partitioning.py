@@ -0,0 +1,51 @@
+from datetime import date
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from database.partitioning import (
+    next_partition_start,
+    partition_ranges,
+    partitioned_activity_table_ddl,
+)
+
+
+class TestNextPartitionStart:
+    def test_next_month(self):
+        assert next_partition_start(date(2025, 3, 1), "month") == date(2025, 4, 1)
+
+    def test_next_month_wraps_year(self):
+        assert next_partition_start(date(2025, 12, 1), "month") == date(2026, 1, 1)
+
+    def test_next_year(self):
+        assert next_partition_start(date(2025, 1, 1), "year") == date(2026, 1, 1)
+
+
+class TestPartitionRanges:
+    def test_monthly_ranges_cover_start_to_end(self):
+        ranges = partition_ranges("month", date(2024, 11, 15), date(2025, 1, 3))
+        assert ranges == [
+            ("activity_table_2024_11", "2024/11/01", "2024/12/01"),
+            ("activity_table_2024_12", "2024/12/01", "2025/01/01"),
+            ("activity_table_2025_01", "2025/01/01", "2025/02/01"),
+        ]
+
+    def test_yearly_ranges(self):
+        ranges = partition_ranges("year", date(2024, 6, 1), date(2025, 2, 1))
+        assert ranges == [
+            ("activity_table_2024", "2024/01/01", "2025/01/01"),
+            ("activity_table_2025", "2025/01/01", "2026/01/01"),
+        ]
+
+    def test_unknown_interval_raises_value_error(self):
+        with pytest.raises(ValueError):
+            partition_ranges("week", date(2025, 1, 1), date(2025, 2, 1))
+
+
+class TestPartitionedActivityTableDdl:
+    def test_ddl_is_partitioned_by_date(self):
+        ddl = partitioned_activity_table_ddl(postgresql.dialect())
+        assert ddl.startswith("CREATE TABLE activity_table")
+        assert "PRIMARY KEY (id, date)" in ddl
+        assert "REFERENCES user_table (user_id)" in ddl
+        assert ddl.endswith("PARTITION BY RANGE (date)")
@@ -1,11 +1,15 @@
 from visualisation.plots_utils import (
     calculate_pace_mins_per_km,
     calculate_time_secs,
+    concat_compact_dataframes,
     convert_pace_to_float,
     create_dataframe,
+    create_users_dataframe,
     format_query_output,
     select_activity_data,
+    select_users_activity_data,
 )
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -55,6 +59,9 @@ class TestCalculatePace:
         result = calculate_pace_mins_per_km(distance, moving_time)
         assert result == expected
 
+    def test_calculate_pace_min_per_km_no_distance(self):
+        assert calculate_pace_mins_per_km(0.0, "00:30:00") is None
+
 
 class TestConvertPaceToFloat:
     def test_convert_pace_to_float(self):
@@ -113,6 +120,41 @@ class TestSelectActivityData:
         assert result == []
 
 
+class TestSelectUsersActivityData:
+    def test_select_users_activity_data_includes_user_names(self):
+        # testing seeded data, assuming no more data added between the given dates
+        date_start = "2025/02/09"
+        date_end = "2025/02/11"
+        result = select_users_activity_data([2, 1], date_start, date_end)
+        assert len(result) == 1
+        assert result[0]["id"] == 9
+        assert result[0]["user_id"] == 1
+        assert result[0]["user_name"] == "luc"
+
+    def test_select_users_activity_data_no_activities(self):
+        assert select_users_activity_data([2, 3]) == []
+
+
+class TestCreateUsersDataframe:
+    def test_create_users_dataframe_orders_users(self):
+        # testing seeded data, user 2 has no activities
+        result = create_users_dataframe([2, 1], "2025/02/01", "2025/02/11")
+        assert list(result["user_id"].cat.categories) == [2, 1]
+        assert (result["user_id"] == 1).all()
+        assert result["date"].is_monotonic_increasing
+        assert set(result["user_name"]) == {"luc"}
+
+    def test_create_users_dataframe_is_compact(self):
+        result = create_users_dataframe([1], "1981/01/01", "2081/01/01")
+        assert "pace" not in result
+        assert result["activity"].dtype == "category"
+        assert result["pace_numeric"].dtype == "float32"
+
+    def test_create_users_dataframe_raises_key_error(self):
+        with pytest.raises(KeyError):
+            create_users_dataframe([2, 3], "1981/01/01", "2081/01/01")
+
+
 class TestCreateDataframe:
     def test_create_dataframe_creates_a_dataframe(self):
         data = [
@@ -150,7 +192,80 @@ class TestCreateDataframe:
         result = create_dataframe(data)
         pd.testing.assert_frame_equal(expected_df, result)
 
+    def test_create_dataframe_uses_pace_s_per_km(self):
+        data = [
+            {"date": "2025/02/25", "distance_km": 5.0, "pace_s_per_km": 361.5},
+            {"date": "2025/02/24", "distance_km": 0.0, "pace_s_per_km": None},
+        ]
+        result = create_dataframe(data)
+        assert result["pace"].tolist() == ["6:01", None]
+        assert result["pace_numeric"].iloc[0] == 6.02
+        assert np.isnan(result["pace_numeric"].iloc[1])
+
+    def test_create_dataframe_no_pace_for_zero_distance(self):
+        data = [{"date": "2025/02/25", "distance_km": 0.0, "moving_time": "00:30:00"}]
+        result = create_dataframe(data)
+        assert result["pace"].tolist() == [None]
+        assert np.isnan(result["pace_numeric"].iloc[0])
+
+    def test_create_dataframe_compact(self):
+        data = [
+            {
+                "date": "2025/02/25",
+                "time": "17:30",
+                "activity": "run",
+                "activity_type": "road",
+                "distance_km": 5.0,
+                "moving_time": "00:30:00",
+                "perceived_effort": 5,
+                "elevation_m": None,
+            },
+            {
+                "date": "2025/02/24",
+                "time": "07:00",
+                "activity": "run",
+                "activity_type": "trail",
+                "distance_km": 1.0,
+                "moving_time": "00:07:00",
+                "perceived_effort": 8,
+                "elevation_m": 20,
+            },
+        ]
+        result = create_dataframe(data, compact=True)
+        assert "pace" not in result
+        assert "moving_time" not in result
+        assert result["moving_time_s"].tolist() == [1800, 420]
+        assert result["pace_numeric"].tolist() == [6.0, 7.0]
+        assert result.dtypes.to_dict() == {
+            "date": np.dtype("datetime64[ns]"),
+            "time": "category",
+            "activity": "category",
+            "activity_type": "category",
+            "distance_km": np.float32,
+            "perceived_effort": np.int8,
+            "elevation_m": np.float32,
+            "moving_time_s": np.int32,
+            "pace_numeric": np.float32,
+        }
+
     def test_create_dataframe_raises_key_error(self):
         data = []
         with pytest.raises(KeyError):
             create_dataframe(data)
+
+
+class TestConcatCompactDataframes:
+    def test_concat_compact_dataframes_keeps_categories(self):
+        first = create_dataframe(
+            [{"date": "2025/02/25", "activity_type": "road", "pace_s_per_km": 360}],
+            compact=True,
+        )
+        second = create_dataframe(
+            [{"date": "2025/02/26", "activity_type": "trail", "pace_s_per_km": 300}],
+            compact=True,
+        )
+        result = concat_compact_dataframes([first, second])
+        assert list(result.columns) == list(first.columns)
+        assert result["activity_type"].dtype == "category"
+        assert result["activity_type"].tolist() == ["road", "trail"]
+        assert result["pace_numeric"].tolist() == [6.0, 5.0]
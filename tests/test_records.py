@@ -0,0 +1,64 @@
+from analytics.records import (
+    calculate_record_value,
+    find_best_records,
+    is_better_record,
+)
+from database.models import Activity
+
+
+class TestCalculateRecordValue:
+    def test_distance_bucket_scales_time_to_bucket_distance(self):
+        result = calculate_record_value("fastest_5k", 10.0, "01:00:00", None)
+        assert result == 1800
+
+    def test_distance_bucket_ineligible_if_too_short(self):
+        result = calculate_record_value("fastest_10k", 9.9, "01:00:00", None)
+        assert result is None
+
+    def test_best_pace_ineligible_for_zero_distance(self):
+        result = calculate_record_value("best_pace", 0, "00:10:00", None)
+        assert result is None
+
+
+class TestIsBetterRecord:
+    def test_lower_is_better_for_times(self):
+        assert is_better_record("fastest_5k", 1500, 1600)
+        assert not is_better_record("fastest_5k", 1600, 1600)
+
+    def test_higher_is_better_for_distance(self):
+        assert is_better_record("longest_distance", 12.0, 10.0)
+
+
+class TestFindBestRecords:
+    def test_find_best_records(self):
+        activities = [
+            Activity(
+                id=1,
+                user_id=1,
+                date="2025/03/01",
+                time="17:00",
+                activity="run",
+                activity_type="road",
+                moving_time="00:30:00",
+                distance_km=5.0,
+                perceived_effort=5,
+                elevation_m=None,
+            ),
+            Activity(
+                id=2,
+                user_id=1,
+                date="2025/03/02",
+                time="17:00",
+                activity="run",
+                activity_type="trail",
+                moving_time="01:10:00",
+                distance_km=10.0,
+                perceived_effort=5,
+                elevation_m=200,
+            ),
+        ]
+        result = find_best_records(activities)
+        assert result["fastest_5k"][1].id == 1
+        assert result["fastest_10k"][1].id == 2
+        assert result["longest_distance"] == (10.0, activities[1])
+        assert result["most_elevation"][0] == 200
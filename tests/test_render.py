@@ -0,0 +1,51 @@
+from visualisation.render import (
+    choose_render_mode,
+    is_vector_output,
+    lttb_downsample,
+)
+import numpy as np
+
+# visual test for plots done manually
+
+
+class TestLttbDownsample:
+    def test_lttb_downsample_keeps_first_last_and_threshold_points(self):
+        x = np.arange(1000)
+        y = np.sin(x / 50)
+        result = lttb_downsample(x, y, 100)
+        assert len(result) == 100
+        assert result[0] == 0
+        assert result[-1] == 999
+        assert (np.diff(result) > 0).all()
+
+    def test_lttb_downsample_keeps_spike(self):
+        x = np.arange(100)
+        y = np.zeros(100)
+        y[42] = 10
+        result = lttb_downsample(x, y, 10)
+        assert 42 in result
+
+    def test_lttb_downsample_returns_all_points_below_threshold(self):
+        result = lttb_downsample([1, 2, 3], [1, 2, 3], 10)
+        assert list(result) == [0, 1, 2]
+
+
+class TestChooseRenderMode:
+    def test_auto_uses_markers_for_small_data(self):
+        assert choose_render_mode(100) == "markers"
+
+    def test_auto_downsamples_large_time_series(self):
+        assert choose_render_mode(50000, time_series=True) == "lttb"
+
+    def test_auto_uses_density_for_large_scatter(self):
+        assert choose_render_mode(50000) == "density"
+
+    def test_explicit_mode_unchanged(self):
+        assert choose_render_mode(10, "density") == "density"
+
+
+class TestIsVectorOutput:
+    def test_is_vector_output(self):
+        assert is_vector_output("plot.SVG")
+        assert not is_vector_output("plot.png")
+        assert not is_vector_output(None)
@@ -3,14 +3,31 @@
 # only tests for users endpoint are included below to practice testing the sqlmodels and endpoints.
 # Tests for checking the field constraints also included
 
+import datetime
+import time
+
+import numpy as np
 import pytest  
+from fastapi.requests import Request
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel import Session, SQLModel, create_engine, select
 from sqlmodel.pool import StaticPool
 
-from database.database import get_session
-from routes import app
-from database.models import Activity, User
+from database.database import (
+    LAST_WRITE_COOKIE,
+    READ_YOUR_WRITES_SECONDS,
+    get_read_session,
+    get_session,
+    wrote_recently,
+)
+import jobs
+import routes
+from admission import AdmissionLimiter
+from routes import admission_limiters, app
+from database.group_commit import GroupCommitBuffer
+from database.models import Activity, ActivityStream, TrendlineStats, User
+from database.streams import encode_track_stream, save_activity_stream
+from tests.test_track_files import GPX
 
 
 @pytest.fixture(name="session")  
@@ -36,6 +53,7 @@ def client_fixture(session: Session):
         return session
 
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_read_session] = get_session_override
 
     client = TestClient(app)
     yield client 
@@ -140,6 +158,17 @@ class TestDeleteUser:
         assert users_in_db is None
         assert data == {"message": "User_id 1 deleted"}
 
+    def test_delete_user_deletes_derived_state(
+        self, session: Session, client: TestClient
+    ):
+        session.add(User(name="test_1", email="test email 1"))
+        session.add(TrendlineStats(user_id=1, metric="distance_km", n=1))
+        session.commit()
+
+        response = client.delete("/users/1")
+        assert response.status_code == 200
+        assert session.exec(select(TrendlineStats)).all() == []
+
 
 class TestCreateActivity:
     def test_endpoint_returns_200_status_code_on_success(self, client: TestClient):
@@ -172,6 +201,9 @@ class TestCreateActivity:
         response = client.post("/activities/", json=activity_test)
         new_activity = response.json()
         activity_test["id"] = 1
+        activity_test["moving_time_s"] = 30
+        activity_test["pace_s_per_km"] = 30 / 5.25
+        activity_test["speed_kmh"] = 5.25 * 3600 / 30
         assert new_activity == activity_test
 
 
@@ -215,6 +247,104 @@ class TestCreateActivity:
         assert "moving_time" in data["detail"]
         assert "perceived_effort" in data["detail"]
 
+    def test_retried_activity_updates_rather_than_duplicates(
+        self, session: Session, client: TestClient
+    ):
+        activity_test = {
+            "user_id": 1,
+            "date": "2025/10/10",
+            "time": "17:30",
+            "activity": "run",
+            "activity_type": "trail",
+            "moving_time": "00:30:00",
+            "distance_km": 5,
+            "perceived_effort": 5,
+        }
+        first = client.post("/activities/", json=activity_test).json()
+        response = client.post("/activities/", json=activity_test | {"distance_km": 6})
+
+        assert response.status_code == 200
+        assert response.json()["id"] == first["id"]
+        assert response.json()["pace_s_per_km"] == 300
+        assert len(session.exec(select(Activity)).all()) == 1
+        training_load = client.get("/users/1/training-load").json()
+        assert training_load["acute_load_km"] == 6
+
+    def test_retried_activity_with_unpadded_time_updates(
+        self, session: Session, client: TestClient
+    ):
+        activity_test = {
+            "user_id": 1,
+            "date": "2025/10/10",
+            "time": "09:05",
+            "activity": "run",
+            "activity_type": "trail",
+            "moving_time": "00:30:00",
+            "distance_km": 5,
+            "perceived_effort": 5,
+        }
+        first = client.post("/activities/", json=activity_test).json()
+        response = client.post("/activities/", json=activity_test | {"time": "9:05"})
+
+        assert response.json()["id"] == first["id"]
+        assert response.json()["time"] == "09:05"
+        assert len(session.exec(select(Activity)).all()) == 1
+
+    def test_retried_activity_updates_derived_state_without_rebuilding(
+        self, session: Session, client: TestClient, monkeypatch
+    ):
+        def rebuild(session, activities):
+            raise AssertionError("derived state rebuilt")
+
+        monkeypatch.setattr(routes, "on_activities_created", rebuild)
+        activity_test = {
+            "user_id": 1,
+            "date": "2025/10/10",
+            "time": "17:30",
+            "activity": "run",
+            "activity_type": "trail",
+            "moving_time": "00:30:00",
+            "distance_km": 5,
+            "perceived_effort": 5,
+        }
+        client.post("/activities/", json=activity_test)
+        response = client.post("/activities/", json=activity_test | {"distance_km": 6})
+
+        assert response.status_code == 200
+        trendline_stats = session.exec(select(TrendlineStats)).all()
+        assert {stats.n for stats in trendline_stats} == {1}
+        records = client.get("/users/1/records").json()
+        best_pace = [record for record in records if record["record"] == "best_pace"]
+        assert best_pace[0]["value"] == 300
+
+    def test_retried_activity_with_group_commit_is_upserted(
+        self, session: Session, client: TestClient, monkeypatch
+    ):
+        buffer = GroupCommitBuffer(
+            lambda: Session(session.get_bind(), expire_on_commit=False),
+            max_delay_ms=1,
+            write=routes.upsert_new_activity,
+        )
+        monkeypatch.setattr(routes, "activity_buffer", buffer)
+        activity_test = {
+            "user_id": 1,
+            "date": "2025/10/10",
+            "time": "17:30",
+            "activity": "run",
+            "activity_type": "trail",
+            "moving_time": "00:30:00",
+            "distance_km": 5,
+            "perceived_effort": 5,
+        }
+        first = client.post("/activities/", json=activity_test).json()
+        response = client.post("/activities/", json=activity_test | {"distance_km": 6})
+        buffer.close()
+
+        assert response.status_code == 200
+        assert response.json()["id"] == first["id"]
+        assert response.json()["pace_s_per_km"] == 300
+        assert len(session.exec(select(Activity)).all()) == 1
+
 
 class TestUpdateActivity:
     def test_endpoint_returns_200_status_code_on_success(self, client: TestClient, session: Session):
@@ -270,4 +400,976 @@ class TestUpdateActivity:
         assert "time" in data[1]["loc"]
         assert "activity" in data[2]["loc"]
         assert "moving_time" in data[3]["loc"]
-        assert "perceived_effort" in data[4]["loc"]
\ No newline at end of file
+        assert "perceived_effort" in data[4]["loc"]
+
+class TestGetTrainingLoad:
+    def test_training_load_updated_by_activity_writes(self, client: TestClient):
+        activity_test = {
+            "user_id": 1,
+            "date": "2025/03/01",
+            "time": "17:30",
+            "activity": "run",
+            "activity_type": "road",
+            "moving_time": "00:30:00",
+            "distance_km": 7,
+            "perceived_effort": 5,
+        }
+        client.post("/activities/", json=activity_test)
+        client.post("/activities/", json=activity_test | {"date": "2025/03/05"})
+
+        response = client.get("/users/1/training-load")
+        data = response.json()
+        assert response.status_code == 200
+        assert data["date"] == "2025/03/05"
+        assert data["acute_load_km"] == 14
+        assert data["chronic_load_km"] == 14
+
+        client.delete("/activities/2")
+        data = client.get("/users/1/training-load").json()
+        assert data["date"] == "2025/03/01"
+        assert data["acute_load_km"] == 7
+
+    def test_training_load_raises_404_without_activities(self, client: TestClient):
+        response = client.get("/users/1/training-load")
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Training load not found"
+
+
+class TestGetPersonalRecords:
+    def add_activity(self, client: TestClient, **fields):
+        activity_test = {
+            "user_id": 1,
+            "date": "2025/03/01",
+            "time": "17:30",
+            "activity": "run",
+            "activity_type": "road",
+            "moving_time": "00:30:00",
+            "distance_km": 5,
+            "perceived_effort": 5,
+            "elevation_m": 50,
+        }
+        return client.post("/activities/", json=activity_test | fields).json()
+
+    def get_records(self, client: TestClient):
+        response = client.get("/users/1/records")
+        assert response.status_code == 200
+        return {record["record"]: record for record in response.json()}
+
+    def test_records_created_and_beaten(self, client: TestClient):
+        self.add_activity(client)
+        self.add_activity(
+            client, time="18:30", moving_time="00:25:00", elevation_m=10
+        )
+        records = self.get_records(client)
+
+        assert records["fastest_5k"]["value"] == 1500
+        assert records["fastest_5k"]["activity_id"] == 2
+        assert records["most_elevation"]["activity_id"] == 1
+        assert records["best_pace"]["value"] == 300
+        assert "fastest_10k" not in records
+
+    def test_records_recomputed_on_update_and_delete(self, client: TestClient):
+        self.add_activity(client)
+        self.add_activity(client, time="18:30", moving_time="00:25:00")
+
+        client.patch("/activities/2", json={"moving_time": "00:35:00"})
+        records = self.get_records(client)
+        assert records["fastest_5k"]["activity_id"] == 1
+
+        client.delete("/activities/1")
+        records = self.get_records(client)
+        assert records["fastest_5k"]["activity_id"] == 2
+        assert records["fastest_5k"]["value"] == 2100
+
+        client.delete("/activities/2")
+        assert self.get_records(client) == {}
+
+
+class TestGetTrendlines:
+    def add_activity(self, client: TestClient, **fields):
+        activity_test = {
+            "user_id": 1,
+            "date": "2025/03/01",
+            "time": "17:30",
+            "activity": "run",
+            "activity_type": "road",
+            "moving_time": "00:30:00",
+            "distance_km": 5,
+            "perceived_effort": 5,
+        }
+        return client.post("/activities/", json=activity_test | fields).json()
+
+    def test_linear_trendline_from_running_statistics(self, client: TestClient):
+        self.add_activity(client, distance_km=5, moving_time="00:30:00")
+        self.add_activity(client, time="18:30", distance_km=10, moving_time="01:10:00")
+        self.add_activity(client, time="19:30", distance_km=20, moving_time="05:00:00")
+        client.delete("/activities/3")
+
+        response = client.get("/users/1/trendlines")
+        trendlines = {trendline["metric"]: trendline for trendline in response.json()}
+
+        assert response.status_code == 200
+        assert trendlines["distance_km"]["n"] == 2
+        assert trendlines["distance_km"]["slope"] == pytest.approx(0.2)
+        assert trendlines["distance_km"]["intercept"] == pytest.approx(5.0)
+        assert trendlines["elevation_m"]["n"] == 0
+        assert trendlines["elevation_m"]["slope"] is None
+
+    def test_robust_trendline_computed_on_demand(self, client: TestClient):
+        self.add_activity(client, distance_km=5, moving_time="00:30:00")
+        self.add_activity(client, time="18:30", distance_km=10, moving_time="01:10:00")
+        self.add_activity(client, time="19:30", distance_km=15, moving_time="02:00:00")
+
+        response = client.get("/users/1/trendlines", params={"fit": "robust"})
+        trendlines = {trendline["metric"]: trendline for trendline in response.json()}
+
+        assert response.status_code == 200
+        assert trendlines["distance_km"]["fit"] == "robust"
+        assert trendlines["distance_km"]["slope"] == pytest.approx(0.2)
+
+    def test_stats_deleted_with_last_activity(
+        self, session: Session, client: TestClient
+    ):
+        activity = self.add_activity(client)
+        client.delete(f"/activities/{activity['id']}")
+        assert session.exec(select(TrendlineStats)).all() == []
+
+    def test_invalid_fit_raises_422(self, client: TestClient):
+        response = client.get("/users/1/trendlines", params={"fit": "cubic"})
+        assert response.status_code == 422
+
+
+class TestBatchActivities:
+    def add_activities(self, session: Session, count: int):
+        for i in range(count):
+            session.add(
+                Activity(
+                    user_id=1,
+                    date=f"2025/03/{i + 1:02d}",
+                    time="17:30",
+                    activity="run",
+                    activity_type="road",
+                    moving_time="00:30:00",
+                    distance_km=5 + i,
+                    perceived_effort=5,
+                )
+            )
+        session.commit()
+
+    def test_get_activities_by_ids(self, session: Session, client: TestClient):
+        self.add_activities(session, 3)
+        response = client.get("/activities/batch", params={"ids": "3,1,7"})
+        data = response.json()
+
+        assert response.status_code == 200
+        assert [activity["id"] for activity in data] == [3, 1]
+
+    def test_get_activities_by_ids_raises_422_for_invalid_ids(self, client: TestClient):
+        response = client.get("/activities/batch", params={"ids": "1,two"})
+        assert response.status_code == 422
+
+    def test_update_activities(self, session: Session, client: TestClient):
+        self.add_activities(session, 3)
+        updates = [
+            {"id": 1, "distance_km": 10.5, "time": "06:00"},
+            {"id": 3, "perceived_effort": 9},
+        ]
+        response = client.patch("/activities/batch", json=updates)
+        data = response.json()
+
+        assert response.status_code == 200
+        assert data[0]["distance_km"] == 10.5
+        assert data[0]["time"] == "06:00"
+        assert data[1]["perceived_effort"] == 9
+        assert data[1]["distance_km"] == 7
+        assert session.get(Activity, 2).distance_km == 6
+
+    def test_update_activities_raises_422_for_incorrect_fields(
+        self, session: Session, client: TestClient
+    ):
+        self.add_activities(session, 2)
+        updates = [{"id": 1, "time": "5pm"}, {"id": 2, "activity": "running"}]
+        response = client.patch("/activities/batch", json=updates)
+        assert response.status_code == 422
+
+    def test_update_activities_raises_404_for_missing_ids(
+        self, session: Session, client: TestClient
+    ):
+        self.add_activities(session, 1)
+        updates = [{"id": 1, "time": "06:00"}, {"id": 5, "time": "07:00"}]
+        response = client.patch("/activities/batch", json=updates)
+
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Activities not found: [5]"
+        assert session.get(Activity, 1).time == "17:30"
+
+    def test_delete_activities(self, session: Session, client: TestClient):
+        self.add_activities(session, 3)
+        response = client.delete("/activities/batch", params={"ids": "1,3"})
+
+        assert response.status_code == 200
+        assert response.json() == {"message": "Activity ids [1, 3] deleted"}
+        assert session.get(Activity, 1) is None
+        assert session.get(Activity, 2) is not None
+        assert session.get(Activity, 3) is None
+
+
+    def test_create_activities_in_bulk(self, session: Session, client: TestClient):
+        session.add(User(name="Test", email="test email"))
+        session.commit()
+        activities = [
+            {
+                "user_id": 1,
+                "date": f"2025/03/{i + 1:02d}",
+                "time": "17:30",
+                "activity": "run",
+                "activity_type": "road",
+                "moving_time": "00:30:00",
+                "distance_km": 5 + i,
+                "perceived_effort": 5,
+            }
+            for i in range(3)
+        ]
+        response = client.post("/activities/bulk", json=activities)
+        data = response.json()
+
+        assert response.status_code == 200
+        assert [activity["id"] for activity in data] == [1, 2, 3]
+        assert data[2]["distance_km"] == 7
+        assert data[2]["elevation_m"] is None
+        assert session.get(Activity, 3).date == "2025/03/03"
+        records = client.get("/users/1/records").json()
+        assert any(record["value"] == 7 for record in records)
+
+    def test_create_activities_in_bulk_reports_errors_per_row(
+        self, session: Session, client: TestClient
+    ):
+        activity = {
+            "user_id": 1,
+            "date": "2025/03/01",
+            "time": "17:30",
+            "activity": "run",
+            "activity_type": "road",
+            "moving_time": "00:30:00",
+            "distance_km": 5,
+            "perceived_effort": 5,
+        }
+        activities = [activity, {**activity, "time": "5pm", "perceived_effort": 11}]
+        response = client.post("/activities/bulk", json=activities)
+
+        assert response.status_code == 422
+        assert response.json()["detail"] == [
+            {
+                "row": 1,
+                "detail": "Format of data incorrect: "
+                "time - Value error, Time does not match format 'HH:MM', "
+                "perceived_effort - Value error, Perceived_effort not in range 1 - 10",
+            }
+        ]
+        assert session.get(Activity, 1) is None
+
+    def test_create_activities_in_trusted_bulk(
+        self, session: Session, client: TestClient, monkeypatch
+    ):
+        monkeypatch.setattr(routes, "TRUSTED_INGEST_KEY", "secret")
+        activity = {
+            "user_id": 1,
+            "date": "2025/03/01",
+            "time": "17:30",
+            "activity": "run",
+            "activity_type": "road",
+            "moving_time": "00:30:00",
+            "distance_km": 5.0,
+            "perceived_effort": 5,
+        }
+        activities = [activity, {**activity, "activity": "swim"}, activity]
+        response = client.post(
+            "/activities/bulk",
+            params={"trusted": True},
+            headers={"X-Ingest-Key": "secret"},
+            json=activities,
+        )
+
+        assert response.status_code == 422
+        assert response.json()["detail"] == [
+            {
+                "row": 1,
+                "detail": "Format of data incorrect: "
+                "activity - Value error, Activity not in ['run', 'ride']",
+            }
+        ]
+        assert session.get(Activity, 1) is None
+
+        response = client.post(
+            "/activities/bulk",
+            params={"trusted": True},
+            headers={"X-Ingest-Key": "secret"},
+            json=[activity, {**activity, "time": "07:00"}],
+        )
+        assert response.status_code == 200
+        assert [activity["id"] for activity in response.json()] == [1, 2]
+
+    @pytest.mark.parametrize("server_key, key", [(None, None), ("secret", "guess")])
+    def test_trusted_bulk_requires_ingest_key(
+        self, session: Session, client: TestClient, monkeypatch, server_key, key
+    ):
+        monkeypatch.setattr(routes, "TRUSTED_INGEST_KEY", server_key)
+        headers = {"X-Ingest-Key": key} if key else {}
+        response = client.post(
+            "/activities/bulk", params={"trusted": True}, headers=headers, json=[]
+        )
+        assert response.status_code == 403
+
+    def test_trusted_bulk_refused_without_constraints(
+        self, client: TestClient, monkeypatch
+    ):
+        monkeypatch.setattr(routes, "TRUSTED_INGEST_KEY", "secret")
+        monkeypatch.setattr(
+            routes, "missing_constraints", lambda connection, table: table.constraints
+        )
+        response = client.post(
+            "/activities/bulk",
+            params={"trusted": True},
+            headers={"X-Ingest-Key": "secret"},
+            json=[],
+        )
+        assert response.status_code == 409
+
+    def test_retried_bulk_updates_activities(
+        self, session: Session, client: TestClient
+    ):
+        activities = [
+            {
+                "user_id": 1,
+                "date": f"2025/03/{i + 1:02d}",
+                "time": "17:30",
+                "activity": "run",
+                "activity_type": "road",
+                "moving_time": "00:30:00",
+                "distance_km": 5,
+                "perceived_effort": 5,
+            }
+            for i in range(2)
+        ]
+        client.post("/activities/bulk", json=activities)
+        activities[1]["distance_km"] = 6
+        new_activity = {**activities[0], "activity": "ride"}
+        response = client.post("/activities/bulk", json=activities + [new_activity])
+        data = response.json()
+
+        assert response.status_code == 200
+        assert [activity["id"] for activity in data] == [1, 2, 3]
+        assert [activity["inserted"] for activity in data] == [False, False, True]
+        assert session.get(Activity, 2).distance_km == 6
+        assert session.get(Activity, 4) is None
+
+class TestSparseFieldsets:
+    def add_activity(self, session: Session, date: str, user_id: int = 1):
+        session.add(
+            Activity(
+                user_id=user_id,
+                date=date,
+                time="17:30",
+                activity="run",
+                activity_type="road",
+                moving_time="00:30:00",
+                distance_km=5,
+                perceived_effort=5,
+            )
+        )
+        session.commit()
+
+    def test_get_activities_returns_all_fields_by_default(
+        self, session: Session, client: TestClient
+    ):
+        self.add_activity(session, "2025/03/01")
+        data = client.get("/activities/").json()
+        assert set(data[0]) == set(Activity.model_fields)
+
+    def test_get_activities_returns_only_requested_fields(
+        self, session: Session, client: TestClient
+    ):
+        self.add_activity(session, "2025/03/01")
+        response = client.get("/activities/", params={"fields": "date,distance_km"})
+
+        assert response.status_code == 200
+        assert response.json() == [{"date": "2025/03/01", "distance_km": 5.0}]
+
+    def test_get_activities_returns_single_field(
+        self, session: Session, client: TestClient
+    ):
+        self.add_activity(session, "2025/03/01")
+        response = client.get("/activities/", params={"fields": "date"})
+
+        assert response.status_code == 200
+        assert response.json() == [{"date": "2025/03/01"}]
+
+    def test_get_activities_raises_422_for_unknown_fields(self, client: TestClient):
+        response = client.get("/activities/", params={"fields": "date,pace"})
+        assert response.status_code == 422
+        assert "pace" in response.json()["detail"]
+
+    def test_export_activities_filters_user_and_dates(
+        self, session: Session, client: TestClient
+    ):
+        self.add_activity(session, "2025/03/05")
+        self.add_activity(session, "2025/03/01")
+        self.add_activity(session, "2025/04/01")
+        self.add_activity(session, "2025/03/02", user_id=2)
+        response = client.get(
+            "/users/1/activities/export",
+            params={"end_date": "2025/03/31", "fields": "id,date"},
+        )
+
+        assert response.status_code == 200
+        assert response.json() == [
+            {"id": 2, "date": "2025/03/01"},
+            {"id": 1, "date": "2025/03/05"},
+        ]
+
+    def test_get_activities_filters_dates(self, session: Session, client: TestClient):
+        self.add_activity(session, "2025/02/15")
+        self.add_activity(session, "2025/03/05")
+        self.add_activity(session, "2025/04/01")
+        response = client.get(
+            "/activities/",
+            params={
+                "start_date": "2025/03/01",
+                "end_date": "2025/03/31",
+                "fields": "date",
+            },
+        )
+
+        assert response.status_code == 200
+        assert response.json() == [{"date": "2025/03/05"}]
+
+    def test_get_activities_filters_activity_and_pace(
+        self, session: Session, client: TestClient
+    ):
+        self.add_activity(session, "2025/03/01")
+        session.add(
+            Activity(
+                user_id=1,
+                date="2025/03/02",
+                time="17:30",
+                activity="run",
+                activity_type="road",
+                moving_time="00:20:00",
+                distance_km=5,
+                perceived_effort=5,
+            )
+        )
+        session.add(
+            Activity(
+                user_id=1,
+                date="2025/03/03",
+                time="17:30",
+                activity="ride",
+                activity_type="road",
+                moving_time="00:20:00",
+                distance_km=10,
+                perceived_effort=5,
+            )
+        )
+        session.commit()
+        response = client.get(
+            "/activities/",
+            params={
+                "activity": "run",
+                "max_pace_s_per_km": 300,
+                "fields": "date,pace_s_per_km",
+            },
+        )
+
+        assert response.status_code == 200
+        assert response.json() == [{"date": "2025/03/02", "pace_s_per_km": 240.0}]
+
+    def test_get_activities_sorts_by_speed(self, session: Session, client: TestClient):
+        self.add_activity(session, "2025/03/01")
+        session.add(
+            Activity(
+                user_id=1,
+                date="2025/03/02",
+                time="17:30",
+                activity="run",
+                activity_type="road",
+                moving_time="00:30:00",
+                distance_km=0,
+                perceived_effort=5,
+            )
+        )
+        session.add(
+            Activity(
+                user_id=1,
+                date="2025/03/03",
+                time="17:30",
+                activity="ride",
+                activity_type="road",
+                moving_time="00:30:00",
+                distance_km=15,
+                perceived_effort=5,
+            )
+        )
+        session.commit()
+        response = client.get(
+            "/activities/", params={"sort": "-speed_kmh", "fields": "date,speed_kmh"}
+        )
+
+        assert response.status_code == 200
+        assert response.json() == [
+            {"date": "2025/03/03", "speed_kmh": 30.0},
+            {"date": "2025/03/01", "speed_kmh": 10.0},
+            {"date": "2025/03/02", "speed_kmh": 0.0},
+        ]
+
+    def test_get_activities_zero_distance_has_no_pace(
+        self, session: Session, client: TestClient
+    ):
+        session.add(
+            Activity(
+                user_id=1,
+                date="2025/03/02",
+                time="17:30",
+                activity="run",
+                activity_type="treadmill",
+                moving_time="00:30:00",
+                distance_km=0,
+                perceived_effort=5,
+            )
+        )
+        session.commit()
+        data = client.get("/activities/").json()
+        assert data[0]["pace_s_per_km"] is None
+        assert data[0]["moving_time_s"] == 1800
+
+    def test_get_activities_raises_422_for_unknown_sort(self, client: TestClient):
+        response = client.get("/activities/", params={"sort": "-pace"})
+        assert response.status_code == 422
+        assert "pace" in response.json()["detail"]
+
+
+class TestActivityCalendar:
+    def add_activity(self, session: Session, date: str, time: str = "17:30"):
+        session.add(
+            Activity(
+                user_id=1,
+                date=date,
+                time=time,
+                activity="run",
+                activity_type="road",
+                moving_time="00:30:00",
+                distance_km=5,
+                perceived_effort=5,
+            )
+        )
+        session.commit()
+
+    def test_get_activity_calendar(self, session: Session, client: TestClient):
+        self.add_activity(session, "2025/03/01")
+        self.add_activity(session, "2025/3/1", "07:00")
+        self.add_activity(session, "2025/03/02")
+        self.add_activity(session, "2024/03/02")
+        response = client.get("/users/1/calendar", params={"year": 2025})
+
+        assert response.status_code == 200
+        assert response.json() == [
+            {"date": "2025/03/01", "count": 2, "distance_km": 10.0},
+            {"date": "2025/03/02", "count": 1, "distance_km": 5.0},
+        ]
+
+    def test_get_activity_calendar_requires_year(self, client: TestClient):
+        response = client.get("/users/1/calendar")
+        assert response.status_code == 422
+
+    def test_get_activity_frequency(self, session: Session, client: TestClient):
+        self.add_activity(session, "2025/03/01")  # Saturday
+        self.add_activity(session, "2025/03/08", "17:59")
+        self.add_activity(session, "2025/03/03", "06:30")  # Monday
+        response = client.get(
+            "/users/1/activity-frequency", params={"start_date": "2025/03/01"}
+        )
+
+        assert response.status_code == 200
+        assert response.json() == [
+            {"day_of_week": 0, "hour": 6, "count": 1, "distance_km": 5.0},
+            {"day_of_week": 5, "hour": 17, "count": 1, "distance_km": 5.0},
+        ]
+
+
+class TestUserSummary:
+    def add_activity(self, client: TestClient, days_ago: int, **fields):
+        day = datetime.date.today() - datetime.timedelta(days=days_ago)
+        activity_test = {
+            "user_id": 1,
+            "date": day.strftime("%Y/%m/%d"),
+            "time": "17:30",
+            "activity": "run",
+            "activity_type": "road",
+            "moving_time": "00:30:00",
+            "distance_km": 5,
+            "perceived_effort": 4,
+            "elevation_m": 20,
+        }
+        return client.post("/activities/", json=activity_test | fields).json()
+
+    def test_get_user_summary(self, client: TestClient):
+        client.post("/users/", json={"name": "luc", "email": "luc@example.com"})
+        self.add_activity(client, 10, distance_km=10, moving_time="01:00:00")
+        self.add_activity(client, 2, perceived_effort=6)
+        last = self.add_activity(client, 0, time="06:00", elevation_m=None)
+        self.add_activity(client, 30, distance_km=0, moving_time="00:10:00")
+        response = client.get("/users/1/summary")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["activity_count"] == 4
+        assert data["total_distance_km"] == 20
+        assert data["total_moving_time_s"] == 7800
+        assert data["total_elevation_m"] == 60
+        assert data["average_distance_km"] == 5
+        assert data["average_pace_s_per_km"] == 360  # only activities with distance
+        assert data["average_perceived_effort"] == 4.5
+        assert data["last_activity"]["id"] == last["id"]
+        assert data["last_activity"]["pace_s_per_km"] == 360
+        assert data["week_activity_count"] == 2
+        assert data["week_distance_km"] == 10
+        assert data["previous_week_activity_count"] == 1
+        assert data["previous_week_distance_km"] == 10
+        assert data["week_distance_change_pct"] == 0
+
+    def test_last_activity_is_the_latest_on_the_last_day(self, client: TestClient):
+        client.post("/users/", json={"name": "luc", "email": "luc@example.com"})
+        last = self.add_activity(client, 0, time="18:00")
+        self.add_activity(client, 0, time="07:00")
+        data = client.get("/users/1/summary").json()
+
+        assert data["last_activity"]["id"] == last["id"]
+
+    def test_get_user_summary_without_activities(self, client: TestClient):
+        client.post("/users/", json={"name": "luc", "email": "luc@example.com"})
+        data = client.get("/users/1/summary").json()
+
+        assert data["activity_count"] == 0
+        assert data["total_distance_km"] == 0
+        assert data["average_pace_s_per_km"] is None
+        assert data["last_activity"] is None
+        assert data["week_distance_change_pct"] is None
+
+    def test_get_user_summary_not_modified(self, client: TestClient):
+        client.post("/users/", json={"name": "luc", "email": "luc@example.com"})
+        self.add_activity(client, 0)
+        etag = client.get("/users/1/summary").headers["etag"]
+
+        response = client.get("/users/1/summary", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        response = client.get("/users/1/summary", headers={"If-None-Match": '"x"'})
+        assert response.status_code == 200
+
+    def test_user_summary_etag_changes_with_activity_writes(self, client: TestClient):
+        client.post("/users/", json={"name": "luc", "email": "luc@example.com"})
+        etags = [client.get("/users/1/summary").headers["etag"]]
+        activity = self.add_activity(client, 0)
+        etags.append(client.get("/users/1/summary").headers["etag"])
+        client.patch(f"/activities/{activity['id']}", json={"distance_km": 6})
+        etags.append(client.get("/users/1/summary").headers["etag"])
+        client.delete(f"/activities/{activity['id']}")
+        etags.append(client.get("/users/1/summary").headers["etag"])
+
+        assert len(set(etags)) == 4
+
+    def test_get_user_summary_raises_404(self, client: TestClient):
+        response = client.get("/users/1/summary")
+        assert response.status_code == 404
+        assert response.json()["detail"] == "User not found"
+
+
+class TestReadYourWrites:
+    def make_request(self, cookie: str | None = None):
+        headers = [] if cookie is None else [(b"cookie", cookie.encode())]
+        return Request({"type": "http", "headers": headers})
+
+    def test_write_sets_last_write_cookie(self, client: TestClient):
+        response = client.post("/users/", json={"name": "Test", "email": "test email"})
+        assert LAST_WRITE_COOKIE in response.cookies
+
+    def test_read_does_not_set_last_write_cookie(self, client: TestClient):
+        response = client.get("/users/")
+        assert LAST_WRITE_COOKIE not in response.cookies
+
+    def test_failed_write_does_not_set_last_write_cookie(self, client: TestClient):
+        response = client.post("/users/", json={"name": "Test"})
+        assert LAST_WRITE_COOKIE not in response.cookies
+
+    def test_wrote_recently_after_write(self):
+        request = self.make_request(f"{LAST_WRITE_COOKIE}={time.time()}")
+        assert wrote_recently(request)
+
+    def test_not_wrote_recently_after_old_write(self):
+        old_write = time.time() - READ_YOUR_WRITES_SECONDS - 1
+        request = self.make_request(f"{LAST_WRITE_COOKIE}={old_write}")
+        assert not wrote_recently(request)
+
+    def test_not_wrote_recently_without_cookie(self):
+        assert not wrote_recently(self.make_request())
+
+    def test_not_wrote_recently_with_invalid_cookie(self):
+        assert not wrote_recently(self.make_request(f"{LAST_WRITE_COOKIE}=abc"))
+
+
+class TestAdmissionControl:
+    def test_rejected_request_returns_503_with_retry_after(
+        self, client: TestClient, monkeypatch
+    ):
+        limiter = AdmissionLimiter("default", 0, 0, 1.0, retry_after_s=3)
+        monkeypatch.setitem(admission_limiters, "default", limiter)
+        response = client.get("/users/")
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "3"
+        assert limiter.rejected == 1
+
+    def test_admission_metrics(self, client: TestClient):
+        client.get("/users/")
+        response = client.get("/metrics/admission")
+        data = {metrics["budget"]: metrics for metrics in response.json()}
+
+        assert response.status_code == 200
+        assert set(data) == {"default", "analytics"}
+        assert data["default"]["admitted"] >= 1
+        assert data["default"]["in_flight"] == 0
+
+
+class TestJobs:
+    @pytest.fixture(autouse=True)
+    def immediate_jobs(self, session: Session, monkeypatch):
+        """runs jobs straight away against the test database"""
+        from jobs import JobManager
+        from tests.test_jobs import ImmediateExecutor
+
+        engine = session.get_bind()
+        monkeypatch.setattr(jobs, "engine", engine)
+        monkeypatch.setattr(
+            routes, "job_manager", JobManager(engine, executor=ImmediateExecutor())
+        )
+
+    def test_create_job_returns_202(self, session: Session, client: TestClient):
+        session.add(User(user_id=1, name="Test", email="test email"))
+        session.commit()
+        response = client.post(
+            "/jobs/", json={"kind": "rebuild_state", "params": {"user_id": 1}}
+        )
+        data = response.json()
+
+        assert response.status_code == 202
+        assert data["kind"] == "rebuild_state"
+        assert data["params"] == {"user_id": 1}
+
+    def test_get_job_returns_result(self, session: Session, client: TestClient):
+        session.add(User(user_id=1, name="Test", email="test email"))
+        session.commit()
+        job_id = client.post(
+            "/jobs/", json={"kind": "rebuild_state", "params": {"user_id": 1}}
+        ).json()["id"]
+        response = client.get(f"/jobs/{job_id}")
+        data = response.json()
+
+        assert response.status_code == 200
+        assert data["status"] == "succeeded"
+        assert data["result"] == {"user_id": 1}
+
+    def test_create_job_invalid_kind_returns_422(self, client: TestClient):
+        response = client.post("/jobs/", json={"kind": "unknown", "params": {}})
+        assert response.status_code == 422
+
+    def test_create_job_invalid_params_returns_422(self, client: TestClient):
+        response = client.post("/jobs/", json={"kind": "export", "params": {}})
+        assert response.status_code == 422
+
+    def test_get_job_not_found(self, client: TestClient):
+        response = client.get("/jobs/1")
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Job not found"
+
+    def test_get_job_file_without_file_returns_404(
+        self, session: Session, client: TestClient
+    ):
+        session.add(User(user_id=1, name="Test", email="test email"))
+        session.commit()
+        job_id = client.post(
+            "/jobs/", json={"kind": "rebuild_state", "params": {"user_id": 1}}
+        ).json()["id"]
+        response = client.get(f"/jobs/{job_id}/file")
+        assert response.status_code == 404
+
+
+class TestUploadActivity:
+    def test_upload_gpx_creates_activity(self, session: Session, client: TestClient):
+        session.add(User(user_id=1, name="Test", email="test email"))
+        session.commit()
+        response = client.post(
+            "/users/1/activities/upload",
+            files={"file": ("run.gpx", GPX, "application/gpx+xml")},
+            data={"perceived_effort": "5"},
+        )
+        data = response.json()
+
+        assert response.status_code == 200
+        assert data["id"] is not None
+        assert data["activity"] == "run"
+        assert data["moving_time"] == "00:01:00"
+        assert session.get(Activity, data["id"]) is not None
+
+    def test_upload_invalid_file_returns_422(self, client: TestClient):
+        response = client.post(
+            "/users/1/activities/upload",
+            files={"file": ("run.gpx", b"not xml", "application/gpx+xml")},
+            data={"perceived_effort": "5"},
+        )
+        assert response.status_code == 422
+
+    def test_upload_invalid_perceived_effort_returns_422(self, client: TestClient):
+        response = client.post(
+            "/users/1/activities/upload",
+            files={"file": ("run.gpx", GPX, "application/gpx+xml")},
+            data={"perceived_effort": "11"},
+        )
+        assert response.status_code == 422
+
+    def test_upload_saves_activity_and_stream_together(
+        self, session: Session, client: TestClient, monkeypatch
+    ):
+        def save_activity_stream(session, activity_id, stream):
+            raise OSError("stream not saved")
+
+        monkeypatch.setattr(routes, "save_activity_stream", save_activity_stream)
+        session.add(User(user_id=1, name="Test", email="test email"))
+        session.commit()
+        with pytest.raises(OSError):
+            client.post(
+                "/users/1/activities/upload",
+                files={"file": ("run.gpx", GPX, "application/gpx+xml")},
+                data={"perceived_effort": "5"},
+            )
+        session.rollback()
+
+        assert session.exec(select(Activity)).all() == []
+
+    def test_upload_saves_activity_stream(self, session: Session, client: TestClient):
+        session.add(User(user_id=1, name="Test", email="test email"))
+        session.commit()
+        activity_id = client.post(
+            "/users/1/activities/upload",
+            files={"file": ("run.gpx", GPX, "application/gpx+xml")},
+            data={"perceived_effort": "5"},
+        ).json()["id"]
+        response = client.get(
+            f"/activities/{activity_id}/stream", params={"channels": "time,lat"}
+        )
+        data = response.json()
+
+        assert response.status_code == 200
+        assert data["n_points"] == 3
+        assert data["time"] == [0, 30, 60]
+        assert set(data) == {"activity_id", "start_time", "n_points", "time", "lat"}
+
+
+class TestActivityStream:
+    def add_activity_with_stream(self, session: Session):
+        activity = Activity(
+            user_id=1,
+            date="2025/03/01",
+            time="17:30",
+            activity="run",
+            activity_type="road",
+            moving_time="00:00:20",
+            distance_km=0.01,
+            perceived_effort=5,
+        )
+        session.add(activity)
+        session.flush()
+        track = {
+            "latitudes": np.array([0, 0.0001]),
+            "longitudes": np.array([0, 0]),
+            "times": np.array([100.0, 120.0]),
+            "elevations": np.array([10.0, np.nan]),
+            "heart_rates": np.array([120.0, 121.0]),
+        }
+        save_activity_stream(session, activity.id, encode_track_stream(track))
+        session.commit()
+        return activity.id
+
+    def test_get_stream_all_channels(self, session: Session, client: TestClient):
+        activity_id = self.add_activity_with_stream(session)
+        data = client.get(f"/activities/{activity_id}/stream").json()
+
+        assert data["start_time"] == 100
+        assert data["elevation"] == [10, None]
+        assert data["heart_rate"] == [120, 121]
+
+    def test_get_stream_not_found(self, client: TestClient):
+        response = client.get("/activities/1/stream")
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Activity stream not found"
+
+    def test_get_stream_unknown_channel_returns_422(
+        self, session: Session, client: TestClient
+    ):
+        activity_id = self.add_activity_with_stream(session)
+        response = client.get(
+            f"/activities/{activity_id}/stream", params={"channels": "speed"}
+        )
+        assert response.status_code == 422
+
+    def test_delete_activity_deletes_stream(self, session: Session, client: TestClient):
+        activity_id = self.add_activity_with_stream(session)
+        client.delete(f"/activities/{activity_id}")
+        assert session.get(ActivityStream, activity_id) is None
+
+    def test_batch_delete_deletes_streams(self, session: Session, client: TestClient):
+        activity_id = self.add_activity_with_stream(session)
+        client.delete("/activities/batch", params={"ids": str(activity_id)})
+        assert session.get(ActivityStream, activity_id) is None
+
+    def test_get_splits(self, session: Session, client: TestClient):
+        activity_id = self.add_activity_with_stream(session)
+        response = client.get(f"/activities/{activity_id}/splits")
+        data = response.json()
+
+        assert response.status_code == 200
+        assert data["activity_id"] == activity_id
+        assert len(data["splits"]) == 1
+        assert data["splits"][0]["distance_km"] == pytest.approx(0.011)
+        assert data["laps"] == []
+        assert data["best_efforts"] == []
+
+    def test_get_splits_with_auto_laps(self, session: Session, client: TestClient):
+        activity_id = self.add_activity_with_stream(session)
+        response = client.get(
+            f"/activities/{activity_id}/splits", params={"lap_time_s": 10}
+        )
+        assert len(response.json()["laps"]) == 2
+
+    @pytest.mark.parametrize(
+        "params", [{"lap_time_s": 0.000001}, {"lap_distance_km": 0.001}]
+    )
+    def test_get_splits_with_tiny_laps_returns_422(
+        self, session: Session, client: TestClient, params: dict
+    ):
+        activity_id = self.add_activity_with_stream(session)
+        response = client.get(f"/activities/{activity_id}/splits", params=params)
+        assert response.status_code == 422
+
+    def test_get_splits_with_both_lap_settings_returns_422(
+        self, session: Session, client: TestClient
+    ):
+        activity_id = self.add_activity_with_stream(session)
+        response = client.get(
+            f"/activities/{activity_id}/splits",
+            params={"lap_time_s": 10, "lap_distance_km": 1},
+        )
+        assert response.status_code == 422
+
+    def test_get_splits_not_found(self, client: TestClient):
+        response = client.get("/activities/1/splits")
+        assert response.status_code == 404
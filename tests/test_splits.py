@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from analytics.splits import (
+    analyse_stream,
+    best_effort,
+    calculate_best_efforts,
+    calculate_laps,
+    cumulative_distance_and_time,
+)
+
+# one degree of latitude in metres, for the haversine earth radius
+METRES_PER_DEGREE = 111194.93
+
+
+def make_stream(speeds_ms: list, elevation=None):
+    """a stream heading north with one point per second at the given speeds"""
+    steps = np.concatenate(([0.0], np.asarray(speeds_ms, dtype=float)))
+    return {
+        "time": np.arange(len(steps), dtype=np.int32),
+        "lat": np.cumsum(steps) / METRES_PER_DEGREE,
+        "lon": np.zeros(len(steps)),
+        "elevation": elevation,
+    }
+
+
+class TestCumulativeDistanceAndTime:
+    def test_paused_segments_are_not_counted(self):
+        stream = make_stream([4, 4, 0, 0, 4])
+        distance_m, time_s = cumulative_distance_and_time(stream)
+
+        assert distance_m == pytest.approx([0, 4, 8, 8, 8, 12], abs=1e-3)
+        assert time_s.tolist() == [0, 1, 2, 2, 2, 3]
+
+
+class TestCalculateLaps:
+    def test_per_km_splits_with_partial_last_split(self):
+        distance_m = np.array([0, 1000, 2000, 2500.0])
+        time_s = np.array([0, 250, 500, 625.0])
+        splits = calculate_laps(distance_m, time_s, lap_distance_m=1000)
+
+        assert [split["distance_km"] for split in splits] == [1, 1, 0.5]
+        assert [split["pace_s_per_km"] for split in splits] == [250, 250, 250]
+
+    def test_boundaries_are_interpolated(self):
+        splits = calculate_laps(
+            np.array([0, 1500.0]), np.array([0, 300.0]), lap_distance_m=1000
+        )
+        assert splits[0]["moving_time_s"] == 200
+        assert splits[1]["moving_time_s"] == 100
+
+    def test_laps_by_time(self):
+        laps = calculate_laps(
+            np.array([0, 1200.0]), np.array([0, 600.0]), lap_time_s=300
+        )
+        assert [lap["distance_km"] for lap in laps] == [0.6, 0.6]
+
+    def test_elevation_change(self):
+        splits = calculate_laps(
+            np.array([0, 2000.0]),
+            np.array([0, 500.0]),
+            lap_distance_m=1000,
+            elevation_m=np.array([10, 30.0]),
+        )
+        assert [split["elevation_change_m"] for split in splits] == [10, 10]
+
+    def test_needs_one_lap_setting(self):
+        with pytest.raises(ValueError):
+            calculate_laps(np.array([0, 1.0]), np.array([0, 1.0]))
+
+
+class TestBestEffort:
+    def test_finds_fastest_window(self):
+        # 1 km at 4 m/s, 1 km at 5 m/s, 1 km at 4 m/s
+        distance_m = np.arange(0, 3001, 1.0)
+        pace = np.where((distance_m > 1000) & (distance_m <= 2000), 0.2, 0.25)
+        time_s = np.concatenate(([0], np.cumsum(pace[1:])))
+        effort = best_effort(distance_m, time_s, 1000)
+
+        assert effort["moving_time_s"] == pytest.approx(200)
+        assert effort["start_distance_km"] == pytest.approx(1)
+
+    def test_too_short_returns_none(self):
+        assert best_effort(np.array([0, 900.0]), np.array([0, 200.0]), 1000) is None
+
+    def test_calculate_best_efforts_only_includes_long_enough_efforts(self):
+        efforts = calculate_best_efforts(np.array([0, 6000.0]), np.array([0, 1500.0]))
+        assert [effort["effort"] for effort in efforts] == ["fastest_1k", "fastest_5k"]
+        assert efforts[1]["moving_time_s"] == 1250
+
+
+class TestAnalyseStream:
+    def test_analyse_stream(self):
+        stream = make_stream([4] * 625)
+        analysis = analyse_stream(stream, lap_time_s=300)
+
+        assert len(analysis["splits"]) == 3
+        assert analysis["splits"][0]["pace_s_per_km"] == pytest.approx(250, abs=0.5)
+        assert len(analysis["laps"]) == 3
+        assert analysis["best_efforts"][0]["effort"] == "fastest_1k"
+
+    def test_partial_elevations_are_ignored(self):
+        elevation = np.full(626, 10.0)
+        elevation[5] = np.nan
+        analysis = analyse_stream(make_stream([4] * 625, elevation))
+        assert analysis["splits"][0]["elevation_change_m"] is None
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from database.models import ActivityStream
+from database.streams import (
+    decode_channel,
+    delete_activity_streams,
+    encode_channel,
+    encode_track_stream,
+    load_activity_stream,
+    save_activity_stream,
+)
+
+
+def make_track(n_points=3600):
+    times = 1740850200.0 + np.arange(n_points)
+    return {
+        "latitudes": 51.5 + np.arange(n_points) * 1e-5,
+        "longitudes": np.full(n_points, -0.1),
+        "times": times,
+        "elevations": np.linspace(10, 50, n_points),
+        "heart_rates": np.full(n_points, np.nan),
+    }
+
+
+@pytest.fixture(name="session")
+def session_fixture():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+class TestChannelEncoding:
+    def test_float_channel_round_trip(self):
+        values = np.array([51.5, 51.50001, -0.1])
+        decoded = decode_channel(encode_channel(values, "lat"), "lat")
+
+        assert decoded.dtype == np.dtype("<f4")
+        assert decoded == pytest.approx(values, abs=1e-5)
+
+    def test_int_channel_round_trip(self):
+        decoded = decode_channel(encode_channel([0, 1, 2], "time"), "time")
+        assert decoded.dtype == np.dtype("<i4")
+        assert decoded.tolist() == [0, 1, 2]
+
+    def test_encoded_channel_is_compressed(self):
+        values = np.arange(3600)
+        assert len(encode_channel(values, "time")) < values.size * 4
+
+
+class TestEncodeTrackStream:
+    def test_times_are_offsets_from_start(self):
+        stream = encode_track_stream(make_track(3))
+
+        assert stream["n_points"] == 3
+        assert stream["start_time"] == 1740850200.0
+        assert decode_channel(stream["time"], "time").tolist() == [0, 1, 2]
+
+    def test_missing_channel_is_none(self):
+        stream = encode_track_stream(make_track(3))
+        assert stream["heart_rate"] is None
+        assert stream["elevation"] is not None
+
+    def test_partly_missing_heart_rates_are_zero(self):
+        track = make_track(3)
+        track["heart_rates"] = np.array([120, np.nan, 130])
+        stream = encode_track_stream(track)
+        assert decode_channel(stream["heart_rate"], "heart_rate").tolist() == [
+            120,
+            0,
+            130,
+        ]
+
+
+class TestLoadActivityStream:
+    def test_load_all_channels(self, session: Session):
+        save_activity_stream(session, 1, encode_track_stream(make_track()))
+        session.commit()
+        stream = load_activity_stream(session, 1)
+
+        assert stream["n_points"] == 3600
+        assert len(stream["lat"]) == 3600
+        assert stream["elevation"][-1] == pytest.approx(50)
+        assert stream["heart_rate"] is None
+
+    def test_load_only_requested_channels(self, session: Session):
+        save_activity_stream(session, 1, encode_track_stream(make_track()))
+        session.commit()
+        stream = load_activity_stream(session, 1, ["time"])
+
+        assert set(stream) == {"start_time", "n_points", "time"}
+
+    def test_missing_stream_returns_none(self, session: Session):
+        assert load_activity_stream(session, 1) is None
+
+    def test_delete_activity_streams(self, session: Session):
+        for activity_id in [1, 2]:
+            save_activity_stream(
+                session, activity_id, encode_track_stream(make_track(3))
+            )
+        session.commit()
+        delete_activity_streams(session, [1])
+        session.commit()
+
+        assert session.get(ActivityStream, 1) is None
+        assert session.get(ActivityStream, 2) is not None
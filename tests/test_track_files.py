@@ -0,0 +1,121 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+
+from ingestion.track_files import (
+    TrackFileError,
+    format_moving_time,
+    parse_track,
+    track_to_activity,
+)
+
+GPX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk>
+    <type>running</type>
+    <trkseg>
+      <trkpt lat="0.000" lon="0"><ele>10</ele><time>2025-03-01T17:30:00Z</time></trkpt>
+      <trkpt lat="0.001" lon="0"><ele>12</ele><time>2025-03-01T17:30:30Z</time>
+        <extensions><gpxtpx:TrackPointExtension xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1"><gpxtpx:hr>140</gpxtpx:hr></gpxtpx:TrackPointExtension></extensions>
+      </trkpt>
+      <trkpt lat="0.002" lon="0"><time>2025-03-01T17:31:00Z</time></trkpt>
+      <trkpt lat="0.003" lon="0"><ele>14</ele></trkpt>
+    </trkseg>
+  </trk>
+</gpx>
+"""
+
+TCX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<TrainingCenterDatabase xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2">
+  <Activities>
+    <Activity Sport="Biking">
+      <Lap StartTime="2025-03-02T08:00:00Z">
+        <Track>
+          <Trackpoint>
+            <Time>2025-03-02T08:00:00Z</Time>
+            <Position><LatitudeDegrees>0</LatitudeDegrees><LongitudeDegrees>0</LongitudeDegrees></Position>
+            <AltitudeMeters>50</AltitudeMeters>
+            <HeartRateBpm><Value>120</Value></HeartRateBpm>
+          </Trackpoint>
+          <Trackpoint>
+            <Time>2025-03-02T08:00:05Z</Time>
+          </Trackpoint>
+          <Trackpoint>
+            <Time>2025-03-02T08:00:10Z</Time>
+            <Position><LatitudeDegrees>0.001</LatitudeDegrees><LongitudeDegrees>0</LongitudeDegrees></Position>
+            <AltitudeMeters>51</AltitudeMeters>
+          </Trackpoint>
+        </Track>
+      </Lap>
+    </Activity>
+  </Activities>
+</TrainingCenterDatabase>
+"""
+
+
+class TestParseTrack:
+    def test_parse_gpx_skips_points_without_time(self):
+        track = parse_track(BytesIO(GPX))
+
+        assert track["latitudes"].tolist() == [0, 0.001, 0.002]
+        assert track["times"][1] - track["times"][0] == 30
+        assert track["elevations"][:2].tolist() == [10, 12]
+        assert np.isnan(track["elevations"][2])
+        assert track["heart_rates"][1] == 140
+        assert track["sport"] == "running"
+
+    def test_parse_tcx_skips_points_without_position(self):
+        track = parse_track(BytesIO(TCX))
+
+        assert track["latitudes"].tolist() == [0, 0.001]
+        assert track["elevations"].tolist() == [50, 51]
+        assert track["heart_rates"][0] == 120
+        assert np.isnan(track["heart_rates"][1])
+        assert track["sport"] == "Biking"
+
+    def test_invalid_xml_raises_track_file_error(self):
+        with pytest.raises(TrackFileError):
+            parse_track(BytesIO(b"<gpx><trk>"))
+
+
+class TestTrackToActivity:
+    def test_gpx_activity(self):
+        activity = track_to_activity(BytesIO(GPX), user_id=1, perceived_effort=5)
+
+        assert activity["date"] == "2025/03/01"
+        assert activity["time"] == "17:30"
+        assert activity["activity"] == "run"
+        assert activity["moving_time"] == "00:01:00"
+        assert activity["distance_km"] == pytest.approx(0.22)
+        assert activity["elevation_m"] == 2
+
+    def test_tcx_activity(self):
+        activity = track_to_activity(BytesIO(TCX), user_id=1, perceived_effort=5)
+
+        assert activity["activity"] == "ride"
+        assert activity["moving_time"] == "00:00:10"
+
+    def test_given_activity_overrides_file(self):
+        activity = track_to_activity(
+            BytesIO(GPX), user_id=1, perceived_effort=5, activity="ride"
+        )
+        assert activity["activity"] == "ride"
+
+    def test_unknown_sport_raises_track_file_error(self):
+        with pytest.raises(TrackFileError):
+            track_to_activity(
+                BytesIO(GPX.replace(b"running", b"swimming")),
+                user_id=1,
+                perceived_effort=5,
+            )
+
+    def test_too_few_points_raises_track_file_error(self):
+        gpx = b'<gpx><trk><trkseg><trkpt lat="0" lon="0"><time>2025-03-01T17:30:00Z</time></trkpt></trkseg></trk></gpx>'
+        with pytest.raises(TrackFileError):
+            track_to_activity(BytesIO(gpx), user_id=1, perceived_effort=5)
+
+
+class TestFormatMovingTime:
+    def test_format_moving_time(self):
+        assert format_moving_time(3725) == "01:02:05"
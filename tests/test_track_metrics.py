@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from analytics.track_metrics import (
+    calculate_track_metrics,
+    elevation_gain,
+    haversine_distances,
+    moving_segments,
+)
+
+# one degree of latitude is about 111.2 km
+METRES_PER_DEGREE = 111195
+
+
+class TestHaversineDistances:
+    def test_distance_along_meridian(self):
+        distances = haversine_distances([0, 1, 3], [0, 0, 0])
+        assert distances == pytest.approx(
+            [METRES_PER_DEGREE, 2 * METRES_PER_DEGREE], rel=1e-3
+        )
+
+    def test_no_distance_for_same_point(self):
+        assert haversine_distances([51.5, 51.5], [-0.1, -0.1]) == pytest.approx([0])
+
+    def test_single_point_has_no_segments(self):
+        assert len(haversine_distances([51.5], [-0.1])) == 0
+
+
+class TestMovingSegments:
+    def test_slow_segments_are_paused(self):
+        distances = np.array([10.0, 1.0, 10.0])
+        times = [0, 5, 10, 15]
+        assert moving_segments(distances, times).tolist() == [True, False, True]
+
+    def test_long_gaps_are_paused(self):
+        distances = np.array([10.0, 500.0])
+        times = [0, 5, 305]
+        assert moving_segments(distances, times).tolist() == [True, False]
+
+    def test_repeated_times_are_paused(self):
+        distances = np.array([10.0, 10.0])
+        times = [0, 0, 5]
+        assert moving_segments(distances, times).tolist() == [False, True]
+
+
+class TestElevationGain:
+    def test_only_ascent_is_counted(self):
+        elevations = [0] * 5 + [10] * 5 + [0] * 5
+        assert elevation_gain(elevations) == pytest.approx(10)
+
+    def test_noise_is_smoothed_out(self):
+        elevations = [100, 101, 100, 101, 100, 101, 100, 101, 100, 101]
+        assert elevation_gain(elevations) < 1
+
+    def test_single_point_has_no_gain(self):
+        assert elevation_gain([100]) == 0
+
+
+class TestCalculateTrackMetrics:
+    def test_metrics_exclude_paused_segments(self):
+        # 3 moving 10 s segments of ~111 m, then a 60 s stop at the same point
+        latitudes = [0, 0.001, 0.002, 0.003, 0.003]
+        longitudes = [0] * 5
+        times = [0, 10, 20, 30, 90]
+        metrics = calculate_track_metrics(latitudes, longitudes, times)
+
+        assert metrics["distance_km"] == pytest.approx(0.3336, rel=1e-3)
+        assert metrics["moving_time_s"] == 30
+        assert metrics["elevation_m"] is None
+
+    def test_elevation_gain_included(self):
+        metrics = calculate_track_metrics([0, 0.001], [0, 0], [0, 10], [5, 15])
+        assert metrics["elevation_m"] == pytest.approx(10)
@@ -0,0 +1,90 @@
+from analytics.training_load import (
+    append_to_training_load_state,
+    build_training_load_state,
+    calculate_training_load,
+    ewma,
+    resample_daily_distance,
+    rolling_sum,
+    summarise_training_load_state,
+)
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def make_dataframe(rows):
+    df = pd.DataFrame(rows, columns=["date", "distance_km"])
+    df["date"] = pd.to_datetime(df["date"], format="%Y/%m/%d")
+    return df
+
+
+class TestResampleDailyDistance:
+    def test_resample_daily_distance_fills_missing_days_and_sums_same_day(self):
+        df = make_dataframe(
+            [("2025/03/01", 5.0), ("2025/03/04", 3.0), ("2025/03/01", 2.0)]
+        )
+        result = resample_daily_distance(df)
+        assert list(result) == [7.0, 0.0, 0.0, 3.0]
+        assert result.index[0] == pd.Timestamp("2025-03-01")
+
+    def test_resample_daily_distance_raises_key_error(self):
+        with pytest.raises(KeyError):
+            resample_daily_distance(make_dataframe([]))
+
+
+class TestRollingSum:
+    def test_rolling_sum_partial_and_full_windows(self):
+        values = np.array([1.0, 2.0, 3.0, 4.0])
+        result = rolling_sum(values, 2)
+        assert list(result) == [1.0, 3.0, 5.0, 7.0]
+
+
+class TestEwma:
+    def test_ewma_starts_from_zero(self):
+        result = ewma(np.array([10.0, 0.0]), 0.5)
+        assert list(result) == [5.0, 2.5]
+
+
+class TestCalculateTrainingLoad:
+    def test_calculate_training_load_columns(self):
+        df = make_dataframe([("2025/03/01", 5.0), ("2025/03/10", 10.0)])
+        result = calculate_training_load(df)
+        assert len(result) == 10
+        assert result["acute_load_km"].iloc[-1] == 10.0
+        assert result["chronic_load_km"].iloc[-1] == 15.0
+        assert result["acwr"].iloc[-1] == pytest.approx((10 / 7) / (15 / 28))
+        assert (result["form"] == result["fitness"] - result["fatigue"]).all()
+
+
+class TestAppendToTrainingLoadState:
+    def test_append_matches_full_rebuild(self):
+        rows = [
+            ("2025/01/01", 5.0),
+            ("2025/01/03", 8.0),
+            ("2025/01/03", 2.0),
+            ("2025/02/20", 10.0),
+            ("2025/02/25", 6.5),
+        ]
+        state = None
+        for date, distance in rows:
+            state = append_to_training_load_state(state, date, distance)
+        expected = build_training_load_state(make_dataframe(rows))
+
+        assert state["last_date"] == expected["last_date"] == "2025/02/25"
+        assert state["fitness"] == pytest.approx(expected["fitness"])
+        assert state["fatigue"] == pytest.approx(expected["fatigue"])
+        assert state["recent_distances"] == pytest.approx(expected["recent_distances"])
+
+    def test_append_returns_none_for_backfilled_activity(self):
+        state = append_to_training_load_state(None, "2025/03/10", 5.0)
+        assert append_to_training_load_state(state, "2025/03/01", 5.0) is None
+
+
+class TestSummariseTrainingLoadState:
+    def test_summarise_training_load_state(self):
+        state = append_to_training_load_state(None, "2025/03/10", 7.0)
+        result = summarise_training_load_state(state)
+        assert result["date"] == "2025/03/10"
+        assert result["acute_load_km"] == 7.0
+        assert result["chronic_load_km"] == 7.0
+        assert result["acwr"] == 4.0
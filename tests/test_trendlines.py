@@ -0,0 +1,89 @@
+import tracemalloc
+
+from analytics.trendlines import (
+    add_trendline_point,
+    calculate_linear_coefficients,
+    fit_robust_trendline,
+    fit_trendline,
+    fit_windowed_trendline,
+    trendline_points,
+)
+import numpy as np
+import pytest
+
+
+def empty_stats():
+    return {"n": 0, "sum_x": 0.0, "sum_y": 0.0, "sum_xy": 0.0, "sum_xx": 0.0}
+
+
+class TestTrendlinePoints:
+    def test_trendline_points_skips_missing_metrics(self):
+        activity = {
+            "distance_km": 5.0,
+            "moving_time": "00:30:00",
+            "elevation_m": None,
+            "perceived_effort": 4,
+        }
+        result = trendline_points(activity)
+        assert result == {"distance_km": (5.0, 6.0), "perceived_effort": (4.0, 6.0)}
+
+    def test_trendline_points_skips_zero_distance(self):
+        activity = {
+            "distance_km": 0,
+            "moving_time": "00:30:00",
+            "elevation_m": 10,
+            "perceived_effort": 4,
+        }
+        assert trendline_points(activity) == {}
+
+
+class TestRunningStatistics:
+    def test_coefficients_match_polyfit(self):
+        x = [5.0, 7.5, 10.0, 21.1]
+        y = [6.1, 5.9, 6.4, 6.8]
+        stats = empty_stats()
+        for point in zip(x, y):
+            add_trendline_point(stats, *point)
+        expected = np.polyfit(x, y, 1)
+        assert calculate_linear_coefficients(stats) == pytest.approx(tuple(expected))
+
+    def test_removing_points_restores_statistics(self):
+        stats = empty_stats()
+        add_trendline_point(stats, 5.0, 6.0)
+        add_trendline_point(stats, 10.0, 7.0)
+        add_trendline_point(stats, 10.0, 7.0, weight=-1)
+        add_trendline_point(stats, 5.0, 6.0, weight=-1)
+        assert stats == empty_stats()
+
+    def test_coefficients_none_for_single_point(self):
+        stats = empty_stats()
+        add_trendline_point(stats, 5.0, 6.0)
+        assert calculate_linear_coefficients(stats) is None
+
+
+class TestOnDemandFits:
+    def test_robust_trendline_ignores_outlier(self):
+        x = [1, 2, 3, 4, 5]
+        y = [1, 2, 3, 4, 50]
+        assert fit_robust_trendline(x, y) == pytest.approx((1.0, 0.0))
+
+    def test_robust_trendline_samples_pairs_of_many_points(self):
+        x = np.arange(50_000, dtype=float)
+        y = 2 * x + 1
+        y[::100] = 1e6  # outliers
+        tracemalloc.start()
+        slope, intercept = fit_robust_trendline(x, y)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert (slope, intercept) == pytest.approx((2.0, 1.0))
+        # every pair (over a billion) would take gigabytes
+        assert peak < 50_000_000
+
+    def test_windowed_trendline_uses_last_points(self):
+        x = [1, 2, 3, 4]
+        y = [10, 0, 2, 4]
+        assert fit_windowed_trendline(x, y, 3) == pytest.approx((2.0, -4.0))
+
+    def test_fit_trendline_linear(self):
+        assert fit_trendline([1, 2, 3], [2, 4, 6]) == pytest.approx((2.0, 0.0))
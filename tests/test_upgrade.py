@@ -0,0 +1,185 @@
+import json
+
+import numpy as np
+import pytest
+from sqlalchemy import inspect, text
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.pool import StaticPool
+
+from database.models import Activity, ActivityStream, User
+from database.streams import encode_track_stream, save_activity_stream
+from database.upgrade import (
+    DuplicateActivitiesError,
+    missing_constraints,
+    upgrade_tables,
+)
+from upgrade_db import export_and_rebuild
+
+# the tables as created by the first version of the models
+BASELINE_TABLES = [
+    """CREATE TABLE user_table (
+        name VARCHAR NOT NULL,
+        user_id INTEGER NOT NULL,
+        email VARCHAR NOT NULL,
+        PRIMARY KEY (user_id)
+    )""",
+    """CREATE TABLE activity_table (
+        id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        date VARCHAR NOT NULL,
+        time VARCHAR NOT NULL,
+        activity VARCHAR NOT NULL,
+        activity_type VARCHAR NOT NULL,
+        moving_time VARCHAR NOT NULL,
+        distance_km FLOAT NOT NULL,
+        perceived_effort INTEGER NOT NULL,
+        elevation_m INTEGER,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES user_table (user_id)
+    )""",
+]
+
+
+@pytest.fixture(name="deleted")
+def deleted_fixture():
+    """the values of the activities deleted by the upgrade"""
+    return []
+
+
+@pytest.fixture(name="baseline")
+def baseline_engine_fixture():
+    """an in-memory database with the baseline tables, an activity, a duplicate of it
+    once its time is zero padded (with a stream) and another activity"""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    with engine.begin() as connection:
+        for statement in BASELINE_TABLES:
+            connection.execute(text(statement))
+        connection.execute(
+            text("INSERT INTO user_table (name, user_id, email) VALUES ('luc', 1, 'l')")
+        )
+        for date, time, distance_km in (
+            ("2025/03/01", "07:30", 5),
+            ("2025/03/01", "7:30", 6),
+            ("2025/3/2", "8:00", 5),
+        ):
+            connection.execute(
+                text(
+                    "INSERT INTO activity_table (user_id, date, time, activity, "
+                    "activity_type, moving_time, distance_km, perceived_effort) "
+                    "VALUES (1, :date, :time, 'run', 'road', '00:30:00', "
+                    ":distance_km, 5)"
+                ),
+                {"date": date, "time": time, "distance_km": distance_km},
+            )
+    SQLModel.metadata.create_all(engine)
+    track = {
+        "latitudes": np.array([0, 0.0001]),
+        "longitudes": np.array([0, 0]),
+        "times": np.array([100.0, 120.0]),
+        "elevations": np.array([10.0, 11.0]),
+        "heart_rates": np.array([120.0, 121.0]),
+    }
+    with Session(engine) as session:
+        save_activity_stream(session, 2, encode_track_stream(track))
+        session.commit()
+    return engine
+
+
+@pytest.fixture(name="engine")
+def upgraded_engine_fixture(baseline, deleted: list):
+    """the baseline database upgraded as by create_db_and_tables, deleting duplicates"""
+    upgrade_tables(baseline, lambda session, activities: deleted.extend(activities))
+    return baseline
+
+
+class TestUpgradeTables:
+    def test_refuses_to_delete_duplicates_unless_asked(self, baseline):
+        with pytest.raises(DuplicateActivitiesError):
+            upgrade_tables(baseline)
+        with Session(baseline) as session:
+            assert session.exec(select(Activity.id)).all() == [1, 2, 3]
+            assert session.get(Activity, 3).time == "8:00"
+        assert "ix_activity_table_activity_pace" not in {
+            index["name"] for index in inspect(baseline).get_indexes("activity_table")
+        }
+
+    def test_exports_deleted_duplicates(self, baseline, tmp_path):
+        export_path = tmp_path / "duplicates.jsonl"
+        upgrade_tables(baseline, export_and_rebuild(export_path))
+        exported = [json.loads(line) for line in export_path.read_text().splitlines()]
+        assert [(values["id"], values["time"]) for values in exported] == [(2, "7:30")]
+        with Session(baseline) as session:
+            assert session.get(User, 1).data_version == 1
+
+    def test_adds_generated_columns(self, engine):
+        columns = {
+            column["name"] for column in inspect(engine).get_columns("activity_table")
+        }
+        assert {"moving_time_s", "pace_s_per_km", "speed_kmh"} <= columns
+
+        with Session(engine) as session:
+            activity = session.get(Activity, 1)
+        assert activity.moving_time_s == 1800
+        assert activity.pace_s_per_km == 360
+        assert activity.speed_kmh == 10
+
+    def test_adds_indexes(self, engine):
+        indexes = {
+            index["name"] for index in inspect(engine).get_indexes("activity_table")
+        }
+        assert "ix_activity_table_activity_pace" in indexes
+        assert "ux_activity_table_natural_key" in indexes
+
+    def test_deletes_duplicate_activities_and_their_streams(self, engine, deleted):
+        with Session(engine) as session:
+            assert session.exec(select(Activity.id)).all() == [1, 3]
+            assert session.exec(select(ActivityStream)).all() == []
+        assert [values["id"] for values in deleted] == [2]
+        assert deleted[0]["distance_km"] == 6
+
+    def test_pads_existing_dates_and_times(self, engine):
+        with Session(engine) as session:
+            activity = session.get(Activity, 3)
+        assert (activity.date, activity.time) == ("2025/03/02", "08:00")
+
+    def test_activities_can_be_written_and_filtered(self, engine):
+        with Session(engine) as session:
+            activity = Activity(
+                user_id=1,
+                date="2025/03/02",
+                time="17:30",
+                activity="run",
+                activity_type="road",
+                moving_time="00:25:00",
+                distance_km=5,
+                perceived_effort=5,
+            )
+            session.add(activity)
+            session.commit()
+            fast = session.exec(
+                select(Activity.id).where(Activity.pace_s_per_km < 360)
+            ).all()
+            assert fast == [activity.id]
+
+    def test_adds_data_version_column(self, engine):
+        with Session(engine) as session:
+            assert session.get(User, 1).data_version == 0
+
+    def test_reports_constraints_sqlite_cannot_add(self, engine):
+        with engine.connect() as connection:
+            missing = missing_constraints(connection, Activity.__table__)
+        assert {constraint.name for constraint in missing} == {
+            "activity_date_format",
+            "activity_time_format",
+            "activity_moving_time_format",
+            "activity_kind",
+            "activity_perceived_effort_range",
+        }
+
+    def test_upgrading_again_does_nothing(self, engine, deleted):
+        upgrade_tables(engine, lambda session, activities: deleted.extend(activities))
+        assert len(deleted) == 1
+        with Session(engine) as session:
+            assert session.get(Activity, 1).pace_s_per_km == 360
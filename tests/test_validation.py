@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from database.models import Activity
+from database.validation import ACTIVITY_FIELDS, validate_activity_batch
+
+VALID_ACTIVITY = {
+    "user_id": 1,
+    "date": "2025/02/24",
+    "time": "17:45",
+    "activity": "run",
+    "activity_type": "road",
+    "moving_time": "00:32:05",
+    "distance_km": 5.65,
+    "perceived_effort": 5,
+    "elevation_m": 10,
+}
+# values for each field, valid and invalid, including ones that only the model accepts
+FIELD_VALUES = {
+    "user_id": [2, 2.0, "3", None, "one", True],
+    "date": ["2025/2/4", " 2025/02/04", "2025/02/30", "24/02/2025", 20250224, None],
+    "time": ["7:05", "24:00", "17.45", "17:45:00", None],
+    "activity": ["ride", "running", "Run", None, 1],
+    "activity_type": ["trail", "", None, 1],
+    "moving_time": ["1:2:3", " 00:32:05", "-1:00:00", "00:32", "abc", None],
+    "distance_km": [0, 12, "5.5", "five", None],
+    "perceived_effort": [1, 10, 10.0, 0, 11, 5.5, "5", None],
+    "elevation_m": [None, 0, -5, 3.0, 3.5, "x"],
+}
+
+
+def validate_per_row(rows: list):
+    """validates each row with the Activity model, for comparison"""
+    activities = []
+    errors = {}
+    for row, activity in enumerate(rows):
+        try:
+            activities.append(
+                Activity.model_validate(activity).model_dump(
+                    include=set(ACTIVITY_FIELDS)
+                )
+            )
+        except ValueError as e:
+            errors[row] = [f"{err['loc'][0]} - {err['msg']}" for err in e.errors()]
+    return activities, errors
+
+
+class TestValidateActivityBatch:
+    def test_valid_rows(self):
+        rows = [VALID_ACTIVITY, {**VALID_ACTIVITY, "elevation_m": None}]
+        activities, errors = validate_activity_batch(rows)
+
+        assert errors == {}
+        assert activities == rows
+
+    def test_values_are_converted_to_field_types(self):
+        rows = [{**VALID_ACTIVITY, "distance_km": 5, "perceived_effort": 5.0}]
+        activities, _ = validate_activity_batch(rows)
+
+        assert activities[0]["distance_km"] == 5.0
+        assert type(activities[0]["distance_km"]) is float
+        assert type(activities[0]["perceived_effort"]) is int
+
+    def test_missing_fields_and_other_keys(self):
+        rows = [{**VALID_ACTIVITY, "id": 7}, {"date": "2025/02/24"}]
+        activities, errors = validate_activity_batch(rows)
+
+        assert "id" not in activities[0]
+        assert errors[1][0] == "user_id - Field required"
+
+    def test_unpadded_dates_are_padded(self):
+        activities, _ = validate_activity_batch(
+            [{**VALID_ACTIVITY, "date": "2025/2/4"}]
+        )
+        assert activities[0]["date"] == "2025/02/04"
+
+    def test_unpadded_times_are_padded(self):
+        activities, _ = validate_activity_batch([{**VALID_ACTIVITY, "time": "9:5"}])
+        assert activities[0]["time"] == "09:05"
+
+    def test_empty_batch(self):
+        assert validate_activity_batch([]) == ([], {})
+
+    @pytest.mark.parametrize("field", list(FIELD_VALUES))
+    def test_each_field_matches_model_validation(self, field: str):
+        rows = [{**VALID_ACTIVITY, field: value} for value in FIELD_VALUES[field]]
+        assert validate_activity_batch(rows) == validate_per_row(rows)
+
+    def test_random_batch_matches_model_validation(self):
+        generator = random.Random(42)
+        rows = []
+        for _ in range(500):
+            row = dict(VALID_ACTIVITY)
+            for field in generator.sample(list(FIELD_VALUES), generator.randint(0, 3)):
+                row[field] = generator.choice(FIELD_VALUES[field])
+            rows.append(row)
+        assert validate_activity_batch(rows) == validate_per_row(rows)
@@ -0,0 +1,66 @@
+"""Upgrades the database's tables, as the API does when it starts (see
+database/upgrade.py), deleting duplicate activities first when asked.
+
+Activity tables created before the unique index on the activities' natural key may have
+duplicate activities (e.g. retried submissions), which stop the index being created, so
+the API won't start until they are deleted. Without options, any duplicates are listed
+and nothing is changed. With --delete-duplicates, the duplicates are deleted, keeping
+the first activity (the lowest id) of each, written to the export file (as JSON lines)
+and their users' derived state is rebuilt, in the upgrade's transaction.
+
+    python upgrade_db.py
+    python upgrade_db.py --delete-duplicates duplicates.jsonl
+"""
+
+import argparse
+import json
+
+from sqlmodel import Session
+
+from analytics.derived_state import rebuild_users_state
+from database.database import create_db_and_tables, engine
+from database.upgrade import DuplicateActivitiesError, find_duplicate_activities
+
+
+def export_and_rebuild(export_path: str):
+    """returns an after_delete callback for upgrade_tables, which writes the deleted
+    duplicate activities to export_path as JSON lines and rebuilds their users' derived
+    state, in the upgrade's transaction"""
+
+    def after_delete(session: Session, duplicates: list):
+        with open(export_path, "w") as export_file:
+            for values in duplicates:
+                export_file.write(json.dumps(values, default=str) + "\n")
+        rebuild_users_state(session, {values["user_id"] for values in duplicates})
+        print(f"Deleted {len(duplicates)} activities, saved in {export_path}")
+
+    return after_delete
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Upgrade the database's tables, deleting duplicate activities "
+        "first if asked"
+    )
+    parser.add_argument(
+        "--delete-duplicates",
+        metavar="EXPORT_FILE",
+        help="delete duplicate activities, first writing them to EXPORT_FILE",
+    )
+    args = parser.parse_args()
+
+    if args.delete_duplicates:
+        create_db_and_tables(export_and_rebuild(args.delete_duplicates))
+    else:
+        try:
+            create_db_and_tables()
+        except DuplicateActivitiesError:
+            with engine.connect() as connection:
+                for values in find_duplicate_activities(connection):
+                    print(f"Duplicate activity: {values}")
+            raise
+    print("Upgraded the tables")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+from matplotlib.ticker import AutoLocator, ScalarFormatter
+import numpy as np
+import pandas as pd
+
+from analytics.trendlines import fit_trendline
+from database.notifications import ActivityListener, read_data_version
+from visualisation.plots_utils import (
+    concat_compact_dataframes,
+    create_dataframe,
+    engine,
+    select_activity_data,
+)
+
+CHARTS = [
+    "pace_vs_date",
+    "pace_vs_distance",
+    "pace_vs_elevation",
+    "pace_vs_perceived_effort",
+    "weekly_distance",
+]
+
+
+# the column each chart needs a value in for an activity to appear in it
+CHART_COLUMNS = {
+    "pace_vs_date": "date",
+    "pace_vs_distance": "distance_km",
+    "pace_vs_elevation": "elevation_m",
+    "pace_vs_perceived_effort": "perceived_effort",
+    "weekly_distance": "date",
+}
+# the x metric, colour, x label and title of each scatter chart
+SCATTER_CHARTS = {
+    "pace_vs_distance": ("distance_km", "c", "Distance (km)", "Pace vs Distance"),
+    "pace_vs_elevation": ("elevation_m", "green", "Elevation (m)", "Pace vs Elevation"),
+    "pace_vs_perceived_effort": (
+        "perceived_effort",
+        "orangered",
+        "Perceived Effort (1 (very easy) to 10 (very hard))",
+        "Pace vs Perceived Effort",
+    ),
+}
+
+
+def build_scatter_chart_data(df: pd.DataFrame, chart: str):
+    """computes the points and trendline of one of the SCATTER_CHARTS"""
+    metric, color, xlabel, title = SCATTER_CHARTS[chart]
+    data = df.dropna(subset=[metric])
+    x = data[metric].to_numpy(dtype=float)
+    y = data["pace_numeric"].to_numpy(dtype=float)
+    coefficients = fit_trendline(x, y) if len(x) else None
+    trendline = None
+    if coefficients:
+        end_points = np.array([x.min(), x.max()])
+        trendline = (end_points, np.poly1d(coefficients)(end_points))
+    return {
+        "x": x,
+        "y": y,
+        "trendline": trendline,
+        "kind": "points",
+        "dates": False,
+        "invert_y": True,
+        "color": color,
+        "xlabel": xlabel,
+        "ylabel": "Pace (min/km)",
+        "title": title,
+    }
+
+
+def build_chart_data(df: pd.DataFrame, charts: list | None = None):
+    """precomputes the data for the dashboard charts from one dataframe of activity
+    data (the output of create_dataframe).
+
+    :param charts: the charts to compute (default all of CHARTS)
+    :returns: a dictionary of chart name to a dictionary with keys x, y (numpy arrays,
+    dates as matplotlib date numbers), trendline (None, or the x and y end points of the
+    trendline), kind ("points" or "bars"), dates (bool), invert_y (bool), color,
+    xlabel, ylabel and title
+    """
+    charts = CHARTS if charts is None else charts
+    chart_data = {}
+    if "pace_vs_date" in charts or "weekly_distance" in charts:
+        dated = df.dropna(subset=["date"]).sort_values("date")
+    for chart in charts:
+        if chart in SCATTER_CHARTS:
+            chart_data[chart] = build_scatter_chart_data(df, chart)
+        elif chart == "pace_vs_date":
+            chart_data[chart] = {
+                "x": mdates.date2num(dated["date"]),
+                "y": dated["pace_numeric"].to_numpy(dtype=float),
+                "trendline": None,
+                "kind": "points",
+                "dates": True,
+                "invert_y": True,
+                "color": "purple",
+                "xlabel": "Date",
+                "ylabel": "Pace (min/km)",
+                "title": "Pace vs Date",
+            }
+        elif chart == "weekly_distance":
+            weekly_data = (
+                dated.filter(["distance_km", "date"])
+                .groupby(pd.Grouper(key="date", freq="W"))
+                .sum()
+                .fillna(0)
+            )
+            chart_data[chart] = {
+                "x": mdates.date2num(weekly_data.index),
+                "y": weekly_data["distance_km"].to_numpy(dtype=float),
+                "trendline": None,
+                "kind": "bars",
+                "dates": True,
+                "invert_y": False,
+                "color": "gold",
+                "xlabel": "Date",
+                "ylabel": "Total Distance (km)",
+                "title": "Weekly running distance",
+            }
+    return chart_data
+
+
+def charts_affected_by(df: pd.DataFrame):
+    """returns the charts whose data changes when the activities in df (the output of
+    create_dataframe) are added or removed, i.e. those the activities have a value
+    for"""
+    return [chart for chart in CHARTS if df[CHART_COLUMNS[chart]].notna().any()]
+
+
+class ActivityDashboard:
+    """Keeps a single figure open and switches between the activity plots in place.
+
+    All of the activity data is queried once and the data for every chart is
+    precomputed, so switching chart only swaps the data of the existing artists (with
+    set_data) rather than building a new figure. When activities change, only the
+    data of the charts they affect is discarded, and it is recomputed when the chart is
+    next shown. The point and trendline artists are
+    animated and blitted over a cached background when only their data changes.
+    """
+
+    def __init__(
+        self, user_id: int, start_date: str = "1981/01/01", end_date: str = "2081/01/01"
+    ):
+        self.user_id = user_id
+        self.start_date = start_date
+        self.end_date = end_date
+        # read first, so any change made while the data is queried is seen by watch
+        self.data_version = read_data_version(engine, user_id)
+        activities = select_activity_data(user_id, start_date, end_date)
+        self.df = create_dataframe(activities, compact=True)
+        self.chart_data = build_chart_data(self.df)
+        self.chart = None
+        plt.ion()
+        self.open_figure()
+
+    def open_figure(self):
+        """creates the dashboard figure and its (empty) artists"""
+        self.background = None
+        self.fig, self.ax = plt.subplots(figsize=(12, 6))
+        (self.points,) = self.ax.plot([], [], marker="o", ls="", animated=True)
+        (self.trendline,) = self.ax.plot([], [], ls="-", animated=True)
+        self.bars = None
+        self.ax.grid(True)
+        self.fig.canvas.mpl_connect("draw_event", self.on_draw)
+
+    def on_draw(self, event):
+        """caches the static background after every full redraw (e.g. a window resize)
+        and draws the animated artists on top of it"""
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        """draws the animated artists (points and trendline) over the current canvas"""
+        for artist in (self.points, self.trendline):
+            self.ax.draw_artist(artist)
+
+    def blit(self):
+        """redraws only the animated artists over the cached background. Falls back to a
+        full redraw if the backend doesn't support blitting."""
+        canvas = self.fig.canvas
+        if self.background is None or not getattr(canvas, "supports_blit", False):
+            canvas.draw_idle()
+        else:
+            canvas.restore_region(self.background)
+            self.draw_animated()
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def set_bars(self, data: dict | None):
+        """replaces the bar chart artists, or removes them if data is None"""
+        if self.bars is not None:
+            self.bars.remove()
+            self.bars = None
+        if data is not None and len(data["x"]):
+            self.bars = self.ax.bar(data["x"], data["y"], width=5, color=data["color"])
+
+    def set_axis_format(self, dates: bool):
+        """switches the x axis between date and numeric ticks"""
+        if dates:
+            locator = mdates.AutoDateLocator()
+            self.ax.xaxis.set_major_locator(locator)
+            self.ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+        else:
+            self.ax.xaxis.set_major_locator(AutoLocator())
+            self.ax.xaxis.set_major_formatter(ScalarFormatter())
+
+    def rescale(self, data: dict):
+        """fits the axes limits to the chart data"""
+        self.ax.relim(visible_only=True)
+        self.ax.autoscale_view()
+        if data["kind"] == "points" and len(data["x"]):
+            x_margin = max(np.ptp(data["x"]) * 0.05, 0.5)
+            y_margin = max(np.ptp(data["y"]) * 0.05, 0.1)
+            self.ax.set_xlim(data["x"].min() - x_margin, data["x"].max() + x_margin)
+            y_limits = (data["y"].min() - y_margin, data["y"].max() + y_margin)
+        else:
+            y_limits = (0, max(data["y"].max(initial=0) * 1.05, 1))
+        if data["invert_y"]:  # slower paces at the bottom
+            y_limits = y_limits[::-1]
+        self.ax.set_ylim(*y_limits)
+
+    def get_chart_data(self, chart: str):
+        """returns a chart's data, computing it if it has been discarded since
+        activities were added"""
+        if chart not in self.chart_data:
+            self.chart_data.update(build_chart_data(self.df, [chart]))
+        return self.chart_data[chart]
+
+    def show(self, chart: str):
+        """switches the figure to the given chart (one of CHARTS)"""
+        data = self.get_chart_data(chart)
+        self.chart = chart
+        if not plt.fignum_exists(self.fig.number):  # the window has been closed
+            self.open_figure()
+        is_points = data["kind"] == "points"
+
+        self.points.set_data(
+            data["x"] if is_points else [], data["y"] if is_points else []
+        )
+        self.points.set_color(data["color"])
+        if data["trendline"] is None:
+            self.trendline.set_data([], [])
+        else:
+            self.trendline.set_data(*data["trendline"])
+        self.trendline.set_color(data["color"])
+        self.set_bars(None if is_points else data)
+
+        self.set_axis_format(data["dates"])
+        self.ax.set_xlabel(data["xlabel"])
+        self.ax.set_ylabel(data["ylabel"])
+        self.ax.set_title(data["title"])
+        self.rescale(data)
+
+        # limits and labels may have changed, so the background needs a full redraw
+        self.fig.canvas.draw()
+        plt.show(block=False)
+        self.fig.canvas.flush_events()
+
+    def fits_axes(self, data: dict):
+        """checks whether all of a chart's points are inside the current axes limits"""
+        if not len(data["x"]):
+            return True
+        x_min, x_max = sorted(self.ax.get_xlim())
+        y_min, y_max = sorted(self.ax.get_ylim())
+        return (
+            x_min <= data["x"].min()
+            and data["x"].max() <= x_max
+            and y_min <= data["y"].min()
+            and data["y"].max() <= y_max
+        )
+
+    def replace_activities(self, activities: list):
+        """replaces the cached data with the re-queried activities, discards the data of
+        the charts affected by the activities that were added, updated or deleted and
+        updates the current chart if it is one of them. If the new points fit inside the
+        current axes, only the point and trendline artists are redrawn (blitted),
+        otherwise the chart is redrawn.
+
+        :param activities: a list of dictionaries of activity data (the output of
+        select_activity_data)
+        """
+        if activities:
+            new_df = create_dataframe(activities, compact=True)
+        else:  # all of them were deleted
+            new_df = self.df.iloc[:0]
+        # rows only in one of the dataframes (both versions of an updated activity)
+        changed = concat_compact_dataframes([self.df, new_df]).drop_duplicates(
+            keep=False
+        )
+        self.df = new_df
+        affected = charts_affected_by(changed)
+        for chart in affected:
+            self.chart_data.pop(chart, None)
+        if self.chart not in affected:
+            return
+        data = self.get_chart_data(self.chart)
+        if data["kind"] == "points" and self.fits_axes(data):
+            self.points.set_data(data["x"], data["y"])
+            if data["trendline"] is not None:
+                self.trendline.set_data(*data["trendline"])
+            self.blit()
+        else:
+            self.show(self.chart)
+
+    def watch(self, poll_interval: float = 2.0):
+        """keeps the current chart up to date with the user's activities until the figure
+        window is closed. The activities are queried again when Postgres notifies that
+        they have changed (or the user's data_version changes on other databases), so
+        updated and deleted activities are seen as well as new ones. They are read from
+        the primary database, as a read replica may not have the changes yet."""
+        listener = ActivityListener(engine, self.user_id, self.data_version)
+        try:
+            while plt.fignum_exists(self.fig.number):
+                if listener.has_changed():
+                    activities = select_activity_data(
+                        self.user_id,
+                        self.start_date,
+                        self.end_date,
+                        read_only=False,
+                    )
+                    self.replace_activities(activities)
+                # runs the window's event loop without the full redraw of plt.pause
+                self.fig.canvas.start_event_loop(poll_interval)
+        finally:
+            listener.close()
@@ -1,19 +1,83 @@
+import calendar
+from datetime import date
+
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-from visualisation.plots_utils import create_dataframe, select_activity_data
+from analytics.activity_calendar import (
+    DAYS_OF_WEEK,
+    calendar_grid,
+    calendar_position,
+    frequency_grid,
+)
+from analytics.splits import analyse_stream
+from analytics.training_load import calculate_training_load
+from analytics.trendlines import calculate_linear_coefficients, fit_trendline
+from visualisation.plots_utils import (
+    ALL_DATA_END_DATE,
+    ALL_DATA_START_DATE,
+    create_dataframe,
+    create_users_dataframe,
+    select_activity_data,
+    select_activity_frequency,
+    select_activity_stream,
+    select_calendar_days,
+    select_trendline_stats,
+)
+from visualisation.render import choose_render_mode, draw_points, show_or_save
+
+
+def get_trendline(
+    user_id: int,
+    df: pd.DataFrame,
+    metric: str,
+    start_date: str,
+    end_date: str,
+    fit: str = "linear",
+    window: int = 20,
+):
+    """returns the pace trendline for a metric as a numpy poly1d, or None if a trendline
+    can't be fitted. When plotting all data with a linear fit, the coefficients come
+    from the running statistics stored in the database, otherwise they are fitted to the
+    plotted data (fit can be "linear", "robust" or "windowed" - see fit_trendline)."""
+    coefficients = None
+    if (
+        fit == "linear"
+        and start_date <= ALL_DATA_START_DATE
+        and end_date >= ALL_DATA_END_DATE
+    ):
+        stats = select_trendline_stats(user_id).get(metric)
+        coefficients = calculate_linear_coefficients(stats) if stats else None
+    if coefficients is None:
+        data = df.dropna(subset=[metric]).sort_values("date")
+        coefficients = fit_trendline(data[metric], data["pace_numeric"], fit, window)
+    return np.poly1d(coefficients) if coefficients else None
 
 
 def plot_pace_vs_date(
-    user_id: int, start_date: str = "1981/01/01", end_date: str = "2081/01/01"
+    user_id: int,
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+    render_mode: str = "auto",
+    output_path: str | None = None,
 ):
-    """creates a scatter plot of pace vs date for activity data"""
+    """creates a scatter plot of pace vs date for activity data. render_mode can be
+    "auto", "markers", "lttb" or "density" (see draw_points), and the plot is saved to
+    output_path instead of shown if given."""
     activities = select_activity_data(user_id, start_date, end_date)
-    df = create_dataframe(activities)
+    df = create_dataframe(activities, compact=True)
+    df = df.dropna(subset=["date"]).sort_values("date")
 
     plt.figure(figsize=(12, 6))
-    plt.plot(df["date"], df["pace_numeric"], marker="o", color="purple", ls="")
+    draw_points(
+        df["date"],
+        df["pace_numeric"],
+        "purple",
+        render_mode,
+        time_series=True,
+        output_path=output_path,
+    )
     plt.xlabel("Date")
     plt.ylabel("Pace (min/km)")
     plt.title("Pace vs Date")
@@ -21,19 +85,34 @@ def plot_pace_vs_date(
     plt.grid(True)
     plt.xticks(rotation=90)
     plt.tight_layout()
-    plt.show()
+    show_or_save(output_path)
 
 
 def plot_pace_vs_elevation(
-    user_id: int, start_date: str = "1981/01/01", end_date: str = "2081/01/01"
+    user_id: int,
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+    fit: str = "linear",
+    render_mode: str = "auto",
+    output_path: str | None = None,
 ):
-    """creates a scatter plot of pace vs elevation for activity data"""
+    """creates a scatter plot of pace vs elevation for activity data, with a trendline
+    (fit can be "linear", "robust" or "windowed" - see get_trendline). render_mode can be
+    "auto", "markers", "lttb" or "density" (see draw_points), and the plot is saved to
+    output_path instead of shown if given."""
     activities = select_activity_data(user_id, start_date, end_date)
-    df = create_dataframe(activities)
+    df = create_dataframe(activities, compact=True)
 
     # plot the figure
     plt.figure(figsize=(12, 6))
-    plt.plot(df["elevation_m"], df["pace_numeric"], marker="o", color="green", ls="")
+    plotted = df.dropna(subset=["elevation_m"])
+    draw_points(
+        plotted["elevation_m"],
+        plotted["pace_numeric"],
+        "green",
+        render_mode,
+        output_path=output_path,
+    )
     plt.xlabel("Elevation (m)")
     plt.ylabel("Pace (min/km)")
     plt.title("Pace vs Elevation")
@@ -41,24 +120,35 @@ def plot_pace_vs_elevation(
     plt.grid(True)
     plt.tight_layout()
 
-    # add a trendline (assuming linear trend)
-    z = np.polyfit(df["elevation_m"], df["pace_numeric"], 1)
-    p = np.poly1d(z)
-    plt.plot(df["elevation_m"], p(df["elevation_m"]), color="green", ls="-")
+    # add a trendline (linear by default)
+    p = get_trendline(user_id, df, "elevation_m", start_date, end_date, fit)
+    if p:
+        x = np.array([df["elevation_m"].min(), df["elevation_m"].max()])
+        plt.plot(x, p(x), color="green", ls="-")
 
-    plt.show()
+    show_or_save(output_path)
 
 
 def plot_pace_vs_distance(
-    user_id: int, start_date: str = "1981/01/01", end_date: str = "2081/01/01"
+    user_id: int,
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+    fit: str = "linear",
+    render_mode: str = "auto",
+    output_path: str | None = None,
 ):
-    """creates a scatter plot of pace vs distance for activity data"""
+    """creates a scatter plot of pace vs distance for activity data, with a trendline
+    (fit can be "linear", "robust" or "windowed" - see get_trendline). render_mode can be
+    "auto", "markers", "lttb" or "density" (see draw_points), and the plot is saved to
+    output_path instead of shown if given."""
     activities = select_activity_data(user_id, start_date, end_date)
-    df = create_dataframe(activities)
+    df = create_dataframe(activities, compact=True)
 
     # plot the figure
     plt.figure(figsize=(12, 6))
-    plt.plot(df["distance_km"], df["pace_numeric"], marker="o", color="c", ls="")
+    draw_points(
+        df["distance_km"], df["pace_numeric"], "c", render_mode, output_path=output_path
+    )
     plt.xlabel("Distance (km)")
     plt.ylabel("Pace (min/km)")
     plt.title("Pace vs Distance")
@@ -66,25 +156,38 @@ def plot_pace_vs_distance(
     plt.grid(True)
     plt.tight_layout()
 
-    # add a trendline (assuming linear trend)
-    z = np.polyfit(df["distance_km"], df["pace_numeric"], 1)
-    p = np.poly1d(z)
-    plt.plot(df["distance_km"], p(df["distance_km"]), color="c", ls="-")
+    # add a trendline (linear by default)
+    p = get_trendline(user_id, df, "distance_km", start_date, end_date, fit)
+    if p:
+        x = np.array([df["distance_km"].min(), df["distance_km"].max()])
+        plt.plot(x, p(x), color="c", ls="-")
 
-    plt.show()
+    show_or_save(output_path)
 
 
 def plot_pace_vs_perceived_effort(
-    user_id: int, start_date: str = "1981/01/01", end_date: str = "2081/01/01"
+    user_id: int,
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+    fit: str = "linear",
+    render_mode: str = "auto",
+    output_path: str | None = None,
 ):
-    """creates a scatter plot of pace vs perceived effort for activity data"""
+    """creates a scatter plot of pace vs perceived effort for activity data, with a trendline
+    (fit can be "linear", "robust" or "windowed" - see get_trendline). render_mode can be
+    "auto", "markers", "lttb" or "density" (see draw_points), and the plot is saved to
+    output_path instead of shown if given."""
     activities = select_activity_data(user_id, start_date, end_date)
-    df = create_dataframe(activities)
+    df = create_dataframe(activities, compact=True)
 
     # plot the figure
     plt.figure(figsize=(12, 6))
-    plt.plot(
-        df["perceived_effort"], df["pace_numeric"], marker="o", color="orangered", ls=""
+    draw_points(
+        df["perceived_effort"],
+        df["pace_numeric"],
+        "orangered",
+        render_mode,
+        output_path=output_path,
     )
     plt.xlabel("Perceived Effort (1 (very easy) to 10 (very hard))")
     plt.ylabel("Pace (min/km)")
@@ -94,20 +197,25 @@ def plot_pace_vs_perceived_effort(
     plt.grid(True)
     plt.tight_layout()
 
-    # add a trendline (assuming linear trend)
-    z = np.polyfit(df["perceived_effort"], df["pace_numeric"], 1)
-    p = np.poly1d(z)
-    plt.plot(df["perceived_effort"], p(df["perceived_effort"]), color="orangered", ls="-")
+    # add a trendline (linear by default)
+    p = get_trendline(user_id, df, "perceived_effort", start_date, end_date, fit)
+    if p:
+        x = np.array([df["perceived_effort"].min(), df["perceived_effort"].max()])
+        plt.plot(x, p(x), color="orangered", ls="-")
 
-    plt.show()
+    show_or_save(output_path)
 
 
 def plot_distance_vs_time_weekly(
-    user_id: int, start_date: str = "1981/01/01", end_date: str = "2081/01/01"
+    user_id: int,
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+    output_path: str | None = None,
 ):
-    """creates a bar chart of total weekly distance effort for activity data"""
+    """creates a bar chart of total weekly distance effort for activity data. The plot
+    is saved to output_path instead of shown if given."""
     activities = select_activity_data(user_id, start_date, end_date)
-    df = create_dataframe(activities)
+    df = create_dataframe(activities, compact=True)
     filtered_df = df.filter(["distance_km", "date"])
     weekly_data = filtered_df.groupby(pd.Grouper(key="date", freq="W")).sum().fillna(0)
 
@@ -121,4 +229,264 @@ def plot_distance_vs_time_weekly(
     plt.tight_layout()
     plt.grid(axis="y")
 
-    plt.show()
+    show_or_save(output_path)
+
+
+def plot_training_load(
+    user_id: int,
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+    output_path: str | None = None,
+):
+    """creates line charts of daily training load for activity data: rolling 7 day and
+    28 day distance, the acute:chronic workload ratio, and fitness vs fatigue. The plot
+    is saved to output_path instead of shown if given."""
+    activities = select_activity_data(user_id, start_date, end_date)
+    df = create_dataframe(activities, compact=True)
+    load = calculate_training_load(df)
+
+    fig, (ax_distance, ax_acwr, ax_fitness) = plt.subplots(
+        3, 1, figsize=(12, 9), sharex=True
+    )
+    ax_distance.plot(load.index, load["acute_load_km"], color="purple", label="7 day")
+    ax_distance.plot(load.index, load["chronic_load_km"], color="c", label="28 day")
+    ax_distance.set_ylabel("Rolling Distance (km)")
+    ax_distance.set_title("Training Load")
+    ax_distance.legend()
+    ax_distance.grid(True)
+
+    ax_acwr.plot(load.index, load["acwr"], color="orangered")
+    # shade the commonly used "sweet spot" for the acute:chronic workload ratio
+    ax_acwr.axhspan(0.8, 1.3, color="green", alpha=0.1)
+    ax_acwr.set_ylabel("Acute:Chronic Ratio")
+    ax_acwr.grid(True)
+
+    ax_fitness.plot(load.index, load["fitness"], color="green", label="Fitness")
+    ax_fitness.plot(load.index, load["fatigue"], color="gold", label="Fatigue")
+    ax_fitness.set_xlabel("Date")
+    ax_fitness.set_ylabel("Load (km/day)")
+    ax_fitness.legend()
+    ax_fitness.grid(True)
+
+    plt.xticks(rotation=45)
+    fig.tight_layout()
+    show_or_save(output_path)
+
+
+def plot_activity_splits(activity_id: int, output_path: str | None = None):
+    """creates a bar chart of the pace of each km split of an activity, from its
+    stream (so only activities created from track files can be plotted). Each bar's
+    width is the split's distance, so a partial last split is narrower. The average
+    pace and the activity's best efforts are shown in the legend. The plot is saved to
+    output_path instead of shown if given."""
+    stream = select_activity_stream(activity_id, ["time", "lat", "lon", "elevation"])
+    analysis = analyse_stream(stream)
+    splits = analysis["splits"]
+    if not splits:
+        raise KeyError(activity_id)
+    distances = np.array([split["distance_km"] for split in splits])
+    paces = np.array(
+        [
+            np.nan if split["pace_s_per_km"] is None else split["pace_s_per_km"] / 60
+            for split in splits
+        ]
+    )
+    starts = np.concatenate(([0], np.cumsum(distances)[:-1]))
+    total_time = sum(split["moving_time_s"] for split in splits)
+    average_pace = total_time / 60 / distances.sum()
+
+    plt.figure(figsize=(12, 6))
+    plt.bar(starts, paces, width=distances, align="edge", color="c", edgecolor="white")
+    plt.axhline(
+        average_pace,
+        color="purple",
+        ls="--",
+        label=f"Average {average_pace:.2f} min/km",
+    )
+    for effort in analysis["best_efforts"]:
+        minutes, seconds = divmod(round(effort["moving_time_s"]), 60)
+        plt.plot([], [], ls="", label=f"{effort['effort']}: {minutes}:{seconds:02}")
+    plt.xlabel("Distance (km)")
+    plt.ylabel("Pace (min/km)")
+    plt.title(f"Splits for activity {activity_id}")
+    plt.legend()
+    plt.grid(axis="y")
+    plt.tight_layout()
+
+    show_or_save(output_path)
+
+
+# colour bar label for each metric of the calendar and frequency plots
+METRIC_LABELS = {"count": "Activities", "distance_km": "Distance (km)"}
+
+
+def plot_calendar_heatmap(
+    user_id: int,
+    year: int,
+    metric: str = "count",
+    output_path: str | None = None,
+):
+    """creates a calendar heatmap of a year of activity data, with a cell for each day
+    coloured by the number of activities (metric "count") or total distance
+    ("distance_km") on that day. The days are aggregated by the database, so the plot is
+    as quick for years of activities as for a few. The plot is saved to output_path
+    instead of shown if given.
+
+    :raises: raises a KeyError if there are no activities in the year
+    """
+    days = select_calendar_days(user_id, year)
+    if not days:
+        raise KeyError(year)
+    grid = calendar_grid(days, year, metric)
+
+    plt.figure(figsize=(14, 3.5))
+    # days outside the year (NaN) are left blank
+    mesh = plt.pcolormesh(
+        np.ma.masked_invalid(grid), cmap="Greens", edgecolors="white", linewidth=1
+    )
+    plt.colorbar(mesh, label=METRIC_LABELS[metric], pad=0.01)
+    month_columns = [
+        calendar_position(date(year, month, 1))[1] for month in range(1, 13)
+    ]
+    plt.xticks(
+        np.array(month_columns) + 0.5, [calendar.month_abbr[m] for m in range(1, 13)]
+    )
+    plt.yticks(np.arange(7) + 0.5, DAYS_OF_WEEK)
+    plt.gca().invert_yaxis()  # Monday at the top
+    plt.gca().set_aspect("equal")
+    plt.title(f"Activities in {year}")
+    plt.tight_layout()
+
+    show_or_save(output_path)
+
+
+def plot_activity_frequency(
+    user_id: int,
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+    metric: str = "count",
+    output_path: str | None = None,
+):
+    """creates a heatmap of when activities are started, with a cell for each hour of
+    each day of the week coloured by the number of activities (metric "count") or total
+    distance ("distance_km"). The cells are aggregated by the database. The plot is
+    saved to output_path instead of shown if given.
+
+    :raises: raises a KeyError if there is no activity data between the dates
+    """
+    cells = select_activity_frequency(user_id, start_date, end_date)
+    if not cells:
+        raise KeyError(user_id)
+    grid = frequency_grid(cells, metric)
+
+    plt.figure(figsize=(12, 4))
+    mesh = plt.pcolormesh(grid, cmap="Purples", edgecolors="white", linewidth=1)
+    plt.colorbar(mesh, label=METRIC_LABELS[metric], pad=0.01)
+    plt.xticks(np.arange(0, 24, 3) + 0.5, [f"{hour:02}:00" for hour in range(0, 24, 3)])
+    plt.yticks(np.arange(7) + 0.5, DAYS_OF_WEEK)
+    plt.gca().invert_yaxis()  # Monday at the top
+    plt.xlabel("Start time")
+    plt.title("Activity frequency")
+    plt.tight_layout()
+
+    show_or_save(output_path)
+
+
+# x axis label for each metric that pace can be compared against
+COMPARISON_METRICS = {
+    "date": "Date",
+    "distance_km": "Distance (km)",
+    "elevation_m": "Elevation (m)",
+    "perceived_effort": "Perceived Effort (1 (very easy) to 10 (very hard))",
+}
+
+
+def plot_pace_comparison(
+    user_ids: list,
+    metric: str = "date",
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+    render_mode: str = "auto",
+    output_path: str | None = None,
+):
+    """creates a scatter plot of pace vs a metric (one of COMPARISON_METRICS) for a
+    group of users, with each user's activities overlaid in their own colour. All of
+    the users' activities are queried at once and split by user with a group-by, so
+    the cost grows with the number of activities rather than users. render_mode can be
+    "auto", "markers" or "lttb" (see draw_points, density isn't used as the users'
+    points would be merged), and the plot is saved to output_path instead of shown if
+    given."""
+    df = create_users_dataframe(user_ids, start_date, end_date)
+    df = df.dropna(subset=[metric])
+    time_series = metric == "date"
+    colors = plt.get_cmap("tab10").colors
+
+    plt.figure(figsize=(12, 6))
+    for i, (user_id, user_df) in enumerate(df.groupby("user_id", observed=True)):
+        mode = choose_render_mode(len(user_df), render_mode, time_series)
+        line = draw_points(
+            user_df[metric],
+            user_df["pace_numeric"],
+            colors[i % len(colors)],
+            "markers" if mode == "density" else mode,
+            time_series=time_series,
+            output_path=output_path,
+        )
+        line.set_label(f"{user_df['user_name'].iloc[0]} ({user_id})")
+    plt.xlabel(COMPARISON_METRICS[metric])
+    plt.ylabel("Pace (min/km)")
+    plt.title(f"Pace vs {COMPARISON_METRICS[metric].split(' (')[0]} by user")
+    plt.gca().invert_yaxis()  # slower paces at the bottom
+    plt.legend()
+    plt.grid(True)
+    if time_series:
+        plt.xticks(rotation=90)
+    plt.tight_layout()
+    show_or_save(output_path)
+
+
+def plot_weekly_distance_comparison(
+    user_ids: list,
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+    output_path: str | None = None,
+):
+    """creates bar charts of total weekly distance for a group of users, one below the
+    other with shared axes. The weekly totals for every user come from one group-by of
+    all the users' activities. The plot is saved to output_path instead of shown if
+    given."""
+    df = create_users_dataframe(user_ids, start_date, end_date)
+    weekly_data = (
+        df.dropna(subset=["date"])
+        .groupby(["user_id", pd.Grouper(key="date", freq="W")], observed=True)[
+            "distance_km"
+        ]
+        .sum()
+        .unstack("user_id", fill_value=0)
+    )
+    user_names = df.groupby("user_id", observed=True)["user_name"].first()
+    colors = plt.get_cmap("tab10").colors
+
+    fig, axes = plt.subplots(
+        len(weekly_data.columns),
+        1,
+        figsize=(12, 2.5 * len(weekly_data.columns) + 1),
+        sharex=True,
+        sharey=True,
+        squeeze=False,
+    )
+    for i, (ax, user_id) in enumerate(zip(axes[:, 0], weekly_data.columns)):
+        ax.bar(
+            weekly_data.index,
+            weekly_data[user_id],
+            width=5,
+            color=colors[i % len(colors)],
+        )
+        ax.set_ylabel("Distance (km)")
+        ax.set_title(f"{user_names[user_id]} ({user_id})")
+        ax.grid(axis="y")
+    axes[-1, 0].set_xlabel("Date")
+    fig.suptitle("Weekly distance by user")
+    plt.xticks(rotation=45)
+    fig.tight_layout()
+    show_or_save(output_path)
@@ -1,16 +1,34 @@
-from sqlalchemy import create_engine, select
-import os
-from dotenv import load_dotenv
+import numpy as np
+from sqlalchemy import select
 from sqlmodel import Session
-from database.database import engine
-from database.models import Activity
+from analytics.activity_calendar import activity_frequency_query, calendar_days_query
+from database.database import engine, read_engine
+from database.models import Activity, TrendlineStats, User
+from database.sql import in_ids
+from database.streams import load_activity_stream
 import pandas as pd
+from pandas.api.types import union_categoricals
 
-load_dotenv()
-
-postgres_url = os.getenv("DB_URL")
-
-engine = create_engine(postgres_url)
+# default dates used to plot all activity data
+ALL_DATA_START_DATE = "1981/01/01"
+ALL_DATA_END_DATE = "2081/01/01"
+# dtypes of the columns of compact dataframes (see compact_dataframe)
+COMPACT_DTYPES = {
+    "user_id": "int32",
+    "user_name": "category",
+    "time": "category",
+    "activity": "category",
+    "activity_type": "category",
+    "moving_time_s": "int32",
+    "distance_km": "float32",
+    "perceived_effort": "int8",
+    "elevation_m": "float32",
+    "pace_s_per_km": "float32",
+    "speed_kmh": "float32",
+    "pace_numeric": "float32",
+}
+# number of rows read from the database and converted to a dataframe at a time
+DATAFRAME_CHUNK_ROWS = 100000
 
 
 def calculate_time_secs(moving_time: str):
@@ -24,8 +42,10 @@ def calculate_time_secs(moving_time: str):
 
 def calculate_pace_mins_per_km(distance: float, moving_time: str):
     """Calculates the pace of an activity in minutes per km, returning the pace as
-    a string in the format "MM:SS"
+    a string in the format "MM:SS", or None if the distance is 0 (no pace)
     """
+    if distance <= 0:
+        return None
     time_secs = calculate_time_secs(moving_time)
     pace_secs_per_km = time_secs / distance
     pace_mins = int(pace_secs_per_km // 60)
@@ -55,7 +75,10 @@ def format_query_output(data, col_names):
 
 
 def select_activity_data(
-    user_id: int, start_date: str = "1981/01/01", end_date: str = "2081/01/01"
+    user_id: int,
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+    read_only: bool = True,
 ):
     """queries the database and returns a list of dictionaries containing the query results.
 
@@ -64,10 +87,13 @@ def select_activity_data(
     This should be in a string of format "YYYY/MM/DD".
     :param end_date: latest data for which activity data should be obtained.
     This should be in a string of format "YYYY/MM/DD".
+    :param read_only: if True the query goes to the read replica (if DB_READ_URL is
+    set), otherwise to the primary database (e.g. to read activities that have just
+    been added, which the replica may not have yet).
     :returns: a list of dictionaries containing the activity data, with each dictionary representing
     a row of data, keys representing the column name and values representing the data.
     """
-    with Session(engine) as session:
+    with Session(read_engine if read_only else engine) as session:
         # explicitly unpacking all columns in the Activiy table (to give a list of tuples
         # instead of ORM objects)
         stmt = select(*Activity.__table__.c).where(
@@ -83,27 +109,235 @@ def select_activity_data(
     return formatted_activities
 
 
-def create_dataframe(data: list):
+def users_activity_query(
+    session: Session, user_ids: list, start_date: str, end_date: str
+):
+    """returns a query for the activity data of a group of users, each with the user's
+    name as user_name. The users are filtered with "user_id = ANY(:ids)" on Postgres."""
+    dialect_name = session.get_bind().dialect.name
+    return (
+        select(*Activity.__table__.c, User.name.label("user_name"))
+        .join(User, User.user_id == Activity.user_id)
+        .where(
+            Activity.date > start_date,
+            Activity.date < end_date,
+            in_ids(Activity.user_id, user_ids, dialect_name),
+        )
+    )
+
+
+def select_users_activity_data(
+    user_ids: list,
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+):
+    """queries the database for the activity data of a group of users (e.g. a club) in
+    one query, rather than a query per user.
+
+    :param user_ids: list of user id integers
+    :param start_date: earliest data for which activity data should be obtained.
+    This should be in a string of format "YYYY/MM/DD".
+    :param end_date: latest data for which activity data should be obtained.
+    This should be in a string of format "YYYY/MM/DD".
+    :returns: a list of dictionaries containing the activity data (as for
+    select_activity_data), each with the user's name as user_name.
+    """
+    with Session(read_engine) as session:
+        activities = session.exec(
+            users_activity_query(session, user_ids, start_date, end_date)
+        )
+        activities_data = activities.all()
+        activities_col_names = activities.keys()
+
+    return format_query_output(activities_data, activities_col_names)
+
+
+def select_trendline_stats(user_id: int):
+    """queries the database for a user's running trendline statistics.
+
+    :param user_id: user id integer
+    :returns: a dictionary of metric name (e.g. "distance_km") to a dictionary of the
+    statistics, with keys n, sum_x, sum_y, sum_xy and sum_xx.
+    """
+    with Session(read_engine) as session:
+        stmt = select(*TrendlineStats.__table__.c).where(
+            TrendlineStats.user_id == user_id
+        )
+        rows = session.exec(stmt).mappings().all()
+    return {row["metric"]: dict(row) for row in rows}
+
+
+def select_calendar_days(user_id: int, year: int, activity: str | None = None):
+    """queries the database for the number of activities and total distance on each day
+    of a year that a user has activities (see calendar_days_query).
+
+    :returns: a list of dictionaries with keys date, count and distance_km
+    """
+    with Session(read_engine) as session:
+        rows = session.execute(calendar_days_query(user_id, year, activity))
+        return [dict(row) for row in rows.mappings()]
+
+
+def select_activity_frequency(
+    user_id: int,
+    start_date: str = "1981/01/01",
+    end_date: str = "2081/01/01",
+    activity: str | None = None,
+):
+    """queries the database for the number of activities and total distance started in
+    each hour of each day of the week (see activity_frequency_query).
+
+    :returns: a list of dictionaries with keys day_of_week, hour, count and distance_km
+    """
+    with Session(read_engine) as session:
+        rows = session.execute(
+            activity_frequency_query(user_id, start_date, end_date, activity)
+        )
+        return [dict(row) for row in rows.mappings()]
+
+
+def select_activity_stream(activity_id: int, channels: list | None = None):
+    """queries the database for an activity's stream (its per point track data). Only
+    the requested channels are queried and decoded.
+
+    :param activity_id: activity id integer
+    :param channels: the channels to load (default all)
+    :returns: a dictionary with keys start_time, n_points and each channel (a numpy
+    array, or None if the track has no values for it)
+    :raises: raises a KeyError if the activity has no stream
+    """
+    with Session(read_engine) as session:
+        stream = load_activity_stream(session, activity_id, channels)
+    if stream is None:
+        raise KeyError(activity_id)
+    return stream
+
+
+def calculate_times_secs(moving_times: pd.Series):
+    """calculates the number of seconds in each of a column of moving times (in the
+    format "HH:MM:SS"), as calculate_time_secs does for one moving time"""
+    hours, minutes, seconds = (
+        part.astype(int) for _, part in moving_times.str.split(":", expand=True).items()
+    )
+    return seconds + minutes * 60 + hours * 60 * 60
+
+
+def calculate_paces_secs_per_km(distances: pd.Series, moving_times: pd.Series):
+    """calculates the paces of activities in seconds per km from their distances and
+    moving times (in the format "HH:MM:SS"), for activity data without the
+    pace_s_per_km column. The pace is NaN where the distance is 0."""
+    time_secs = calculate_times_secs(moving_times)
+    distances = distances.astype(float)
+    return time_secs / distances.where(distances > 0)
+
+
+def calculate_paces_numeric(paces_secs_per_km: pd.Series):
+    """converts paces in seconds per km into floats (min/km, with the seconds truncated
+    as in the "MM:SS" pace), as convert_pace_to_float does for one pace. Missing paces
+    are NaN."""
+    paces_secs_per_km = paces_secs_per_km.astype(float)
+    pace_mins = np.floor_divide(paces_secs_per_km, 60)
+    pace_secs = np.floor(np.mod(paces_secs_per_km, 60))
+    return (pace_mins + pace_secs / 60).round(2)
+
+
+def format_paces(paces_secs_per_km: pd.Series):
+    """converts paces in seconds per km into "MM:SS" strings and floats (min/km), as
+    calculate_pace_mins_per_km and convert_pace_to_float do for one pace. Missing paces
+    (NaN) are None and NaN.
+
+    :returns: a tuple of pandas series (pace strings, pace floats)
+    """
+    paces_secs_per_km = paces_secs_per_km.astype(float)
+    pace_mins = np.floor_divide(paces_secs_per_km, 60)
+    pace_secs = np.floor(np.mod(paces_secs_per_km, 60))
+    pace = (
+        pace_mins.astype("Int64").astype(str)
+        + ":"
+        + pace_secs.astype("Int64").astype(str).str.zfill(2)
+    )
+    pace_numeric = calculate_paces_numeric(paces_secs_per_km)
+    return pace.where(paces_secs_per_km.notna(), None), pace_numeric
+
+
+def compact_dataframe(df: pd.DataFrame):
+    """converts a dataframe of activity data to the memory compact dtypes of
+    COMPACT_DTYPES (e.g. categories for activity and activity_type, int32 seconds and
+    float32 metrics), leaving out the moving_time and pace strings (moving_time_s and
+    pace_numeric have their values). Converting a compact dataframe again changes
+    nothing, so it can be used after concatenating compact dataframes."""
+    if "moving_time_s" not in df and "moving_time" in df:
+        df = df.assign(moving_time_s=calculate_times_secs(df["moving_time"]))
+    df = df.drop(columns=["moving_time", "pace"], errors="ignore")
+    return df.astype({col: dtype for col, dtype in COMPACT_DTYPES.items() if col in df})
+
+
+def concat_compact_dataframes(frames: list):
+    """concatenates compact dataframes (see compact_dataframe). Each frame's categorical
+    columns have their own categories, so they are combined with union_categoricals,
+    rather than pd.concat converting them to strings (objects)."""
+    categorical = [
+        col for col, dtype in frames[0].dtypes.items() if dtype == "category"
+    ]
+    df = pd.concat(
+        [frame.drop(columns=categorical) for frame in frames], ignore_index=True
+    )
+    for col in categorical:
+        df[col] = union_categoricals([frame[col] for frame in frames])
+    return df[frames[0].columns]
+
+
+def create_dataframe(data: list, compact: bool = False):
     """creates a pandas dataframe from given activity data. It converts the date strings
     into datetime format, adds a pace column (string in format "MM:SS", min/km) and adds a
-    pace_numeric column (float, min/km).
+    pace_numeric column (float, min/km). The paces are formatted from the pace_s_per_km
+    column kept by the database (or calculated if the data doesn't have it), and are
+    None and NaN for activities with no distance.
 
     :param data: a list of dictionaries containing data, with each dictionary representing
     a row of data, keys representing the column name and values representing the data.
+    :param compact: if True, the dataframe has memory compact dtypes and no pace or
+    moving_time strings (see compact_dataframe), as used for plots and analytics.
     :returns: a pandas dataframe representing the data, with the addition of pace and
     pace_numeric columns. If a date is not parsed in the format "YYYY/MM/DD", NaT (Not a Time)
     is set as the date value.
     :raises: raises a KeyError if there is no data available to create the dataframe (e.g. data = [])
     """
-    try:
-        df = pd.DataFrame(data)
-        df["date"] = pd.to_datetime(df["date"], format="%Y/%m/%d", errors="coerce")
-        df["pace"] = df.apply(
-            lambda x: calculate_pace_mins_per_km(x["distance_km"], x["moving_time"]),
-            axis=1,
+    df = pd.DataFrame(data)
+    df["date"] = pd.to_datetime(df["date"], format="%Y/%m/%d", errors="coerce")
+    if "pace_s_per_km" in df:
+        paces_secs_per_km = df["pace_s_per_km"]
+    else:
+        paces_secs_per_km = calculate_paces_secs_per_km(
+            df["distance_km"], df["moving_time"]
+        )
+    if compact:
+        df["pace_numeric"] = calculate_paces_numeric(paces_secs_per_km)
+        return compact_dataframe(df)
+    df["pace"], df["pace_numeric"] = format_paces(paces_secs_per_km)
+    return df
+
+
+def create_users_dataframe(user_ids: list, start_date: str, end_date: str):
+    """queries the activity data of a group of users in one query and creates one
+    compact dataframe of it (see create_dataframe), with the users' series in the order
+    of user_ids. The query's rows are read and converted DATAFRAME_CHUNK_ROWS at a time,
+    so only the compact dataframe is ever held for all of the activities.
+
+    :raises: raises a KeyError if none of the users have activity data between the dates
+    """
+    with Session(read_engine) as session:
+        result = session.execute(
+            users_activity_query(session, user_ids, start_date, end_date),
+            execution_options={"yield_per": DATAFRAME_CHUNK_ROWS},
         )
-        df["pace_numeric"] = df["pace"].apply(convert_pace_to_float)
-        type(df)
-        return df
-    except KeyError as e:
-        raise
+        keys = list(result.keys())
+        frames = [
+            create_dataframe([dict(zip(keys, row)) for row in rows], compact=True)
+            for rows in result.partitions()
+        ]
+    if not frames:
+        raise KeyError("date")
+    df = concat_compact_dataframes(frames)
+    df["user_id"] = pd.Categorical(df["user_id"], categories=user_ids, ordered=True)
+    return df.sort_values(["user_id", "date"], kind="stable")
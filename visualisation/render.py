@@ -0,0 +1,118 @@
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+import numpy as np
+
+# above this many points, one marker per activity is too slow to draw
+MARKER_LIMIT = 5000
+# number of points kept when downsampling a time series
+LTTB_POINTS = 2000
+# above this many points, artists are rasterized when saving vector output
+RASTERIZE_LIMIT = 1000
+VECTOR_FORMATS = (".svg", ".pdf", ".eps", ".ps")
+RENDER_MODES = ["auto", "markers", "lttb", "density"]
+
+
+def lttb_downsample(x, y, threshold: int):
+    """downsamples a time series using Largest-Triangle-Three-Buckets, which keeps the
+    points that contribute most to the visual shape of the series.
+
+    :param x: numeric x values in increasing order
+    :param y: y values
+    :param threshold: number of points to keep
+    :returns: a numpy array of the indices of the points to keep, including the first
+    and last points
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # the first and last points are always kept, the rest are split into buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    starts = edges[:-1]
+    counts = np.diff(edges)
+    # average point of each bucket, the third corner of each bucket's triangles
+    avg_x = np.add.reduceat(x[1 : n - 1], starts - 1) / counts
+    avg_y = np.add.reduceat(y[1 : n - 1], starts - 1) / counts
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket, (start, end) in enumerate(zip(starts, edges[1:])):
+        # twice the area of the triangle (previous point, candidate, next average)
+        areas = np.abs(
+            (x[previous] - next_x[bucket]) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y[bucket] - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def choose_render_mode(n_points: int, render_mode: str = "auto", time_series=False):
+    """chooses how to draw a set of points. "auto" draws one marker per point up to
+    MARKER_LIMIT points, then downsamples time series ("lttb") and draws scatter plots
+    as a density of points ("density"). Any other mode is returned unchanged."""
+    if render_mode != "auto":
+        return render_mode
+    if n_points <= MARKER_LIMIT:
+        return "markers"
+    return "lttb" if time_series else "density"
+
+
+def is_vector_output(output_path: str | None):
+    """checks whether a plot is being saved in a vector format (e.g. svg)"""
+    return output_path is not None and str(output_path).lower().endswith(VECTOR_FORMATS)
+
+
+def draw_points(
+    x,
+    y,
+    color: str,
+    render_mode: str = "auto",
+    time_series: bool = False,
+    output_path: str | None = None,
+):
+    """draws points on the current axes using the chosen render mode:
+
+        markers: one marker per point
+        lttb: markers for an LTTB downsampled series (x should be in order)
+        density: a hexbin density of the points
+
+    Large sets of markers are rasterized when saving vector output, so the file size
+    doesn't grow with the number of points."""
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    mode = choose_render_mode(len(x), render_mode, time_series)
+    rasterized = is_vector_output(output_path) and len(x) > RASTERIZE_LIMIT
+
+    if mode == "density":
+        numeric_x = mdates.date2num(x) if time_series else x
+        hexbin = plt.hexbin(
+            numeric_x, y, gridsize=60, cmap="Greys", mincnt=1, rasterized=rasterized
+        )
+        if time_series:
+            plt.gca().xaxis_date()
+        plt.colorbar(hexbin, label="Activities")
+        return hexbin
+    if mode == "lttb":
+        numeric_x = x.astype("datetime64[ns]").astype(np.int64) if time_series else x
+        keep = lttb_downsample(numeric_x, y, LTTB_POINTS)
+        x = x[keep]
+        y = y[keep]
+    (line,) = plt.plot(x, y, marker="o", color=color, ls="", rasterized=rasterized)
+    return line
+
+
+def show_or_save(output_path: str | None = None):
+    """shows the current figure, or saves it to output_path (format from the file
+    extension, e.g. "plot.svg") and closes it"""
+    if output_path is None:
+        plt.show()
+    else:
+        plt.savefig(output_path)
+        plt.close()